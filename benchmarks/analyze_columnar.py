@@ -0,0 +1,94 @@
+"""
+analyze --columnar против обычного прохода на синтетическом SQLite-экспорте.
+
+    python benchmarks/analyze_columnar.py [--messages 1000000]
+
+Замеряет отдельно агрегаты участников, времени и вовлеченности (чтение
+сообщений + анализаторы против запросов по колонкам) и полный анализ от
+открытия файла до итогов, печатает время и ускорение и проверяет, что
+итоги совпадают.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from analyze_workers import make_messages, write_export  # noqa: E402
+from tg_export import columnar  # noqa: E402
+from tg_export.commands.analyze import ANALYZERS, AnalysisEngine  # noqa: E402
+from tg_export.dates import parse_date  # noqa: E402
+from tg_export.storage import open_export  # noqa: E402
+
+AGGREGATES = [cls for cls in ANALYZERS if cls.name in columnar.NAMES]
+
+
+def _dump(results):
+    return json.dumps(results, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def aggregates_single_pass(path):
+    analyzers = [cls() for cls in AGGREGATES]
+    for msg in open_export(path).iter_messages():
+        dt = parse_date(msg.get('date'))
+        for analyzer in analyzers:
+            analyzer.update(msg, dt)
+    return {analyzer.name: analyzer.finalize() for analyzer in analyzers}
+
+
+def aggregates_columnar(path):
+    states, _, _ = columnar.analyze(open_export(path))
+    return {cls.name: cls.from_state(states[cls.name]).finalize() for cls in AGGREGATES}
+
+
+def full_single_pass(path):
+    engine = AnalysisEngine()
+    engine.feed_store(open_export(path))
+    return engine.finalize()
+
+
+def full_columnar(path):
+    engine = AnalysisEngine()
+    engine.feed_columnar(open_export(path))
+    return engine.finalize()
+
+
+def _timed(func, path):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(path)
+    return time.perf_counter() - start, _dump(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000000)
+    args = parser.parse_args()
+
+    print(f"Генерация {args.messages} сообщений...")
+    messages = make_messages(args.messages)
+
+    directory = tempfile.mkdtemp(prefix="tg_export_columnar_bench_")
+    try:
+        path = write_export("sqlite", directory, messages)
+        del messages
+        print(f"{'замер':>10} {'проход, с':>10} {'колонки, с':>11} {'ускорение':>10}  результат")
+        for label, single, columns in (("агрегаты", aggregates_single_pass, aggregates_columnar),
+                                       ("анализ", full_single_pass, full_columnar)):
+            baseline, reference = _timed(single, path)
+            elapsed, result = _timed(columns, path)
+            same = "совпадает" if result == reference else "ОТЛИЧАЕТСЯ"
+            print(f"{label:>10} {baseline:>10.2f} {elapsed:>11.2f} {baseline / elapsed:>10.2f}  {same}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
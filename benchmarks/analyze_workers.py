@@ -0,0 +1,138 @@
+"""
+Масштабирование analyze --workers на синтетическом экспорте.
+
+    python benchmarks/analyze_workers.py [--messages 400000] [--workers 1,2,4,8]
+                                         [--formats jsonl,json,compact,sqlite]
+
+Пишет синтетический экспорт в каждом формате и для каждого числа
+процессов анализирует его целиком, от открытия файла до итогов (чтение и
+разбор входят в замер), печатает время и ускорение относительно одного
+процесса и проверяет, что результат совпадает с последовательным.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tg_export.commands.analyze import AnalysisEngine  # noqa: E402
+from tg_export.sqlite_storage import SqliteExport  # noqa: E402
+from tg_export.storage import JsonlExport, open_export  # noqa: E402
+from tg_export.writers import write_json_export  # noqa: E402
+
+FORMATS = ("jsonl", "json", "compact", "sqlite")
+HEADER = {
+    "entity_info": {"id": 1, "name": "Бенчмарк", "type": "group", "export_date": "2024-01-01T00:00:00"},
+    "total_messages": 0,
+}
+
+WORDS = ("привет мир hello world python telegram export data chat message "
+         "код тест анализ сообщение канал группа ответ вопрос").split()
+EMOJI = "😀🔥👍❤☀🚀"
+
+
+def make_messages(count, seed=1):
+    """Синтетические сообщения в формате serialize_message."""
+    rnd = random.Random(seed)
+    date = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    messages = []
+    for msg_id in range(1, count + 1):
+        date += timedelta(seconds=rnd.randint(1, 600))
+        sender_id = rnd.randint(1, 500)
+        text = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(0, 30)))
+        if rnd.random() < 0.1:
+            text += f" https://example.com/{msg_id} @user{rnd.randint(1, 50)} #tag{rnd.randint(1, 9)}"
+        if rnd.random() < 0.2:
+            text += " " + rnd.choice(EMOJI) * rnd.randint(1, 3)
+        reply_to = None
+        if msg_id > 1 and rnd.random() < 0.5:
+            reply_to = {"message_id": rnd.randint(max(1, msg_id - 200), msg_id - 1)}
+        messages.append({
+            "id": msg_id,
+            "date": date.isoformat(),
+            "text": text,
+            "message_type": rnd.choice(["text"] * 6 + ["MessageMediaPhoto", "MessageMediaDocument"]),
+            "sender": {"id": sender_id, "first_name": f"User{sender_id}", "last_name": "",
+                       "username": f"user{sender_id}"},
+            "reply_to": reply_to,
+            "reactions": [{"emoticon": rnd.choice("👍🔥❤"), "count": rnd.randint(1, 5)}
+                          for _ in range(rnd.randint(0, 2))],
+            "views": rnd.randint(0, 5000),
+            "forwards": rnd.randint(0, 20),
+        })
+    return messages
+
+
+def write_export(fmt, directory, messages):
+    """Записать экспорт в формате fmt; вернуть путь к нему."""
+    header = dict(HEADER, total_messages=len(messages))
+    if fmt == "jsonl":
+        path = os.path.join(directory, "export.jsonl")
+        JsonlExport.create(path, header, messages)
+    elif fmt == "sqlite":
+        path = os.path.join(directory, "export.sqlite")
+        SqliteExport.create(path, header, messages).close()
+    else:
+        path = os.path.join(directory, f"export_{fmt}.json")
+        write_json_export(path, header, messages, compact=(fmt == "compact"))
+    return path
+
+
+def run(path, workers):
+    """Полный анализ экспорта path: открытие, чтение, разбор, итоги."""
+    start = time.perf_counter()
+    engine = AnalysisEngine()
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine.feed_store(open_export(path), workers=workers)
+    results = engine.finalize()
+    elapsed = time.perf_counter() - start
+    return elapsed, json.dumps(results, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=400000)
+    parser.add_argument("--workers", default=None,
+                        help="Список чисел процессов через запятую (по умолчанию 1,2,4,... до числа ядер)")
+    parser.add_argument("--formats", default=",".join(FORMATS), help="Форматы экспорта через запятую")
+    args = parser.parse_args()
+
+    if args.workers:
+        counts = [int(w) for w in args.workers.split(",")]
+    else:
+        cpus = os.cpu_count() or 1
+        counts = [1]
+        while counts[-1] * 2 <= cpus:
+            counts.append(counts[-1] * 2)
+
+    print(f"Генерация {args.messages} сообщений...")
+    messages = make_messages(args.messages)
+
+    directory = tempfile.mkdtemp(prefix="tg_export_analyze_bench_")
+    try:
+        print(f"{'формат':>8} {'процессов':>10} {'время, с':>10} {'ускорение':>10} {'сообщ/с':>12}  результат")
+        for fmt in args.formats.split(","):
+            path = write_export(fmt, directory, messages)
+            baseline = reference = None
+            for workers in counts:
+                elapsed, result = run(path, workers)
+                if baseline is None:
+                    baseline, reference = elapsed, result
+                same = "совпадает" if result == reference else "ОТЛИЧАЕТСЯ"
+                print(f"{fmt:>8} {workers:>10} {elapsed:>10.2f} {baseline / elapsed:>10.2f} "
+                      f"{args.messages / elapsed:>12.0f}  {same}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Разбор и запись JSON-экспортов разными бэкендами jsonio.
+
+    python benchmarks/json_backends.py [--messages 100000] [--backends orjson,msgspec,json] [--repeat 3]
+
+Для каждого установленного бэкенда пишет синтетический экспорт
+(JSON с отступами, JSON --compact, JSONL) и читает его обратно
+потоковыми хранилищами, печатает лучшее из --repeat время, МБ/с
+и сообщений в секунду и проверяет, что прочитанные сообщения
+совпадают с записанными.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from analyze_workers import make_messages  # noqa: E402
+from tg_export import jsonio  # noqa: E402
+from tg_export.storage import JsonExport, JsonlExport  # noqa: E402
+from tg_export.writers import write_json_export  # noqa: E402
+
+HEADER = {
+    "entity_info": {"id": 1, "name": "Бенчмарк", "type": "group", "export_date": "2024-01-01T00:00:00"},
+    "total_messages": 0,
+}
+
+
+def _write(layout, path, messages):
+    header = dict(HEADER, total_messages=len(messages))
+    if layout == "jsonl":
+        JsonlExport.create(path, header, messages)
+    else:
+        write_json_export(path, header, messages, compact=(layout == "compact"))
+
+
+def _read(layout, path):
+    store = JsonlExport(path) if layout == "jsonl" else JsonExport(path)
+    return list(store.iter_messages())
+
+
+def _timed(repeat, func, *args):
+    """(лучшее время из repeat запусков, результат последнего)."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench(backend, messages, directory, repeat):
+    """Строки результата [(раскладка, операция, секунды, байт, совпадает)]."""
+    jsonio.use(backend)
+    rows = []
+    for layout in ("indent", "compact", "jsonl"):
+        path = os.path.join(directory, f"{backend}_{layout}.{'jsonl' if layout == 'jsonl' else 'json'}")
+        written, _ = _timed(repeat, _write, layout, path, messages)
+        size = os.path.getsize(path)
+        elapsed, parsed = _timed(repeat, _read, layout, path)
+        rows.append((layout, "запись", written, size, None))
+        rows.append((layout, "разбор", elapsed, size, parsed == messages))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--backends", default=",".join(jsonio.BACKENDS),
+                        help="Бэкенды через запятую (неустановленные пропускаются)")
+    parser.add_argument("--repeat", type=int, default=3, help="Запусков на замер, берется лучший")
+    args = parser.parse_args()
+
+    backends = []
+    for name in args.backends.split(","):
+        if jsonio.use(name) == name:
+            backends.append(name)
+        else:
+            print(f"{name}: не установлен, пропущен")
+
+    print(f"Генерация {args.messages} сообщений...")
+    messages = make_messages(args.messages)
+
+    directory = tempfile.mkdtemp(prefix="tg_export_json_bench_")
+    try:
+        print(f"{'бэкенд':>8} {'раскладка':>10} {'операция':>9} {'время, с':>9} {'МБ':>7} "
+              f"{'МБ/с':>8} {'сообщ/с':>10}  результат")
+        for backend in backends:
+            for layout, op, elapsed, size, same in bench(backend, messages, directory, args.repeat):
+                check = "" if same is None else ("совпадает" if same else "ОТЛИЧАЕТСЯ")
+                print(f"{backend:>8} {layout:>10} {op:>9} {elapsed:>9.2f} {size / 1e6:>7.1f} "
+                      f"{size / 1e6 / elapsed:>8.1f} {len(messages) / elapsed:>10.0f}  {check}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
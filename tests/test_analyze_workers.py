@@ -0,0 +1,84 @@
+"""analyze --workers: диапазоны экспорта в пуле процессов дают тот же итог, что один проход."""
+
+import os
+import tempfile
+import unittest
+
+from tg_export.commands.analyze import AnalysisEngine
+from tg_export.sqlite_storage import SqliteExport
+from tg_export.storage import JsonlExport, open_export
+from tg_export.writers import write_json_export
+
+HEADER = {"entity_info": {"id": 1, "name": "Тест", "type": "group"}, "total_messages": 0}
+
+
+def make_messages(count):
+    messages = []
+    for msg_id in range(1, count + 1):
+        sender = msg_id % 7
+        messages.append({
+            "id": msg_id,
+            "date": f"2024-01-{1 + msg_id % 28:02d}T{msg_id % 24:02d}:00:00+00:00",
+            "text": f"сообщение номер {msg_id} от user{sender} #tag{msg_id % 3}",
+            "message_type": "text",
+            "sender": {"id": sender, "first_name": f"User{sender}", "last_name": "", "username": None}
+            if sender else None,
+            "reply_to": {"message_id": msg_id - 1 - msg_id % 5} if msg_id > 6 and msg_id % 2 else None,
+            "reactions": [{"emoticon": "👍", "count": msg_id % 3 + 1}] if msg_id % 4 == 0 else [],
+            "views": msg_id % 11,
+            "forwards": msg_id % 2,
+        })
+    return messages
+
+
+class AnalyzeWorkersTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.messages = make_messages(300)
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def write(self, fmt, messages):
+        header = dict(HEADER, total_messages=len(messages))
+        if fmt == "jsonl":
+            path = os.path.join(self._dir.name, "export.jsonl")
+            JsonlExport.create(path, header, messages)
+        elif fmt == "sqlite":
+            path = os.path.join(self._dir.name, "export.sqlite")
+            SqliteExport.create(path, header, messages).close()
+        else:
+            path = os.path.join(self._dir.name, f"export_{fmt}.json")
+            write_json_export(path, header, messages, compact=(fmt == "compact"))
+        return path
+
+    def analyze(self, path, workers):
+        engine = AnalysisEngine()
+        count = engine.feed_store(open_export(path), workers=workers)
+        return count, engine.last_id, engine.finalize()
+
+    def test_split_covers_all_messages(self):
+        for fmt in ("jsonl", "json", "compact", "sqlite"):
+            with self.subTest(fmt=fmt):
+                store = open_export(self.write(fmt, self.messages))
+                ranges = store.split(7)
+                self.assertGreater(len(ranges), 1)
+                ids = [msg["id"] for bounds in ranges for msg in store.iter_range(bounds, min_id=50)]
+                self.assertEqual(ids, list(range(51, 301)))
+
+    def test_workers_match_single_pass(self):
+        for fmt in ("jsonl", "json", "compact", "sqlite"):
+            with self.subTest(fmt=fmt):
+                path = self.write(fmt, self.messages)
+                self.assertEqual(self.analyze(path, 3), self.analyze(path, 1))
+
+    def test_forward_reply_falls_back_for_topics(self):
+        # Ответ на более позднее сообщение: треды считаются одним проходом
+        self.messages[10]["reply_to"] = {"message_id": 250}
+        path = self.write("jsonl", self.messages)
+        self.assertEqual(self.analyze(path, 3), self.analyze(path, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+"""Скачивание по частям (tg_export.chunked) на частях из локальных байтов."""
+
+import asyncio
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from telethon.errors import FileReferenceExpiredError
+
+from tg_export.chunked import PartBitmap, download_chunked, download_document
+
+PART = 16
+DATA = bytes(range(256)) * 2 + b"tail"  # 516 байт: 33 части, последняя — 4 байта
+
+
+class FakeParts:
+    """fetch_part поверх DATA: запоминает запросы, может упасть на заданной части."""
+
+    def __init__(self, data=DATA, fail_at=None, short_at=None):
+        self.data = data
+        self.fail_at = fail_at
+        self.short_at = short_at
+        self.offsets = []
+
+    async def __call__(self, offset, limit):
+        await asyncio.sleep(0)
+        if offset == self.fail_at:
+            self.fail_at = None
+            raise ConnectionError("обрыв сети")
+        self.offsets.append(offset)
+        chunk = self.data[offset:offset + limit]
+        return chunk[:-1] if offset == self.short_at else chunk
+
+
+class FakeDownloadIter:
+    """Результат iter_download: асинхронный контекст и итератор частей."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(0)
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeMessage:
+    def __init__(self, reference):
+        self.id = 42
+        self.media = SimpleNamespace(document=SimpleNamespace(size=len(DATA), file_reference=reference))
+
+    async def get_input_chat(self):
+        return "chat"
+
+
+class FakeClient:
+    """
+    iter_download и get_messages поверх DATA. Пока загружено меньше
+    expire_after частей, принимается file_reference b"old", затем только
+    b"new" — его возвращает перезапрошенное сообщение.
+    """
+
+    def __init__(self, expire_after=None):
+        self.expire_after = expire_after
+        self.reference = b"old"
+        self.offsets = []
+        self.refetched = []
+
+    def iter_download(self, document, offset=0, request_size=None, limit=None):
+        if self.expire_after is not None and len(self.offsets) >= self.expire_after:
+            self.reference = b"new"
+        if document.file_reference != self.reference:
+            raise FileReferenceExpiredError(request=None)
+        self.offsets.append(offset)
+        chunks = [DATA[start:start + request_size] for start in range(offset, len(DATA), request_size)]
+        return FakeDownloadIter(chunks[:limit])
+
+    async def get_messages(self, entity, ids=None):
+        self.refetched.append((entity, ids))
+        return FakeMessage(self.reference)
+
+
+class DownloadChunkedTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.dest = os.path.join(self._dir.name, "file.bin")
+        self.part_path = os.path.join(self._dir.name, ".file.bin.part")
+        self.bitmap_path = os.path.join(self._dir.name, ".file.bin.parts")
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def download(self, fetch, size=len(DATA), workers=3):
+        return asyncio.run(download_chunked(fetch, size, self.dest, part_size=PART, workers=workers))
+
+    def read_dest(self):
+        with open(self.dest, 'rb') as f:
+            return f.read()
+
+    def test_resume_fetches_only_missing_parts(self):
+        first = FakeParts(fail_at=20 * PART)
+        with self.assertRaises(ConnectionError):
+            self.download(first)
+        self.assertFalse(os.path.exists(self.dest))
+        self.assertTrue(os.path.exists(self.part_path))
+        done = set(first.offsets)
+
+        second = FakeParts()
+        self.assertEqual(self.download(second), self.dest)
+        self.assertEqual(self.read_dest(), DATA)
+        self.assertTrue(done)
+        self.assertFalse(done & set(second.offsets))
+        self.assertEqual(done | set(second.offsets), set(range(0, len(DATA), PART)))
+        self.assertFalse(os.path.exists(self.part_path))
+        self.assertFalse(os.path.exists(self.bitmap_path))
+
+    def test_short_part_raises(self):
+        with self.assertRaises(IOError):
+            self.download(FakeParts(short_at=5 * PART))
+        self.assertFalse(os.path.exists(self.dest))
+
+        # Повтор докачивает файл
+        self.download(FakeParts())
+        self.assertEqual(self.read_dest(), DATA)
+
+    def test_bitmap_of_other_size_is_ignored(self):
+        with open(self.part_path, 'wb') as f:
+            f.write(b"\0" * len(DATA))
+        stale = PartBitmap(self.bitmap_path, len(DATA) + PART, PART)
+        for index in range(stale.count):
+            stale.mark(index)
+        stale.save()
+
+        fetch = FakeParts()
+        self.download(fetch)
+        self.assertEqual(self.read_dest(), DATA)
+        self.assertEqual(sorted(fetch.offsets), list(range(0, len(DATA), PART)))
+        self.assertFalse(os.path.exists(self.bitmap_path))
+
+
+    def test_download_document(self):
+        client = FakeClient()
+        path = asyncio.run(download_document(client, FakeMessage(b"old"), self.dest, part_size=PART))
+        self.assertEqual(path, self.dest)
+        self.assertEqual(self.read_dest(), DATA)
+        self.assertEqual(sorted(client.offsets), list(range(0, len(DATA), PART)))
+        self.assertEqual(client.refetched, [])
+
+    def test_expired_file_reference_is_refreshed(self):
+        client = FakeClient(expire_after=10)
+        asyncio.run(download_document(client, FakeMessage(b"old"), self.dest, part_size=PART))
+        self.assertEqual(self.read_dest(), DATA)
+        self.assertEqual(client.refetched, [("chat", 42)])
+        # Загрузка продолжилась с недостающих частей: ни одна не скачана дважды
+        self.assertEqual(sorted(client.offsets), list(range(0, len(DATA), PART)))
+        self.assertFalse(os.path.exists(self.part_path))
+        self.assertFalse(os.path.exists(self.bitmap_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""analyze --columnar: агрегаты SQLite совпадают с обычным проходом, включая состояние."""
+
+import os
+import tempfile
+import unittest
+
+from tg_export import columnar
+from tg_export.commands.analyze import AnalysisEngine
+from tg_export.sqlite_storage import SqliteExport
+from tg_export.storage import JsonlExport, open_export
+
+HEADER = {"entity_info": {"id": 1, "name": "Тест", "type": "group"}, "total_messages": 0}
+
+OFFSETS = ("+00:00", "+03:00", "-05:30", "+01:00")
+
+
+def make_messages(count, naive=False):
+    messages = []
+    for msg_id in range(1, count + 1):
+        sender = msg_id % 9
+        # Разные пояса, одинаковые моменты у разных id, сообщения без даты
+        date = f"2023-{1 + msg_id % 12:02d}-{1 + msg_id % 28:02d}T{msg_id % 24:02d}:{msg_id % 3:02d}:00" \
+               f"{'' if naive else OFFSETS[msg_id % 4]}"
+        messages.append({
+            "id": msg_id,
+            "date": date if msg_id % 17 else None,
+            "text": f"сообщение {msg_id} от user{sender} #tag{msg_id % 3}" if msg_id % 5 else "",
+            "message_type": ("text", "photo", None)[msg_id % 3],
+            "sender": {"id": sender * 1000, "first_name": f"User{sender}", "last_name": None, "username": "u"}
+            if sender else None,
+            "reply_to": {"message_id": msg_id * 7 % (msg_id + 40)} if msg_id % 2 else None,
+            "reactions": [{"emoticon": ("👍", "🔥", None)[(msg_id + i) % 3], "count": i + 1}
+                          for i in range(msg_id % 4)],
+            "views": msg_id % 11,
+            "forwards": msg_id % 3 or None,
+        })
+    return messages
+
+
+class ColumnarTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.messages = make_messages(400)
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def write(self, messages, name="export.sqlite"):
+        path = os.path.join(self._dir.name, name)
+        SqliteExport.create(path, dict(HEADER, total_messages=len(messages)), messages).close()
+        return open_export(path)
+
+    def test_matches_single_pass(self):
+        for naive in (False, True):
+            with self.subTest(naive=naive):
+                messages = make_messages(400, naive=naive)
+                # Один момент в разных поясах: первым и последним остается меньший id
+                ties = {10: "2020-01-01T03:00:00+03:00", 19: "2020-01-01T00:00:00+00:00",
+                        28: "2030-01-01T00:00:00+00:00", 37: "2029-12-31T19:00:00-05:00"}
+                for msg_id, date in ties.items():
+                    messages[msg_id - 1]["date"] = date[:19] if naive else date
+                store = self.write(messages, f"export_{naive}.sqlite")
+                self.assertTrue(columnar.supports(store))
+                expected, engine = AnalysisEngine(), AnalysisEngine()
+                expected.feed_store(store)
+                self.assertEqual(engine.feed_columnar(store), len(messages))
+                self.assertEqual(engine.last_id, expected.last_id)
+                self.assertEqual(engine.finalize(), expected.finalize())
+                self.assertEqual(engine.get_state(), expected.get_state())
+
+    def test_unsupported_exports(self):
+        self.messages[3]["date"] = "2023-01-01T00:00:00.5"
+        self.assertFalse(columnar.supports(self.write(self.messages)))
+
+        messages = make_messages(10)
+        messages[1]["reply_to"] = {"story_id": 5}
+        self.assertFalse(columnar.supports(self.write(messages, "replies.sqlite")))
+
+        path = os.path.join(self._dir.name, "export.jsonl")
+        JsonlExport.create(path, HEADER, make_messages(10))
+        self.assertFalse(columnar.supports(open_export(path)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Журнал незавершенного экспорта для продолжения после сбоя (--resume)."""
+
+import os
+import shutil
+from datetime import datetime
+
+from tg_export import jsonio
+
+PARTIAL_DIR = ".partial"
+JOURNAL_FILE = "journal.json"
+
+
+class ExportJournal:
+    """
+    Состояние прерванного экспорта в exports/<name>/.partial/.
+
+    Рядом с журналом лежат прогоны дискового спула (MessageSpool). Журнал
+    перезаписывается атомарно после каждого сброса спула, поэтому отражает
+    только те сообщения, которые уже надежно лежат на диске:
+      - last_id — id последнего зафиксированного сообщения (offset_id для
+        продолжения, история идет от новых к старым);
+      - runs, count — прогоны спула и число записей в них;
+      - media_failed — id сообщений, медиа которых скачать не удалось;
+      - media_pending — id зафиксированных сообщений, медиа которых еще
+        скачивалось в момент записи журнала;
+      - shards — для шардированной загрузки (--shards) диапазоны ID
+        [[первый, последний, последний зафиксированный или None], ...].
+
+    Уже скачанные файлы журнал не хранит: их записывает манифест папки
+    медиа (MediaManifest), по строке на файл, поэтому размер журнала и
+    стоимость его записи не растут с числом файлов.
+    """
+
+    def __init__(self, entity_dir, params=None):
+        self.directory = os.path.join(entity_dir, PARTIAL_DIR)
+        self.path = os.path.join(self.directory, JOURNAL_FILE)
+        self.params = params or {}
+        self.last_id = None
+        self.runs = []
+        self.count = 0
+        self.media_failed = set()
+        self.media_pending = set()
+        self.shards = None
+
+    @classmethod
+    def load(cls, entity_dir):
+        """Прочитать журнал; None, если незавершенного экспорта нет."""
+        journal = cls(entity_dir)
+        if not os.path.exists(journal.path):
+            return None
+        with open(journal.path, 'r', encoding='utf-8') as f:
+            state = jsonio.load(f)
+        journal.params = state.get('params', {})
+        journal.last_id = state.get('last_id')
+        journal.runs = [os.path.join(journal.directory, name) for name in state.get('runs', [])]
+        journal.count = state.get('count', 0)
+        journal.media_failed = set(state.get('media_failed', []))
+        journal.media_pending = set(state.get('media_pending', []))
+        journal.shards = state.get('shards')
+        return journal
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def commit(self, spool, last_id, failed=None, pending=None, shards=None):
+        """Зафиксировать состояние после сброса спула на диск."""
+        self.last_id = last_id
+        if shards is not None:
+            self.shards = [list(shard) for shard in shards]
+        self.runs = list(spool.runs)
+        self.count = spool.count
+        if failed is not None:
+            self.media_failed = set(failed)
+        if pending is not None:
+            self.media_pending = set(pending)
+        self.save()
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        state = {
+            'params': self.params,
+            'last_id': self.last_id,
+            'runs': [os.path.basename(path) for path in self.runs],
+            'count': self.count,
+            'media_failed': sorted(self.media_failed),
+            'media_pending': sorted(self.media_pending),
+            'shards': self.shards,
+            'updated': datetime.now().isoformat(),
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            jsonio.dump(state, f, indent=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def discard(self):
+        """Удалить журнал и прогоны спула (после успешного экспорта)."""
+        shutil.rmtree(self.directory, ignore_errors=True)
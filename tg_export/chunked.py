@@ -0,0 +1,216 @@
+"""Параллельное скачивание больших документов по частям с докачкой."""
+
+import os
+import asyncio
+
+from telethon.errors import FileReferenceExpiredError
+
+from tg_export import jsonio
+
+# Размер части: максимум для upload.getFile; кратен 4 КБ, и 1 МБ делится на него,
+# поэтому части с выровненным смещением не пересекают границу мегабайта
+PART_SIZE = 512 * 1024
+# Документы от этого размера скачиваются по частям
+CHUNKED_THRESHOLD = 20 * 1024 * 1024
+# Одновременных запросов частей на один файл
+PART_WORKERS = 4
+# Как часто (в частях) фиксировать данные и битовую карту на диске
+CHECKPOINT_PARTS = 16
+# Сколько раз перезапрашивать сообщение с истекшим file_reference
+REFERENCE_REFRESHES = 3
+
+
+def _write_at(fd, data, offset):
+    """Записать data по смещению offset (os.pwrite, где он есть)."""
+    if hasattr(os, "pwrite"):
+        while data:
+            written = os.pwrite(fd, data, offset)
+            data = data[written:]
+            offset += written
+    else:
+        # Без await между seek и write: в пределах цикла событий запись атомарна
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
+
+
+def _preallocate(fd, size):
+    """Выделить место под файл целиком (posix_fallocate или truncate)."""
+    if os.fstat(fd).st_size == size:
+        return
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass
+    os.ftruncate(fd, size)
+
+
+class PartBitmap:
+    """
+    Какие части файла уже записаны.
+
+    Хранится в JSON-файле рядом с недокачанным файлом: размер файла,
+    размер части и битовая карта в hex. Карта от файла другого размера
+    или с другим размером части игнорируется.
+    """
+
+    def __init__(self, path, size, part_size):
+        self.path = path
+        self.size = size
+        self.part_size = part_size
+        self.count = (size + part_size - 1) // part_size
+        self.bits = bytearray((self.count + 7) // 8)
+
+    @classmethod
+    def load(cls, path, size, part_size):
+        bitmap = cls(path, size, part_size)
+        if not os.path.exists(path):
+            return bitmap
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = jsonio.load(f)
+            bits = bytearray.fromhex(state["bitmap"])
+        except (ValueError, KeyError):
+            return bitmap
+        if state.get("size") == size and state.get("part_size") == part_size and len(bits) == len(bitmap.bits):
+            bitmap.bits = bits
+        return bitmap
+
+    def __contains__(self, index):
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def mark(self, index):
+        self.bits[index >> 3] |= 1 << (index & 7)
+
+    def missing(self):
+        """Номера незаписанных частей по порядку."""
+        return [index for index in range(self.count) if index not in self]
+
+    def done(self):
+        """Сколько частей записано."""
+        return self.count - len(self.missing())
+
+    def complete(self):
+        return not self.missing()
+
+    def save(self):
+        """Атомарно сохранить карту."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            jsonio.dump({"size": self.size, "part_size": self.part_size, "bitmap": self.bits.hex()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def download_chunked(fetch_part, size, dest, part_size=PART_SIZE, workers=PART_WORKERS):
+    """
+    Скачать файл размера size в dest по частям.
+
+    fetch_part(offset, limit) — корутина, возвращающая байты части со
+    смещения offset (limit = part_size; последняя часть короче). Части
+    запрашиваются параллельно (workers) и пишутся по своим смещениям в
+    заранее выделенный скрытый файл .<имя>.part; записанные части отмечаются
+    в битовой карте .<имя>.parts. Прерванная загрузка (сбой, FLOOD_WAIT)
+    при повторном вызове продолжается с недостающих частей. После проверки
+    размера файл переименовывается в dest.
+
+    Raises:
+        IOError: часть или итоговый файл не того размера.
+    """
+    directory, name = os.path.split(dest)
+    tmp_path = os.path.join(directory, f".{name}.part")
+    bitmap_path = os.path.join(directory, f".{name}.parts")
+
+    if os.path.exists(tmp_path):
+        bitmap = PartBitmap.load(bitmap_path, size, part_size)
+    else:
+        bitmap = PartBitmap(bitmap_path, size, part_size)
+
+    fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+    try:
+        _preallocate(fd, size)
+        todo = iter(bitmap.missing())
+        written = 0
+
+        async def worker():
+            nonlocal written
+            # Общий итератор: каждый воркер берет следующую недостающую часть
+            for index in todo:
+                offset = index * part_size
+                expected = min(part_size, size - offset)
+                data = await fetch_part(offset, part_size)
+                if len(data) != expected:
+                    raise IOError(f"часть {index}: получено {len(data)} байт вместо {expected}")
+                _write_at(fd, data, offset)
+                bitmap.mark(index)
+                written += 1
+                if written % CHECKPOINT_PARTS == 0:
+                    # Сначала данные, потом карта: карта не опережает диск
+                    os.fsync(fd)
+                    bitmap.save()
+
+        tasks = [asyncio.create_task(worker()) for _ in range(max(1, min(workers, bitmap.count)))]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            os.fsync(fd)
+            bitmap.save()
+    finally:
+        os.close(fd)
+
+    actual = os.path.getsize(tmp_path)
+    if actual != size or not bitmap.complete():
+        raise IOError(f"размер {actual} байт вместо {size}, частей {bitmap.done()} из {bitmap.count}")
+    os.replace(tmp_path, dest)
+    bitmap.remove()
+    return dest
+
+
+def document_part_fetcher(client, document):
+    """
+    fetch_part для документа Telegram: каждая часть — отдельный
+    upload.getFile через client.iter_download. Соединение с DC, где лежит
+    файл, Telethon выбирает сам, а file_reference берется из document как
+    есть: истекшая ссылка дает FileReferenceExpiredError (см. download_document).
+    """
+    async def fetch_part(offset, limit):
+        async with client.iter_download(document, offset=offset, request_size=limit, limit=1) as stream:
+            async for chunk in stream:
+                return chunk
+        return b""
+
+    return fetch_part
+
+
+async def download_document(client, message, dest, part_size=PART_SIZE, workers=PART_WORKERS):
+    """
+    Скачать документ из сообщения message в dest по частям (см. download_chunked).
+
+    file_reference живет ограниченное время, и на долгой загрузке он
+    истекает. Тогда сообщение перезапрашивается (get_messages по id),
+    fetch_part строится заново из свежего документа, и загрузка
+    продолжается с недостающих частей по битовой карте.
+    """
+    document = message.media.document
+    for attempt in range(REFERENCE_REFRESHES + 1):
+        try:
+            return await download_chunked(document_part_fetcher(client, document), document.size, dest,
+                                          part_size=part_size, workers=workers)
+        except FileReferenceExpiredError:
+            if attempt == REFERENCE_REFRESHES:
+                raise
+            fresh = await client.get_messages(await message.get_input_chat(), ids=message.id)
+            if fresh is None or getattr(fresh.media, "document", None) is None:
+                raise
+            document = fresh.media.document
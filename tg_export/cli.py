@@ -2,10 +2,48 @@
 
 import argparse
 import sys
+from datetime import datetime
 
 from tg_export import __version__
 
 
+def _size(value):
+    from tg_export.utils import parse_size
+    return parse_size(value)
+
+
+def _day(value):
+    datetime.strptime(value, "%Y-%m-%d")
+    return value
+
+
+def _add_window_args(parser):
+    """Окно истории: даты и диапазон ID (фильтруются на сервере)."""
+    parser.add_argument("--since", type=_day, metavar="YYYY-MM-DD",
+                        help="Сообщения с этой даты (UTC)")
+    parser.add_argument("--until", type=_day, metavar="YYYY-MM-DD",
+                        help="Сообщения до этой даты, не включая ее (UTC)")
+    parser.add_argument("--min-id", type=int, metavar="ID", help="Сообщения с ID не меньше этого")
+    parser.add_argument("--max-id", type=int, metavar="ID", help="Сообщения с ID не больше этого")
+
+
+def _add_media_filter_args(parser):
+    """Аргументы фильтра медиа (MediaFilter.from_args)."""
+    parser.add_argument("--media-kind", nargs="+", metavar="KIND",
+                        choices=["photo", "video", "voice", "audio", "sticker", "document"],
+                        help="Скачивать только эти виды: photo video voice audio sticker document")
+    parser.add_argument("--media-mime", nargs="+", metavar="MIME",
+                        help="Скачивать только эти MIME-типы, допускаются шаблоны: image/* video/mp4")
+    parser.add_argument("--max-media-size", type=_size, metavar="SIZE",
+                        help="Не скачивать файлы больше SIZE (500K, 50M, 2G)")
+    parser.add_argument("--media-since", type=_day, metavar="YYYY-MM-DD",
+                        help="Скачивать медиа только из сообщений с этой даты (UTC)")
+    parser.add_argument("--media-until", type=_day, metavar="YYYY-MM-DD",
+                        help="Скачивать медиа только из сообщений до этой даты, не включая ее (UTC)")
+    parser.add_argument("--thumbnails", action="store_true",
+                        help="Вместо файлов скачивать самые маленькие миниатюры")
+
+
 def main():
     parser = argparse.ArgumentParser(
         prog="tg-export",
@@ -17,6 +55,7 @@ def main():
   tg-export export https://t.me/durov              Экспорт канала
   tg-export export @username --format md --days 7  Экспорт за 7 дней в Markdown
   tg-export export https://t.me/c/123456 --media   Экспорт с медиа
+  tg-export export-batch sources.txt               Экспорт списка источников
   tg-export update exports/Chat/export.json        Обновить экспорт
   tg-export analyze exports/Chat/export.json       Анализ экспорта
   tg-export channel-stats @channel                 Аналитика канала
@@ -47,26 +86,96 @@ def main():
 """,
     )
     sp_export.add_argument("source", help="Источник: URL, @username, телефон или ID")
-    sp_export.add_argument("--format", "-f", choices=["json", "txt", "md"], default="json",
+    sp_export.add_argument("--format", "-f", choices=["json", "jsonl", "sqlite", "txt", "md"], default="json",
                            help="Формат вывода (по умолчанию: json)")
     sp_export.add_argument("--output", "-o", help="Свой путь для файла экспорта")
     sp_export.add_argument("--topic", "-t", type=int, help="ID топика форума")
     sp_export.add_argument("--media", "-m", action="store_true", help="Скачать медиа-файлы")
     sp_export.add_argument("--days", "-d", type=int, help="Экспорт только за последние N дней")
+    _add_window_args(sp_export)
+    sp_export.add_argument("--shards", type=int, default=1, metavar="K",
+                           help="Загружать историю K параллельными курсорами по диапазонам ID")
+    sp_export.add_argument("--rate", type=float,
+                           help="Запросов истории в секунду на все шарды (по умолчанию: 5)")
+    sp_export.add_argument("--media-workers", type=int, default=4,
+                           help="Число параллельных загрузок медиа (по умолчанию: 4)")
+    sp_export.add_argument("--media-rate", type=float,
+                           help="Ограничение скорости скачивания медиа, МБ/с")
+    sp_export.add_argument("--resume", action="store_true",
+                           help="Продолжить прерванный экспорт с места остановки")
+    sp_export.add_argument("--inline-senders", action="store_true",
+                           help="JSON: профиль отправителя в каждом сообщении (формат версии 1)")
+    sp_export.add_argument("--compact", action="store_true",
+                           help="JSON: без отступов, по сообщению на строку (файл меньше)")
+    sp_export.add_argument("--media-store", metavar="DIR",
+                           help="Общее хранилище медиа (по умолчанию MEDIA_STORE из .env)")
+    _add_media_filter_args(sp_export)
+
+    # --- export-batch ---
+    sp_batch = subparsers.add_parser("export-batch", help="Параллельный экспорт списка источников")
+    sp_batch.add_argument("sources_file", help="Файл с источниками: по одному на строку, # — комментарий")
+    sp_batch.add_argument("--format", "-f", choices=["json", "jsonl", "sqlite", "txt", "md"], default="json",
+                          help="Формат вывода (по умолчанию: json)")
+    sp_batch.add_argument("--media", "-m", action="store_true", help="Скачать медиа-файлы")
+    sp_batch.add_argument("--days", "-d", type=int, help="Экспорт только за последние N дней")
+    _add_window_args(sp_batch)
+    sp_batch.add_argument("--concurrency", "-c", type=int, default=4,
+                          help="Сколько источников экспортировать одновременно (по умолчанию: 4)")
+    sp_batch.add_argument("--rate", type=float, default=3.0,
+                          help="Общий лимит запросов истории в секунду (по умолчанию: 3)")
+    sp_batch.add_argument("--media-workers", type=int, default=4,
+                          help="Число параллельных загрузок медиа на источник (по умолчанию: 4)")
+    sp_batch.add_argument("--media-rate", type=float,
+                          help="Общее ограничение скорости скачивания медиа, МБ/с")
+    sp_batch.add_argument("--resume", action="store_true",
+                          help="Продолжить прерванные экспорты с места остановки")
+    sp_batch.add_argument("--inline-senders", action="store_true",
+                          help="JSON: профиль отправителя в каждом сообщении (формат версии 1)")
+    sp_batch.add_argument("--compact", action="store_true",
+                          help="JSON: без отступов, по сообщению на строку (файл меньше)")
+    sp_batch.add_argument("--media-store", metavar="DIR",
+                          help="Общее хранилище медиа (по умолчанию MEDIA_STORE из .env)")
+    _add_media_filter_args(sp_batch)
 
     # --- update ---
     sp_update = subparsers.add_parser("update", help="Добавить новые сообщения в существующий экспорт")
-    sp_update.add_argument("json_path", help="Путь к JSON-файлу экспорта")
+    sp_update.add_argument("json_path", help="Путь к файлу экспорта (.json, .jsonl или .sqlite)")
     sp_update.add_argument("--no-media", action="store_true", help="Не скачивать медиа")
+    sp_update.add_argument("--media-workers", type=int, default=4,
+                           help="Число параллельных загрузок медиа (по умолчанию: 4)")
+    sp_update.add_argument("--media-rate", type=float,
+                           help="Ограничение скорости скачивания медиа, МБ/с")
+    sp_update.add_argument("--media-store", metavar="DIR",
+                           help="Общее хранилище медиа (по умолчанию MEDIA_STORE из .env)")
+    _add_media_filter_args(sp_update)
 
     # --- download-media ---
     sp_dl = subparsers.add_parser("download-media", help="Докачать недостающие медиа-файлы")
-    sp_dl.add_argument("json_path", help="Путь к JSON-файлу экспорта")
+    sp_dl.add_argument("json_path", help="Путь к файлу экспорта (.json, .jsonl или .sqlite)")
+    sp_dl.add_argument("--media-workers", type=int, default=4,
+                       help="Число параллельных загрузок (по умолчанию: 4)")
+    sp_dl.add_argument("--media-rate", type=float,
+                       help="Ограничение скорости скачивания, МБ/с")
+    sp_dl.add_argument("--verify", action="store_true",
+                       help="Сверить манифест медиа с содержимым папки (найти удаленные файлы)")
+    sp_dl.add_argument("--media-store", metavar="DIR",
+                       help="Общее хранилище медиа (по умолчанию MEDIA_STORE из .env)")
+    _add_media_filter_args(sp_dl)
 
     # --- analyze ---
     sp_analyze = subparsers.add_parser("analyze", help="Офлайн-анализ экспорта: отчет .md + .json")
-    sp_analyze.add_argument("json_path", help="Путь к JSON-файлу экспорта")
+    sp_analyze.add_argument("json_path", help="Путь к файлу экспорта (.json, .jsonl или .sqlite)")
     sp_analyze.add_argument("--output", "-o", help="Свой путь для отчета .md")
+    sp_analyze.add_argument("--full", action="store_true",
+                            help="Пересчитать с нуля, не используя сохраненное состояние")
+    sp_analyze.add_argument("--compact", action="store_true",
+                            help="Записать *_analysis.json без отступов")
+    sp_analyze.add_argument("--workers", type=int, default=1, metavar="N",
+                            help="Процессов для анализа: каждый читает и анализирует свой диапазон экспорта, "
+                                 "по умолчанию 1")
+    sp_analyze.add_argument("--columnar", action="store_true",
+                            help="SQLite: считать участников, время и вовлеченность запросами по колонкам, "
+                                 "всегда с нуля")
 
     # --- channel-check ---
     sp_chcheck = subparsers.add_parser("channel-check", help="Проверить владение каналом")
@@ -99,6 +208,10 @@ def main():
         from tg_export.commands.export import run
         run(args)
 
+    elif args.command == "export-batch":
+        from tg_export.commands.export_batch import run
+        run(args)
+
     elif args.command == "update":
         from tg_export.commands.update import run
         run(args)
@@ -0,0 +1,274 @@
+"""
+Колоночный анализ SQLite-экспорта (analyze --columnar).
+
+Сообщения читаются одним запросом без разбора в словари; пачки строк
+транспонируются в колонки, и агрегаты участников, времени и
+вовлеченности считаются по колонкам: Counter над колонкой или парами
+колонок (отправитель, ключ). Дата не разбирается построчно — счетчики
+ведутся по подстрокам дня и часа, в числа переводятся только различные
+значения, а день недели и месяц выводятся из дня. Реакции агрегируются
+запросами к своей таблице. Результат — состояния ParticipantAnalyzer,
+TemporalAnalyzer и EngagementAnalyzer в формате get_state, совпадающие с
+однопроходными, включая порядок ключей (первое появление в порядке id).
+
+Точность гарантируется для дат вида YYYY-MM-DDTHH:MM:SS с необязательным
+смещением ±HH:MM (так пишет export) и для reply_to с message_id;
+supports() проверяет это заранее.
+"""
+
+from collections import Counter
+from datetime import date
+
+from tg_export.dates import parse_date, epoch, month_key
+
+# Анализаторы, которые колоночный режим считает по колонкам
+NAMES = ('participants', 'temporal', 'engagement')
+
+# Строк в пачке при чтении
+BATCH = 10000
+
+# Дата, которую SQLite и datetime.fromisoformat понимают одинаково
+_VALID_DATE = (
+    "(substr(date, 11, 1) = 'T'"
+    " AND date(substr(date, 1, 10)) IS substr(date, 1, 10)"
+    " AND time(substr(date, 12, 8)) IS substr(date, 12, 8)"
+    " AND (length(date) = 19 OR (length(date) = 25"
+    " AND substr(date, 20) GLOB '[+-][0-9][0-9]:[0-9][0-9]')))"
+)
+
+_CHECK = f"""
+SELECT COALESCE(SUM(date != '' AND NOT {_VALID_DATE}), 0),
+       COALESCE(SUM(reply_to IS NOT NULL AND reply_to_message_id IS NULL), 0)
+FROM messages
+"""
+
+# День, час и смещение — подстроки даты (NULL, если даты нет)
+_SELECT = """
+SELECT id, sender_id, message_type, length(text), views, forwards, reply_to_message_id, date,
+       NULLIF(substr(date, 1, 10), ''), NULLIF(substr(date, 12, 2), ''), substr(date, 20){text}
+FROM messages
+ORDER BY id
+"""
+
+
+def supports(store):
+    """Можно ли считать экспорт колоночно с тем же результатом."""
+    if store.format != "sqlite":
+        return False
+    bad_dates, bad_replies = store.conn.execute(_CHECK).fetchone()
+    return not bad_dates and not bad_replies
+
+
+def _count(counter, column):
+    """Counter.update по колонке без None (нет даты, нет ответа)."""
+    counter.update(column)
+    counter.pop(None, None)
+
+
+def _by_sender(pairs, convert=None):
+    """
+    Counter пар (отправитель, ключ) -> {отправитель: [[ключ, количество]]} в
+    порядке первого появления; convert переводит ключ (подстроку даты) и
+    пропускает пары без даты, одинаковые после перевода ключи складываются.
+    """
+    groups = {}
+    for (sender_id, key), count in pairs.items():
+        if sender_id is None:
+            continue
+        if convert is not None:
+            if key is None:
+                continue
+            key = convert(key)
+        counter = groups.get(sender_id)
+        if counter is None:
+            counter = groups[sender_id] = Counter()
+        counter[key] += count
+    return {sender_id: [list(item) for item in counter.items()] for sender_id, counter in groups.items()}
+
+
+def _pick(candidates, last=False):
+    """
+    [секунды, ISO] первого или последнего сообщения из кандидатов (строка
+    даты, id) разных смещений; при равенстве моментов — меньший id.
+    """
+    stamps = []
+    for value, msg_id in candidates:
+        dt = parse_date(value)
+        ts = epoch(dt)
+        stamps.append(((-ts if last else ts), msg_id, ts, dt))
+    _, _, ts, dt = min(stamps)
+    return [ts, dt.isoformat()]
+
+
+class _Columns:
+    """Агрегаты NAMES, накапливаемые по пачкам колонок."""
+
+    def __init__(self):
+        self.count = 0
+        self.days = Counter()
+        self.hours = Counter()
+        # Пары (отправитель, ключ) для счетчиков участников
+        self.sender_types = Counter()
+        self.sender_hours = Counter()
+        self.sender_days = Counter()
+        self.sender_counts = Counter()
+        self.text_lengths = Counter()
+        # (отправитель, смещение) -> [первая дата, id, последняя дата, id]
+        self.stamps = {}
+        self.message_senders = {}
+        self.reply_counts = Counter()
+        self.total_views = 0
+        self.messages_with_views = 0
+        self.total_forwards = 0
+
+    def add(self, rows):
+        (ids, senders, types, lengths, views, forwards, replies,
+         dates, days, hours, offsets) = list(zip(*rows))[:11]
+        self.count += len(ids)
+
+        _count(self.days, days)
+        _count(self.hours, hours)
+        _count(self.reply_counts, replies)
+        self.sender_types.update(zip(senders, types))
+        self.sender_hours.update(zip(senders, hours))
+        self.sender_days.update(zip(senders, days))
+
+        views = [value for value in views if value]
+        self.total_views += sum(views)
+        self.messages_with_views += len(views)
+        self.total_forwards += sum(value for value in forwards if value)
+
+        self.sender_counts.update(senders)
+        self.message_senders.update(zip(ids, map(str, senders)))
+        if None in senders:
+            for msg_id, sender_id in zip(ids, senders):
+                if sender_id is None:
+                    self.message_senders[msg_id] = None
+
+        # При одном смещении строки дат сравниваются как моменты; строгое
+        # сравнение в порядке id оставляет более раннее сообщение
+        lengths_by_sender = self.text_lengths
+        stamps = self.stamps
+        for msg_id, sender_id, length, value, offset in zip(ids, senders, lengths, dates, offsets):
+            lengths_by_sender[sender_id] += length
+            if not value or sender_id is None:
+                continue
+            s = stamps.get((sender_id, offset))
+            if s is None:
+                stamps[(sender_id, offset)] = [value, msg_id, value, msg_id]
+                continue
+            if value < s[0]:
+                s[0], s[1] = value, msg_id
+            if value > s[2]:
+                s[2], s[3] = value, msg_id
+
+    def states(self, conn):
+        """Состояния анализаторов NAMES: {name: state}."""
+        parsed = {day: date.fromisoformat(day) for day in self.days}
+        daily = Counter()
+        monthly = Counter()
+        for day, count in self.days.items():
+            daily[parsed[day].weekday()] += count
+            monthly[month_key(parsed[day])] += count
+
+        reactions = dict(conn.execute("SELECT message_id, SUM(count) FROM reactions GROUP BY message_id"))
+        received = Counter()
+        for msg_id, count in reactions.items():
+            received[self.message_senders.get(msg_id)] += count
+        # Первое появление реакции — по (message_id, position)
+        reaction_types = [list(row) for row in conn.execute(
+            "SELECT emoticon, SUM(count) FROM reactions GROUP BY emoticon "
+            "ORDER BY MIN(message_id * 1048576 + position)"
+        )]
+
+        firsts, lasts = {}, {}
+        for (sender_id, _), (first, first_id, last, last_id) in self.stamps.items():
+            firsts.setdefault(sender_id, []).append((first, first_id))
+            lasts.setdefault(sender_id, []).append((last, last_id))
+        profiles = {row[0]: row[1:] for row in conn.execute(
+            "SELECT id, first_name, last_name, username FROM senders"
+        )}
+        types = _by_sender(self.sender_types)
+        hours = _by_sender(self.sender_hours, int)
+        days = _by_sender(self.sender_days, lambda day: parsed[day].weekday())
+        participants = []
+        for sender_id, count in self.sender_counts.items():
+            if sender_id is None:
+                continue
+            first_name, last_name, username = profiles.get(sender_id, (None, None, None))
+            participants.append([str(sender_id), {
+                'message_count': count,
+                'first_message': _pick(firsts[sender_id]) if sender_id in firsts else None,
+                'last_message': _pick(lasts[sender_id], last=True) if sender_id in lasts else None,
+                'reactions_received': received[str(sender_id)],
+                'replies_received': 0,
+                'user_info': {'id': sender_id, 'first_name': first_name,
+                              'last_name': last_name, 'username': username},
+                'message_types': types.get(sender_id, []),
+                'active_hours': hours.get(sender_id, []),
+                'active_days': days.get(sender_id, []),
+                'total_text_length': self.text_lengths[sender_id],
+            }])
+
+        return {
+            'participants': {
+                'participants': participants,
+                'message_senders': list(self.message_senders.items()),
+                'reply_counts': list(self.reply_counts.items()),
+            },
+            'temporal': {
+                'hourly': [[int(hour), count] for hour, count in self.hours.items()],
+                'daily': list(daily.items()),
+                'monthly': list(monthly.items()),
+                'messages_by_date': [[parsed[day].toordinal(), count] for day, count in self.days.items()],
+                'message_count': self.count,
+            },
+            'engagement': {
+                'total_reactions': sum(reactions.values()),
+                'total_views': self.total_views,
+                'total_forwards': self.total_forwards,
+                'messages_with_reactions': len(reactions),
+                'messages_with_views': self.messages_with_views,
+                'message_count': self.count,
+                'reaction_types': reaction_types,
+            },
+        }
+
+
+def analyze(store, analyzers=()):
+    """
+    Один проход по SQLite-экспорту: агрегаты NAMES считаются по колонкам,
+    остальные analyzers получают сообщения в том виде, в каком их читают
+    топики и контент (id, дата, текст, тип, отправитель с именем, reply_to
+    по reply_to_message_id), без реакций, медиа и разбора JSON-полей.
+    Вернуть (состояния NAMES, число сообщений, последний id).
+    """
+    conn = store.conn
+    names = dict(conn.execute("SELECT id, first_name FROM senders")) if analyzers else {}
+    columns = _Columns()
+    last_id = 0
+    cursor = conn.execute(_SELECT.format(text=", text" if analyzers else ""))
+    while True:
+        rows = cursor.fetchmany(BATCH)
+        if not rows:
+            break
+        columns.add(rows)
+        last_id = rows[-1][0]
+        if analyzers:
+            for row in rows:
+                sender_id, reply_to = row[1], row[6]
+                msg = {
+                    'id': row[0],
+                    'date': row[7],
+                    'text': row[11],
+                    'message_type': row[2],
+                    'sender': {'id': sender_id, 'first_name': names.get(sender_id)}
+                    if sender_id is not None else None,
+                    'reply_to': {'message_id': reply_to} if reply_to is not None else None,
+                }
+                dt = parse_date(msg['date'])
+                for analyzer in analyzers:
+                    analyzer.update(msg, dt)
+        if columns.count % 100000 == 0:
+            print(f"  Обработано {columns.count} сообщений...")
+    return columns.states(conn), columns.count, last_id
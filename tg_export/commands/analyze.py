@@ -1,67 +1,411 @@
 """Офлайн-анализ экспортированных сообщений с генерацией отчета."""
 
-import json
 import os
 import re
+from array import array
 from collections import defaultdict, Counter
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import Dict, List
 
+from tg_export import columnar, jsonio
+from tg_export.dates import WEEKDAYS, parse_date, epoch, month_key, month_string, day_string
 from tg_export.schemas import get_export_info
+from tg_export.storage import open_export, derived_path
 
 
-def _analyze_topics(messages):
-    """Построить структуру топиков по цепочкам reply_to."""
-    topics = defaultdict(list)
-    message_map = {m['id']: m for m in messages}
-
-    def find_root(msg_id, visited=None):
-        if visited is None:
-            visited = set()
-        if msg_id in visited:
-            return msg_id
-        visited.add(msg_id)
-        msg = message_map.get(msg_id)
-        if not msg:
-            return msg_id
+# Версия формата файла состояния (*_analysis_state.json)
+STATE_VERSION = 2
+
+
+class Analyzer:
+    """
+    Аккумулятор для однопроходного анализа.
+
+    update(msg, dt) вызывается для каждого сообщения в порядке экспорта
+    (dt — уже разобранная дата или None), finalize() — в конце и не меняет
+    состояние. Анализатор хранит только собственное агрегированное
+    состояние, а не сами сообщения; get_state()/from_state() сохраняют его
+    в JSON, чтобы следующий запуск мог продолжить с новых сообщений.
+
+    Анализатор с mergeable = True умеет merge(other): добавить к себе
+    результат того же анализатора по следующей части сообщений. Такие
+    анализаторы в режиме --workers считаются по частям в пуле процессов.
+    ordered_merge = True означает, что merge точен, только если id частей
+    не пересекаются, идут по возрастанию от части к части и ответы
+    ссылаются только на более ранние id; иначе движок считает такой
+    анализатор одним проходом.
+    """
+
+    name = None
+    mergeable = False
+    ordered_merge = False
+
+    def update(self, msg, dt):
+        raise NotImplementedError
+
+    def finalize(self):
+        raise NotImplementedError
+
+    def get_state(self):
+        raise NotImplementedError
+
+    @classmethod
+    def from_state(cls, state):
+        raise NotImplementedError
+
+    def merge(self, other):
+        raise NotImplementedError
+
+    def get_part(self):
+        """Результат по части сообщений для передачи из процесса пула (pickle)."""
+        return self.get_state()
+
+    @classmethod
+    def from_part(cls, part):
+        return cls.from_state(part)
+
+
+def _pairs(mapping):
+    """dict/Counter -> список пар (сохраняет порядок и тип ключей в JSON)."""
+    return [[k, v] for k, v in mapping.items()]
+
+
+def _date_state(dt):
+    return dt.isoformat() if dt is not None else None
+
+
+def _date_from_state(value):
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+def _stamp_state(stamp):
+    return [stamp[0], stamp[1].isoformat()] if stamp is not None else None
+
+
+def _stamp_from_state(value):
+    return (value[0], datetime.fromisoformat(value[1])) if value is not None else None
+
+
+class ThreadStats:
+    """Агрегаты одного треда; сливаются при объединении тредов."""
+
+    __slots__ = ('message_count', 'senders', 'dated_count', 'first_date', 'last_date',
+                 'preview_id', 'preview', 'first_seq', 'root_sender')
+
+    def __init__(self, seq, msg_id, sender, dt, text):
+        self.message_count = 1
+        self.senders = {sender.get('id')} if sender else set()
+        self.dated_count = 1 if dt is not None else 0
+        self.first_date = dt
+        self.last_date = dt
+        self.preview_id = msg_id if text and len(text) > 5 else None
+        self.preview = text[:200] if self.preview_id is not None else ""
+        self.first_seq = seq
+        self.root_sender = sender.get('first_name', 'Unknown') if sender else 'System'
+
+    def get_state(self):
+        return [self.message_count, list(self.senders), self.dated_count,
+                _date_state(self.first_date), _date_state(self.last_date),
+                self.preview_id, self.preview, self.first_seq, self.root_sender]
+
+    @classmethod
+    def from_state(cls, state):
+        stats = cls.__new__(cls)
+        (stats.message_count, senders, stats.dated_count, first_date, last_date,
+         stats.preview_id, stats.preview, stats.first_seq, stats.root_sender) = state
+        stats.senders = set(senders)
+        stats.first_date = _date_from_state(first_date)
+        stats.last_date = _date_from_state(last_date)
+        return stats
+
+    def merge(self, other):
+        """Добавить агрегаты другого треда (root_sender остается своим)."""
+        self.message_count += other.message_count
+        if len(other.senders) > len(self.senders):
+            self.senders, other.senders = other.senders, self.senders
+        self.senders |= other.senders
+        self.dated_count += other.dated_count
+        if other.first_date is not None and (self.first_date is None or other.first_date < self.first_date):
+            self.first_date = other.first_date
+        if other.last_date is not None and (self.last_date is None or other.last_date > self.last_date):
+            self.last_date = other.last_date
+        if other.preview_id is not None and (self.preview_id is None or other.preview_id < self.preview_id):
+            self.preview_id, self.preview = other.preview_id, other.preview
+        self.first_seq = min(self.first_seq, other.first_seq)
+
+
+class ThreadIndex:
+    """
+    Разрешение корней тредов по reply_to через union-find.
+
+    Каждое сообщение — узел; ответ присоединяет множество сообщения к
+    множеству родителя. find() итеративный со сжатием путей, объединение по
+    размеру — почти линейное время без рекурсии на любых длинах цепочек.
+    Для каждого множества хранится корневое сообщение треда (top) и его
+    ThreadStats. Ответ на сообщение, которое еще не встречалось, ждет в
+    pending и присоединяется, когда родитель появится. Циклы reply_to
+    безопасны: сообщения цикла уже в одном множестве, объединение не
+    выполняется, и весь цикл считается одним тредом.
+    """
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+        self.top = {}
+        self.stats = {}
+        self.pending = defaultdict(list)
+
+    def find(self, msg_id):
+        """Представитель множества сообщения."""
+        parent = self.parent
+        root = msg_id
+        while parent[root] != root:
+            root = parent[root]
+        while parent[msg_id] != root:
+            parent[msg_id], msg_id = root, parent[msg_id]
+        return root
+
+    def thread_of(self, msg_id):
+        """id корневого сообщения треда, к которому относится msg_id."""
+        return self.top[self.find(msg_id)]
+
+    def add(self, msg_id, reply_to_id, stats):
+        """Добавить сообщение со статистикой stats, ответ на reply_to_id (или None)."""
+        if msg_id in self.parent:
+            # Повтор id: сообщение учитывается в уже существующем треде
+            self.stats[self.find(msg_id)].merge(stats)
+            return
+        self.parent[msg_id] = msg_id
+        self.size[msg_id] = 1
+        self.top[msg_id] = msg_id
+        self.stats[msg_id] = stats
+
+        for child_id in self.pending.pop(msg_id, ()):
+            self._attach(child_id, msg_id)
+        if reply_to_id is not None:
+            if reply_to_id in self.parent:
+                self._attach(msg_id, reply_to_id)
+            else:
+                self.pending[reply_to_id].append(msg_id)
+
+    def _attach(self, child_id, parent_id):
+        child_root = self.find(child_id)
+        parent_root = self.find(parent_id)
+        if child_root == parent_root:
+            return
+        top = self.top.pop(parent_root)
+        root_sender = self.stats[parent_root].root_sender
+        del self.top[child_root]
+
+        if self.size[child_root] > self.size[parent_root]:
+            big, small = child_root, parent_root
+        else:
+            big, small = parent_root, child_root
+        self.parent[small] = big
+        self.size[big] += self.size.pop(small)
+        self.stats[big].merge(self.stats.pop(small))
+        self.stats[big].root_sender = root_sender
+        self.top[big] = top
+
+    def merge(self, other, seq_offset):
+        """
+        Добавить индекс по следующей части сообщений (id не пересекаются
+        с уже известными). first_seq тредов other сдвигается на seq_offset;
+        ответы, ждавшие родителя из другой части, присоединяются.
+        """
+        for stats in other.stats.values():
+            stats.first_seq += seq_offset
+        # Ответы из прошлых частей на сообщения other
+        resolved = [parent_id for parent_id in self.pending if parent_id in other.parent]
+        self.parent.update(other.parent)
+        self.size.update(other.size)
+        self.top.update(other.top)
+        self.stats.update(other.stats)
+        for parent_id in resolved:
+            for child_id in self.pending.pop(parent_id):
+                self._attach(child_id, parent_id)
+        # Ответы из other на сообщения прошлых частей (или еще не встреченные)
+        for parent_id, children in other.pending.items():
+            if parent_id in self.parent:
+                for child_id in children:
+                    self._attach(child_id, parent_id)
+            else:
+                self.pending[parent_id].extend(children)
+
+    def get_state(self):
+        return {
+            'parent': _pairs(self.parent),
+            'size': _pairs(self.size),
+            'top': _pairs(self.top),
+            'stats': [[rep, stats.get_state()] for rep, stats in self.stats.items()],
+            'pending': _pairs(self.pending),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls()
+        index.parent = dict(state['parent'])
+        index.size = dict(state['size'])
+        index.top = dict(state['top'])
+        index.stats = {rep: ThreadStats.from_state(s) for rep, s in state['stats']}
+        index.pending.update((k, v) for k, v in state['pending'])
+        return index
+
+    def pack(self):
+        """
+        Компактная форма для передачи между процессами: представители
+        всех узлов — массивами, статистика — кортежами только по тредам.
+        """
+        ids = array('q', self.parent)
+        reps = array('q', map(self.find, ids))
+        threads = [(rep, self.size[rep], self.top[rep], stats.message_count, tuple(stats.senders),
+                    stats.dated_count, stats.first_date, stats.last_date, stats.preview_id,
+                    stats.preview, stats.first_seq, stats.root_sender)
+                   for rep, stats in self.stats.items()]
+        return ids, reps, threads, dict(self.pending)
+
+    @classmethod
+    def unpack(cls, packed):
+        ids, reps, threads, pending = packed
+        index = cls()
+        index.parent = dict(zip(ids, reps))
+        for (rep, size, top, message_count, senders, dated_count, first_date, last_date,
+             preview_id, preview, first_seq, root_sender) in threads:
+            stats = ThreadStats.__new__(ThreadStats)
+            stats.message_count, stats.senders, stats.dated_count = message_count, set(senders), dated_count
+            stats.first_date, stats.last_date = first_date, last_date
+            stats.preview_id, stats.preview = preview_id, preview
+            stats.first_seq, stats.root_sender = first_seq, root_sender
+            index.size[rep] = size
+            index.top[rep] = top
+            index.stats[rep] = stats
+        index.pending.update(pending)
+        return index
+
+    def threads(self):
+        """Пары (id корня, ThreadStats) в порядке первого появления треда."""
+        items = [(self.top[rep], stats) for rep, stats in self.stats.items()]
+        items.sort(key=lambda item: item[1].first_seq)
+        return items
+
+
+class TopicAnalyzer(Analyzer):
+    """Топики по цепочкам reply_to и саммари по каждому треду."""
+
+    name = 'topics'
+    mergeable = True
+    # Корень треда в цикле reply_to зависит от порядка сообщений
+    ordered_merge = True
+
+    def __init__(self):
+        self.index = ThreadIndex()
+        self.seq = 0
+
+    def update(self, msg, dt):
+        reply_to = msg.get('reply_to')
+        parent_id = reply_to['message_id'] if reply_to and 'message_id' in reply_to else None
+        stats = ThreadStats(self.seq, msg['id'], msg.get('sender'), dt, msg.get('text'))
+        self.index.add(msg['id'], parent_id, stats)
+        self.seq += 1
+
+    def merge(self, other):
+        self.index.merge(other.index, self.seq)
+        self.seq += other.seq
+
+    def finalize(self):
+        threads = self.index.threads()
+        return {
+            'topic_count': len(threads),
+            'topic_summaries': _extract_topic_summaries(threads),
+        }
+
+    def get_state(self):
+        return {'seq': self.seq, 'index': self.index.get_state()}
+
+    @classmethod
+    def from_state(cls, state):
+        analyzer = cls()
+        analyzer.seq = state['seq']
+        analyzer.index = ThreadIndex.from_state(state['index'])
+        return analyzer
+
+    def get_part(self):
+        return self.seq, self.index.pack()
+
+    @classmethod
+    def from_part(cls, part):
+        analyzer = cls()
+        analyzer.seq = part[0]
+        analyzer.index = ThreadIndex.unpack(part[1])
+        return analyzer
+
+
+def _extract_topic_summaries(threads):
+    """Саммари по каждому топику/треду."""
+    summaries = []
+
+    for root_id, stats in threads:
+        first, last = stats.first_date, stats.last_date
+        summaries.append({
+            'root_id': root_id,
+            'message_count': stats.message_count,
+            'participant_count': len(stats.senders),
+            'first_date': first.isoformat() if first else None,
+            'last_date': last.isoformat() if last else None,
+            'duration_hours': (last - first).total_seconds() / 3600 if stats.dated_count > 1 else 0,
+            'preview': stats.preview,
+            'root_sender': stats.root_sender,
+        })
+
+    summaries.sort(key=lambda x: x['message_count'], reverse=True)
+    return summaries
+
+
+class ParticipantAnalyzer(Analyzer):
+    """
+    Анализ активности участников.
+
+    Первое и последнее сообщение хранятся как (epoch, datetime): сравнение
+    идет по числу, ISO-строка формируется в finalize. Дни недели
+    считаются по номеру и получают названия при выводе.
+    """
+
+    name = 'participants'
+    mergeable = True
+
+    _COUNTERS = ('message_types', 'active_hours', 'active_days')
+
+    def __init__(self):
+        self.participants = defaultdict(lambda: {
+            'message_count': 0,
+            'first_message': None,
+            'last_message': None,
+            'reactions_received': 0,
+            'replies_received': 0,
+            'user_info': None,
+            'message_types': Counter(),
+            'active_hours': Counter(),
+            'active_days': Counter(),
+            'total_text_length': 0,
+        })
+        # id сообщения -> id отправителя (для подсчета полученных ответов)
+        self.message_senders = {}
+        # id сообщения -> сколько раз на него ответили
+        self.reply_counts = Counter()
+
+    def update(self, msg, dt):
         reply_to = msg.get('reply_to')
         if reply_to and 'message_id' in reply_to:
-            parent_id = reply_to['message_id']
-            if parent_id in message_map:
-                return find_root(parent_id, visited)
-        return msg_id
-
-    for msg in messages:
-        root_id = find_root(msg['id'])
-        topics[root_id].append(msg)
-
-    return dict(topics)
-
-
-def _analyze_participants(messages):
-    """Анализ активности участников."""
-    participants = defaultdict(lambda: {
-        'message_count': 0,
-        'first_message': None,
-        'last_message': None,
-        'reactions_received': 0,
-        'replies_received': 0,
-        'user_info': None,
-        'message_types': Counter(),
-        'active_hours': Counter(),
-        'active_days': Counter(),
-        'total_text_length': 0,
-    })
-
-    message_map = {m['id']: m for m in messages}
-
-    for msg in messages:
+            self.reply_counts[reply_to['message_id']] += 1
+
         sender = msg.get('sender')
         if not sender:
-            continue
+            self.message_senders[msg['id']] = None
+            return
 
         sender_id = str(sender.get('id', 'unknown'))
-        p = participants[sender_id]
+        self.message_senders[msg['id']] = sender_id
+        p = self.participants[sender_id]
 
         if not p['user_info']:
             p['user_info'] = {
@@ -73,18 +417,14 @@ def _analyze_participants(messages):
 
         p['message_count'] += 1
 
-        msg_date = msg.get('date')
-        if msg_date:
-            try:
-                dt = datetime.fromisoformat(msg_date.replace('Z', '+00:00'))
-                if not p['first_message'] or dt < datetime.fromisoformat(p['first_message'].replace('Z', '+00:00')):
-                    p['first_message'] = msg_date
-                if not p['last_message'] or dt > datetime.fromisoformat(p['last_message'].replace('Z', '+00:00')):
-                    p['last_message'] = msg_date
-                p['active_hours'][dt.hour] += 1
-                p['active_days'][dt.strftime('%A')] += 1
-            except (ValueError, TypeError):
-                pass
+        if dt is not None:
+            ts = epoch(dt)
+            if p['first_message'] is None or ts < p['first_message'][0]:
+                p['first_message'] = (ts, dt)
+            if p['last_message'] is None or ts > p['last_message'][0]:
+                p['last_message'] = (ts, dt)
+            p['active_hours'][dt.hour] += 1
+            p['active_days'][dt.weekday()] += 1
 
         p['message_types'][msg.get('message_type', 'text')] += 1
 
@@ -96,232 +436,612 @@ def _analyze_participants(messages):
         if reactions:
             p['reactions_received'] += sum(r.get('count', 1) for r in reactions)
 
-    # Подсчет полученных ответов
-    for msg in messages:
-        reply_to = msg.get('reply_to')
-        if reply_to and 'message_id' in reply_to:
-            parent_msg = message_map.get(reply_to['message_id'])
-            if parent_msg and parent_msg.get('sender'):
-                parent_sender_id = str(parent_msg['sender'].get('id', 'unknown'))
-                if parent_sender_id in participants:
-                    participants[parent_sender_id]['replies_received'] += 1
-
-    # Финализация
-    for p in participants.values():
-        if p['message_count'] > 0:
-            p['avg_message_length'] = p['total_text_length'] / p['message_count']
-        else:
-            p['avg_message_length'] = 0
-        p['message_types'] = dict(p['message_types'])
-        p['active_hours'] = dict(p['active_hours'])
-        p['active_days'] = dict(p['active_days'])
-
-    return dict(participants)
-
-
-def _analyze_temporal(messages):
-    """Анализ временных паттернов."""
-    hourly = Counter()
-    daily = Counter()
-    monthly = Counter()
-    messages_by_date = defaultdict(list)
-
-    for msg in messages:
-        date_str = msg.get('date')
-        if not date_str:
-            continue
-        try:
-            dt = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-            hourly[dt.hour] += 1
-            daily[dt.strftime('%A')] += 1
-            monthly[dt.strftime('%Y-%m')] += 1
-            messages_by_date[dt.date().isoformat()].append(msg)
-        except (ValueError, TypeError):
-            pass
-
-    peak_hour = hourly.most_common(1)[0] if hourly else (0, 0)
-    peak_day = daily.most_common(1)[0] if daily else ('', 0)
-
-    # Подсчет стриков активности
-    dates = sorted(messages_by_date.keys())
-    max_streak = 0
-    current_streak = 1
-    for i in range(1, len(dates)):
-        d1 = datetime.fromisoformat(dates[i-1]).date()
-        d2 = datetime.fromisoformat(dates[i]).date()
-        if (d2 - d1).days == 1:
-            current_streak += 1
-            max_streak = max(max_streak, current_streak)
-        else:
-            current_streak = 1
-
-    return {
-        'hourly_distribution': dict(hourly),
-        'daily_distribution': dict(daily),
-        'monthly_distribution': dict(monthly),
-        'peak_hour': peak_hour[0],
-        'peak_day': peak_day[0],
-        'max_activity_streak_days': max_streak,
-        'total_active_days': len(messages_by_date),
-        'avg_messages_per_active_day': len(messages) / max(len(messages_by_date), 1),
-        'messages_by_date': {k: len(v) for k, v in messages_by_date.items()},
-    }
+    def finalize(self):
+        participants = {}
+        for sender_id, p in self.participants.items():
+            p = dict(p)
+            for key in ('first_message', 'last_message'):
+                p[key] = p[key][1].isoformat() if p[key] is not None else None
+            for key in self._COUNTERS:
+                p[key] = dict(p[key])
+            p['active_days'] = {WEEKDAYS[day]: count for day, count in p['active_days'].items()}
+            participants[sender_id] = p
+
+        # Подсчет полученных ответов
+        for parent_id, count in self.reply_counts.items():
+            parent_sender_id = self.message_senders.get(parent_id)
+            if parent_sender_id is not None and parent_sender_id in participants:
+                participants[parent_sender_id]['replies_received'] += count
+
+        # Финализация
+        for p in participants.values():
+            if p['message_count'] > 0:
+                p['avg_message_length'] = p['total_text_length'] / p['message_count']
+            else:
+                p['avg_message_length'] = 0
+
+        return participants
+
+    def merge(self, other):
+        for sender_id, q in other.participants.items():
+            if sender_id not in self.participants:
+                self.participants[sender_id] = q
+                continue
+            p = self.participants[sender_id]
+            for key in ('message_count', 'reactions_received', 'replies_received', 'total_text_length'):
+                p[key] += q[key]
+            # При равенстве остается более раннее сообщение, как при одном проходе
+            if q['first_message'] is not None and (p['first_message'] is None or q['first_message'][0] < p['first_message'][0]):
+                p['first_message'] = q['first_message']
+            if q['last_message'] is not None and (p['last_message'] is None or q['last_message'][0] > p['last_message'][0]):
+                p['last_message'] = q['last_message']
+            for key in self._COUNTERS:
+                p[key].update(q[key])
+        self.message_senders.update(other.message_senders)
+        self.reply_counts.update(other.reply_counts)
+
+    def get_state(self):
+        participants = []
+        for sender_id, p in self.participants.items():
+            p = dict(p)
+            for key in ('first_message', 'last_message'):
+                p[key] = _stamp_state(p[key])
+            for key in self._COUNTERS:
+                p[key] = _pairs(p[key])
+            participants.append([sender_id, p])
+        return {
+            'participants': participants,
+            'message_senders': _pairs(self.message_senders),
+            'reply_counts': _pairs(self.reply_counts),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        analyzer = cls()
+        for sender_id, p in state['participants']:
+            for key in ('first_message', 'last_message'):
+                p[key] = _stamp_from_state(p[key])
+            for key in cls._COUNTERS:
+                p[key] = Counter(dict(p[key]))
+            analyzer.participants[sender_id] = p
+        analyzer.message_senders = dict(state['message_senders'])
+        analyzer.reply_counts = Counter(dict(state['reply_counts']))
+        return analyzer
+
+
+class TemporalAnalyzer(Analyzer):
+    """
+    Анализ временных паттернов.
+
+    Счетчики ведутся по числовым ключам (день недели, month_key, номер
+    дня); строки дат и названия дней формируются в finalize.
+    """
+
+    name = 'temporal'
+    mergeable = True
+
+    def __init__(self):
+        self.hourly = Counter()
+        self.daily = Counter()
+        self.monthly = Counter()
+        self.messages_by_date = Counter()
+        self.message_count = 0
+
+    def update(self, msg, dt):
+        self.message_count += 1
+        if dt is None:
+            return
+        self.hourly[dt.hour] += 1
+        self.daily[dt.weekday()] += 1
+        self.monthly[month_key(dt)] += 1
+        self.messages_by_date[dt.toordinal()] += 1
+
+    def finalize(self):
+        hourly = self.hourly
+        daily = Counter({WEEKDAYS[day]: count for day, count in self.daily.items()})
+        peak_hour = hourly.most_common(1)[0] if hourly else (0, 0)
+        peak_day = daily.most_common(1)[0] if daily else ('', 0)
+
+        # Подсчет стриков активности
+        days = sorted(self.messages_by_date)
+        max_streak = 0
+        current_streak = 1
+        for i in range(1, len(days)):
+            if days[i] - days[i-1] == 1:
+                current_streak += 1
+                max_streak = max(max_streak, current_streak)
+            else:
+                current_streak = 1
+
+        return {
+            'hourly_distribution': dict(hourly),
+            'daily_distribution': dict(daily),
+            'monthly_distribution': {month_string(key): count for key, count in self.monthly.items()},
+            'peak_hour': peak_hour[0],
+            'peak_day': peak_day[0],
+            'max_activity_streak_days': max_streak,
+            'total_active_days': len(self.messages_by_date),
+            'avg_messages_per_active_day': self.message_count / max(len(self.messages_by_date), 1),
+            'messages_by_date': {day_string(day): count for day, count in self.messages_by_date.items()},
+        }
+
+    def merge(self, other):
+        self.hourly.update(other.hourly)
+        self.daily.update(other.daily)
+        self.monthly.update(other.monthly)
+        self.messages_by_date.update(other.messages_by_date)
+        self.message_count += other.message_count
+
+    def get_state(self):
+        return {
+            'hourly': _pairs(self.hourly),
+            'daily': _pairs(self.daily),
+            'monthly': _pairs(self.monthly),
+            'messages_by_date': _pairs(self.messages_by_date),
+            'message_count': self.message_count,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        analyzer = cls()
+        analyzer.hourly = Counter(dict(state['hourly']))
+        analyzer.daily = Counter(dict(state['daily']))
+        analyzer.monthly = Counter(dict(state['monthly']))
+        analyzer.messages_by_date = Counter(dict(state['messages_by_date']))
+        analyzer.message_count = state['message_count']
+        return analyzer
+
+
+_EMOJI_CLASS = (
+    "["
+    "\U0001F600-\U0001F64F"
+    "\U0001F300-\U0001F5FF"
+    "\U0001F680-\U0001F6FF"
+    "\U0001F1E0-\U0001F1FF"
+    "\U00002702-\U000027B0"
+    "\U0001F900-\U0001F9FF"
+    "\U0001FA00-\U0001FA6F"
+    "\U00002600-\U000026FF"
+    "]"
+)
+_EMOJI_PATTERN = re.compile(_EMOJI_CLASS + "+", flags=re.UNICODE)
+_MENTION_PATTERN = re.compile(r'@\w+')
+_HASHTAG_PATTERN = re.compile(r'#\w+')
+# Один проход по тексту: ссылка | упоминание | хэштег | эмодзи | слово от 3 символов
+_TOKEN_PATTERN = re.compile(
+    r'https?://\S+|@\w+|#\w+|' + _EMOJI_CLASS + r'+|\w{3,}', flags=re.UNICODE
+)
+# Символы, с которых начинается токен эмодзи
+_EMOJI_CHARS = frozenset(
+    chr(c) for lo, hi in ((0x1F600, 0x1F64F), (0x1F300, 0x1F5FF), (0x1F680, 0x1F6FF),
+                          (0x1F1E0, 0x1F1FF), (0x2702, 0x27B0), (0x1F900, 0x1F9FF),
+                          (0x1FA00, 0x1FA6F), (0x2600, 0x26FF))
+    for c in range(lo, hi + 1)
+)
+# Первые символы токенов, которые не являются словами (кроме ссылок)
+_NON_WORD_START = _EMOJI_CHARS | {'@', '#'}
+
+# Стоп-слова
+_STOP_WORDS = {
+    'the', 'and', 'for', 'that', 'this', 'with', 'you', 'are', 'have', 'was',
+    'but', 'not', 'can', 'что', 'это', 'как', 'для', 'все', 'так', 'его',
+    'она', 'они', 'мне', 'вот', 'уже', 'еще', 'ещё', 'там', 'тут', 'где',
+    'или', 'если', 'при', 'про', 'чтобы', 'только', 'будет',
+}
+
+
+def _scan_text(text, word_freq, emoji_freq):
+    """
+    Разобрать текст одним проходом _TOKEN_PATTERN: слова (в нижнем
+    регистре) и символы эмодзи добавляются в счетчики, возвращается
+    (ссылок, упоминаний, хэштегов).
+
+    Класс токена определяется по первому символу: упоминание, хэштег или
+    эмодзи (_NON_WORD_START); из остальных только ссылка содержит ':'.
+    """
+    tokens = _TOKEN_PATTERN.findall(text)
+    words = [t for t in tokens if t[0] not in _NON_WORD_START and ':' not in t]
+    urls = mentions = hashtags = 0
+    emojis = []
+    emoji_in_urls = False
+    if len(words) != len(tokens):
+        for token in [t for t in tokens if t[0] in _NON_WORD_START or ':' in t]:
+            first = token[0]
+            if first == '@':
+                mentions += 1
+            elif first == '#':
+                hashtags += 1
+            elif first in _EMOJI_CHARS:
+                emojis.append(token)
+            elif ':' in token:
+                urls += 1
+                # Ссылка поглощает текст до пробела; упоминания, хэштеги и
+                # эмодзи внутри нее считаются, как и раньше
+                if '@' in token or '#' in token:
+                    mentions += len(_MENTION_PATTERN.findall(token))
+                    hashtags += len(_HASHTAG_PATTERN.findall(token))
+                if not token.isascii():
+                    emoji_in_urls = True
+
+    word_freq.update(map(str.lower, words))
+    emoji_text = ''.join(_EMOJI_PATTERN.findall(text) if emoji_in_urls else emojis)
+    if emoji_text:
+        emoji_freq.update(emoji_text)
+    return urls, mentions, hashtags
+
+
+def _scan_texts(texts, word_freq, emoji_freq):
+    """
+    _scan_text для пачки текстов за один вызов: токены не пересекают
+    пробельные символы, поэтому тексты, склеенные через перевод строки,
+    дают те же токены в том же порядке.
+    """
+    return _scan_text('\n'.join(texts), word_freq, emoji_freq)
+
+
+# Текстов в пачке для _scan_texts
+CONTENT_BATCH = 1000
+
+
+class ContentAnalyzer(Analyzer):
+    """
+    Анализ типов контента и текстовых паттернов.
+
+    Тексты копятся пачками по CONTENT_BATCH и разбираются одним регулярным
+    выражением (_TOKEN_PATTERN) на пачку.
+    """
+
+    name = 'content'
+    mergeable = True
+
+    def __init__(self):
+        self.content_types = Counter()
+        self.word_freq = Counter()
+        self.emoji_freq = Counter()
+        self.url_count = 0
+        self.mention_count = 0
+        self.hashtag_count = 0
+        self.text_messages = 0
+        self.total_characters = 0
+        self._batch = []
+
+    def update(self, msg, dt):
+        self.content_types[msg.get('message_type', 'text')] += 1
 
+        text = msg.get('text', '')
+        if not text:
+            return
+        self.text_messages += 1
+        # Длина бывшей склейки " " + text для всех текстов
+        self.total_characters += 1 + len(text)
+
+        self._batch.append(text)
+        if len(self._batch) >= CONTENT_BATCH:
+            self._flush()
+
+    def _flush(self):
+        """Разобрать накопленные тексты."""
+        if not self._batch:
+            return
+        urls, mentions, hashtags = _scan_texts(self._batch, self.word_freq, self.emoji_freq)
+        self.url_count += urls
+        self.mention_count += mentions
+        self.hashtag_count += hashtags
+        self._batch = []
+
+    def merge(self, other):
+        self._flush()
+        other._flush()
+        self.content_types.update(other.content_types)
+        self.word_freq.update(other.word_freq)
+        self.emoji_freq.update(other.emoji_freq)
+        for key in ('url_count', 'mention_count', 'hashtag_count', 'text_messages', 'total_characters'):
+            setattr(self, key, getattr(self, key) + getattr(other, key))
+
+    def finalize(self):
+        self._flush()
+        # Стоп-слова отсекаются при выборке топа, счетчик не изменяется
+        top_words = [
+            (word, count)
+            for word, count in self.word_freq.most_common(50 + len(_STOP_WORDS))
+            if word not in _STOP_WORDS
+        ][:50]
+
+        return {
+            'content_type_distribution': dict(self.content_types),
+            'total_text_messages': self.text_messages,
+            'total_characters': self.total_characters,
+            'url_count': self.url_count,
+            'mention_count': self.mention_count,
+            'hashtag_count': self.hashtag_count,
+            'top_words': dict(top_words),
+            'top_emojis': dict(self.emoji_freq.most_common(20)),
+            'avg_message_length': self.total_characters / max(self.text_messages, 1),
+        }
+
+    def get_state(self):
+        self._flush()
+        return {
+            'content_types': _pairs(self.content_types),
+            'word_freq': _pairs(self.word_freq),
+            'emoji_freq': _pairs(self.emoji_freq),
+            'url_count': self.url_count,
+            'mention_count': self.mention_count,
+            'hashtag_count': self.hashtag_count,
+            'text_messages': self.text_messages,
+            'total_characters': self.total_characters,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        analyzer = cls()
+        analyzer.content_types = Counter(dict(state['content_types']))
+        analyzer.word_freq = Counter(dict(state['word_freq']))
+        analyzer.emoji_freq = Counter(dict(state['emoji_freq']))
+        for key in ('url_count', 'mention_count', 'hashtag_count', 'text_messages', 'total_characters'):
+            setattr(analyzer, key, state[key])
+        return analyzer
+
+
+class EngagementAnalyzer(Analyzer):
+    """Анализ вовлеченности: реакции, просмотры, пересылки."""
 
-def _analyze_content(messages):
-    """Анализ типов контента и текстовых паттернов."""
-    content_types = Counter()
-    word_freq = Counter()
-    emoji_freq = Counter()
-    url_count = 0
-    mention_count = 0
-    hashtag_count = 0
-
-    emoji_pattern = re.compile(
-        "["
-        "\U0001F600-\U0001F64F"
-        "\U0001F300-\U0001F5FF"
-        "\U0001F680-\U0001F6FF"
-        "\U0001F1E0-\U0001F1FF"
-        "\U00002702-\U000027B0"
-        "\U0001F900-\U0001F9FF"
-        "\U0001FA00-\U0001FA6F"
-        "\U00002600-\U000026FF"
-        "]+", flags=re.UNICODE
-    )
-    url_pattern = re.compile(r'https?://\S+')
-    mention_pattern = re.compile(r'@\w+')
-    hashtag_pattern = re.compile(r'#\w+')
-
-    text_messages = []
-    all_text = ""
-
-    for msg in messages:
-        content_types[msg.get('message_type', 'text')] += 1
+    name = 'engagement'
+    mergeable = True
 
-        text = msg.get('text', '')
-        if text:
-            text_messages.append(text)
-            all_text += " " + text
-
-            url_count += len(url_pattern.findall(text))
-            mention_count += len(mention_pattern.findall(text))
-            hashtag_count += len(hashtag_pattern.findall(text))
-
-            emojis = emoji_pattern.findall(text)
-            for e in emojis:
-                for char in e:
-                    emoji_freq[char] += 1
-
-            clean_text = url_pattern.sub('', text)
-            clean_text = mention_pattern.sub('', clean_text)
-            clean_text = hashtag_pattern.sub('', clean_text)
-            clean_text = emoji_pattern.sub('', clean_text)
-            words = re.findall(r'\b\w{3,}\b', clean_text.lower())
-            word_freq.update(words)
-
-    # Стоп-слова
-    stop_words = {
-        'the', 'and', 'for', 'that', 'this', 'with', 'you', 'are', 'have', 'was',
-        'but', 'not', 'can', 'что', 'это', 'как', 'для', 'все', 'так', 'его',
-        'она', 'они', 'мне', 'вот', 'уже', 'еще', 'ещё', 'там', 'тут', 'где',
-        'или', 'если', 'при', 'про', 'чтобы', 'только', 'будет',
-    }
-    for sw in stop_words:
-        word_freq.pop(sw, None)
-
-    return {
-        'content_type_distribution': dict(content_types),
-        'total_text_messages': len(text_messages),
-        'total_characters': len(all_text),
-        'url_count': url_count,
-        'mention_count': mention_count,
-        'hashtag_count': hashtag_count,
-        'top_words': dict(word_freq.most_common(50)),
-        'top_emojis': dict(emoji_freq.most_common(20)),
-        'avg_message_length': len(all_text) / max(len(text_messages), 1),
-    }
+    def __init__(self):
+        self.total_reactions = 0
+        self.total_views = 0
+        self.total_forwards = 0
+        self.reaction_types = Counter()
+        self.messages_with_reactions = 0
+        self.messages_with_views = 0
+        self.message_count = 0
 
+    def update(self, msg, dt):
+        self.message_count += 1
 
-def _analyze_engagement(messages):
-    """Анализ вовлеченности: реакции, просмотры, пересылки."""
-    total_reactions = 0
-    total_views = 0
-    total_forwards = 0
-    reaction_types = Counter()
-    messages_with_reactions = 0
-    messages_with_views = 0
-
-    for msg in messages:
         reactions = msg.get('reactions', [])
         if reactions:
-            messages_with_reactions += 1
+            self.messages_with_reactions += 1
             for r in reactions:
                 count = r.get('count', 1)
-                total_reactions += count
+                self.total_reactions += count
                 emoji = r.get('emoticon', r.get('reaction', '?'))
-                reaction_types[emoji] += count
+                self.reaction_types[emoji] += count
 
         views = msg.get('views')
         if views:
-            messages_with_views += 1
-            total_views += views
+            self.messages_with_views += 1
+            self.total_views += views
 
         forwards = msg.get('forwards')
         if forwards:
-            total_forwards += forwards
-
-    return {
-        'total_reactions': total_reactions,
-        'total_views': total_views,
-        'total_forwards': total_forwards,
-        'messages_with_reactions': messages_with_reactions,
-        'messages_with_views': messages_with_views,
-        'reaction_types': dict(reaction_types.most_common(20)),
-        'avg_reactions_per_message': total_reactions / max(len(messages), 1),
-        'avg_views_per_message': total_views / max(messages_with_views, 1) if messages_with_views else 0,
+            self.total_forwards += forwards
+
+    def finalize(self):
+        return {
+            'total_reactions': self.total_reactions,
+            'total_views': self.total_views,
+            'total_forwards': self.total_forwards,
+            'messages_with_reactions': self.messages_with_reactions,
+            'messages_with_views': self.messages_with_views,
+            'reaction_types': dict(self.reaction_types.most_common(20)),
+            'avg_reactions_per_message': self.total_reactions / max(self.message_count, 1),
+            'avg_views_per_message': self.total_views / max(self.messages_with_views, 1) if self.messages_with_views else 0,
+        }
+
+    _FIELDS = ('total_reactions', 'total_views', 'total_forwards',
+               'messages_with_reactions', 'messages_with_views', 'message_count')
+
+    def merge(self, other):
+        for key in self._FIELDS:
+            setattr(self, key, getattr(self, key) + getattr(other, key))
+        self.reaction_types.update(other.reaction_types)
+
+    def get_state(self):
+        state = {key: getattr(self, key) for key in self._FIELDS}
+        state['reaction_types'] = _pairs(self.reaction_types)
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        analyzer = cls()
+        for key in cls._FIELDS:
+            setattr(analyzer, key, state[key])
+        analyzer.reaction_types = Counter(dict(state['reaction_types']))
+        return analyzer
+
+
+# Зарегистрированные анализаторы, в порядке вывода
+ANALYZERS = [TopicAnalyzer, ParticipantAnalyzer, TemporalAnalyzer, ContentAnalyzer, EngagementAnalyzer]
+
+# Диапазонов на процесс пула (--workers): запас на неравные диапазоны
+RANGES_PER_WORKER = 2
+
+
+def _analyze_range(path, names, bounds, min_id):
+    """
+    Прогнать свежие анализаторы names по диапазону экспорта bounds
+    (от store.split); выполняется в процессе пула, который сам читает и
+    разбирает свой диапазон файла. Возвращает состояния анализаторов
+    (get_state) и сводку диапазона: число сообщений, наименьший и
+    наибольший id и есть ли ответы на более поздние id.
+    """
+    classes = {cls.name: cls for cls in ANALYZERS}
+    analyzers = [classes[name]() for name in names]
+    count, low, high, forward = 0, None, 0, False
+    for msg in open_export(path).iter_range(bounds, min_id):
+        dt = parse_date(msg.get('date'))
+        for analyzer in analyzers:
+            analyzer.update(msg, dt)
+        msg_id = msg['id']
+        count += 1
+        if low is None or msg_id < low:
+            low = msg_id
+        if msg_id > high:
+            high = msg_id
+        reply_to = msg.get('reply_to')
+        if reply_to and (reply_to.get('message_id') or 0) >= msg_id:
+            forward = True
+    summary = {'count': count, 'min_id': low, 'max_id': high, 'forward': forward}
+    return [analyzer.get_part() for analyzer in analyzers], summary
+
+
+class AnalysisEngine:
+    """
+    Один потоковый проход: каждое сообщение разбирается один раз и
+    передается всем зарегистрированным анализаторам.
+
+    Состояние движка (анализаторы + id последнего обработанного сообщения)
+    сохраняется в *_analysis_state.json; следующий запуск загружает его и
+    обрабатывает только сообщения, добавленные с тех пор.
+    """
+
+    def __init__(self, analyzers=None):
+        self.analyzers = analyzers if analyzers is not None else [cls() for cls in ANALYZERS]
+        self.message_count = 0
+        self.last_id = 0
+
+    def feed(self, messages):
+        """Обработать поток сообщений одним проходом; вернуть число обработанных."""
+        count = 0
+        for msg in messages:
+            dt = parse_date(msg.get('date'))
+            for analyzer in self.analyzers:
+                analyzer.update(msg, dt)
+            if msg['id'] > self.last_id:
+                self.last_id = msg['id']
+            count += 1
+            if count % 100000 == 0:
+                print(f"  Обработано {count} сообщений...")
+        self.message_count += count
+        return count
+
+    def feed_store(self, store, workers=1, min_id=0, position=None):
+        """
+        Обработать сообщения экспорта store с id > min_id (с позиции position).
+
+        С workers > 1 экспорт делится на диапазоны (store.split: байты
+        JSONL и JSON, id в SQLite); каждый процесс пула сам читает и
+        разбирает свой диапазон и возвращает только результаты анализаторов,
+        которые сливаются (merge) строго в порядке диапазонов — итог
+        совпадает с одним проходом. Анализаторы с ordered_merge сливаются,
+        только если диапазоны идут по возрастанию id без пересечений и без
+        ответов вперед; иначе они досчитываются здесь же одним проходом.
+        JSON не в раскладке write_json_export читается одним проходом.
+        """
+        ranges = store.split(workers * RANGES_PER_WORKER, min_id=min_id, position=position) \
+            if workers > 1 else None
+        if not ranges:
+            return self.feed(store.iter_messages(min_id=min_id, position=position))
+
+        names = [analyzer.name for analyzer in self.analyzers if analyzer.mergeable]
+        merged = [analyzer for analyzer in self.analyzers if analyzer.mergeable]
+        ordered = []
+        exact = True
+        count = 0
+        last_id = self.last_id
+        with ProcessPoolExecutor(min(workers, len(ranges))) as executor:
+            results = executor.map(_analyze_range, [store.path] * len(ranges), [names] * len(ranges),
+                                   ranges, [min_id] * len(ranges))
+            for parts, summary in results:
+                if summary['count']:
+                    exact = exact and not summary['forward'] and summary['min_id'] > last_id
+                    last_id = max(last_id, summary['max_id'])
+                for analyzer, part in zip(merged, parts):
+                    partial = type(analyzer).from_part(part)
+                    if analyzer.ordered_merge:
+                        ordered.append((analyzer, partial))
+                    else:
+                        analyzer.merge(partial)
+                count += summary['count']
+                print(f"  Обработано {count} сообщений...")
+
+        local = [analyzer for analyzer in self.analyzers if not analyzer.mergeable]
+        if exact:
+            for analyzer, partial in ordered:
+                analyzer.merge(partial)
+        else:
+            local += [analyzer for analyzer in merged if analyzer.ordered_merge]
+        if local:
+            print(f"  Одним проходом: {', '.join(analyzer.name for analyzer in local)}")
+            for msg in store.iter_messages(min_id=min_id, position=position):
+                dt = parse_date(msg.get('date'))
+                for analyzer in local:
+                    analyzer.update(msg, dt)
+
+        self.last_id = last_id
+        self.message_count += count
+        return count
+
+    def feed_columnar(self, store):
+        """
+        Полный анализ SQLite-экспорта в колоночном режиме (tg_export.columnar):
+        участники, время и вовлеченность считаются по колонкам, остальные
+        анализаторы получают сообщения из того же запроса. Вызывается на
+        свежем движке; вернуть число обработанных сообщений.
+        """
+        local = [analyzer for analyzer in self.analyzers if analyzer.name not in columnar.NAMES]
+        states, count, last_id = columnar.analyze(store, local)
+        self.analyzers = [type(analyzer).from_state(states[analyzer.name]) if analyzer.name in states
+                          else analyzer for analyzer in self.analyzers]
+        self.last_id = max(self.last_id, last_id)
+        self.message_count += count
+        return count
+
+    def finalize(self):
+        """Итоги всех анализаторов: {name: результат}."""
+        return {analyzer.name: analyzer.finalize() for analyzer in self.analyzers}
+
+    def get_state(self):
+        return {
+            'version': STATE_VERSION,
+            'message_count': self.message_count,
+            'last_id': self.last_id,
+            'analyzers': {analyzer.name: analyzer.get_state() for analyzer in self.analyzers},
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        engine = cls([klass.from_state(state['analyzers'][klass.name]) for klass in ANALYZERS])
+        engine.message_count = state['message_count']
+        engine.last_id = state['last_id']
+        return engine
+
+
+def _load_state(state_path, store):
+    """Загрузить сохраненное состояние анализа, если оно подходит к экспорту."""
+    if not os.path.exists(state_path):
+        return None
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = jsonio.load(f)
+    except (OSError, ValueError):
+        return None
+
+    info = get_export_info(store.header)
+    if (not isinstance(state, dict)
+            or state.get('version') != STATE_VERSION
+            or state.get('format') != store.format
+            or state.get('export_id') != info['id']
+            or state.get('engine', {}).get('message_count', 0) > store.count()):
+        return None
+    return state
+
+
+def _save_state(state_path, store, engine):
+    state = {
+        'format': store.format,
+        'export_id': get_export_info(store.header)['id'],
+        'position': store.position(),
+        'engine': engine.get_state(),
     }
-
-
-def _extract_topic_summaries(topics, message_map):
-    """Саммари по каждому топику/треду."""
-    summaries = []
-
-    for root_id, thread_messages in topics.items():
-        root_msg = message_map.get(root_id, {})
-        participants = set()
-        for msg in thread_messages:
-            sender = msg.get('sender')
-            if sender:
-                participants.add(sender.get('id'))
-
-        dates = []
-        for msg in thread_messages:
-            if msg.get('date'):
-                try:
-                    dates.append(datetime.fromisoformat(msg['date'].replace('Z', '+00:00')))
-                except (ValueError, TypeError):
-                    pass
-
-        first_text = ""
-        for msg in sorted(thread_messages, key=lambda x: x.get('id', 0)):
-            if msg.get('text') and len(msg['text']) > 5:
-                first_text = msg['text'][:200]
-                break
-
-        summaries.append({
-            'root_id': root_id,
-            'message_count': len(thread_messages),
-            'participant_count': len(participants),
-            'first_date': min(dates).isoformat() if dates else None,
-            'last_date': max(dates).isoformat() if dates else None,
-            'duration_hours': (max(dates) - min(dates)).total_seconds() / 3600 if len(dates) > 1 else 0,
-            'preview': first_text,
-            'root_sender': root_msg.get('sender', {}).get('first_name', 'Unknown') if root_msg.get('sender') else 'System',
-        })
-
-    summaries.sort(key=lambda x: x['message_count'], reverse=True)
-    return summaries
+    state['version'] = STATE_VERSION
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        jsonio.dump(state, f)
+    os.replace(tmp_path, state_path)
 
 
 def _generate_report(data, output_path):
@@ -464,42 +1184,61 @@ def run(args):
     output_file = args.output
 
     print("Загрузка данных...")
-    with open(json_path, 'r', encoding='utf-8') as f:
-        export_data = json.load(f)
+    store = open_export(json_path)
+    export_data = store.header
 
     info = get_export_info(export_data)
-    messages = export_data.get('messages', [])
-    total_messages = export_data.get('total_messages', len(messages))
-
     print(f"Источник: {info['name']}")
-    print(f"Сообщений: {total_messages}")
-
-    message_map = {m['id']: m for m in messages}
-
-    print("\nАнализ топиков...")
-    topics = _analyze_topics(messages)
-    print(f"Топиков: {len(topics)}")
-
-    print("Анализ участников...")
-    participants = _analyze_participants(messages)
+    if 'total_messages' in export_data:
+        print(f"Сообщений: {export_data['total_messages']}")
+
+    use_columnar = getattr(args, 'columnar', False)
+    if use_columnar and not columnar.supports(store):
+        print("Колоночный режим доступен только для SQLite-экспорта с датами export; обычный проход")
+        use_columnar = False
+
+    state_path = derived_path(json_path, '_analysis_state.json')
+    # Инкрементальный режим: продолжить с сохраненного состояния
+    state = None if args.full or use_columnar else _load_state(state_path, store)
+    if state:
+        engine = AnalysisEngine.from_state(state['engine'])
+        print(f"\nСостояние прошлого анализа: {engine.message_count} сообщений, "
+              f"последний ID {engine.last_id}")
+        min_id, position = engine.last_id, state.get('position')
+    else:
+        engine = AnalysisEngine()
+        min_id, position = 0, None
+
+    workers = getattr(args, 'workers', 1) or 1
+    if workers > 1 and not use_columnar:
+        print(f"Процессов: {workers}")
+
+    print("\nАнализ (топики, участники, время, контент, вовлеченность)...")
+    if use_columnar:
+        print("Колоночный режим: участники, время и вовлеченность считаются по колонкам SQLite")
+        new_count = engine.feed_columnar(store)
+    else:
+        new_count = engine.feed_store(store, workers=workers, min_id=min_id, position=position)
+    if state:
+        print(f"Новых сообщений: {new_count}")
+    _save_state(state_path, store, engine)
+
+    results = engine.finalize()
+    total_messages = export_data.get('total_messages', engine.message_count)
+
+    topic_count = results['topics']['topic_count']
+    topic_summaries = results['topics']['topic_summaries']
+    participants = results['participants']
+    temporal = results['temporal']
+    content = results['content']
+    engagement = results['engagement']
+    print(f"Топиков: {topic_count}")
     print(f"Участников: {len(participants)}")
 
-    print("Временной анализ...")
-    temporal = _analyze_temporal(messages)
-
-    print("Анализ контента...")
-    content = _analyze_content(messages)
-
-    print("Анализ вовлеченности...")
-    engagement = _analyze_engagement(messages)
-
-    print("Формирование саммари топиков...")
-    topic_summaries = _extract_topic_summaries(topics, message_map)
-
     analysis_data = {
         'total_messages': total_messages,
         'participant_count': len(participants),
-        'topic_count': len(topics),
+        'topic_count': topic_count,
         'participants': participants,
         'temporal': temporal,
         'content': content,
@@ -516,14 +1255,14 @@ def run(args):
             break
 
     # Сохраняем JSON-аналитику
-    analysis_json_path = json_path.replace('.json', '_analysis.json')
+    analysis_json_path = derived_path(json_path, '_analysis.json')
     with open(analysis_json_path, 'w', encoding='utf-8') as f:
-        json.dump(analysis_data, f, ensure_ascii=False, indent=2, default=str)
+        jsonio.dump(analysis_data, f, indent=not getattr(args, 'compact', False), default=str)
     print(f"\nАналитика: {analysis_json_path}")
 
     # Генерируем markdown-отчет
     if not output_file:
-        output_file = json_path.replace('.json', '_report.md')
+        output_file = derived_path(json_path, '_report.md')
     _generate_report(analysis_data, output_file)
 
     # Итоги
@@ -532,7 +1271,7 @@ def run(args):
     print(f"{'='*60}")
     print(f"Сообщений: {total_messages}")
     print(f"Участников: {len(participants)}")
-    print(f"Топиков: {len(topics)}")
+    print(f"Топиков: {topic_count}")
     print(f"Активных дней: {temporal['total_active_days']}")
     print(f"Пиковый час: {temporal['peak_hour']}:00")
 
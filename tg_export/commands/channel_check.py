@@ -8,12 +8,13 @@ from telethon.tl.functions.users import GetFullUserRequest
 from telethon.tl.types import PeerChannel
 
 from tg_export.client import create_client, ensure_authorized
+from tg_export.entities import EntityCache, resolve_entity
 
 
 async def _get_user_entity(client, identifier):
     """Получить пользователя по ID или username."""
     try:
-        entity = await client.get_entity(identifier)
+        entity = await resolve_entity(client, identifier, EntityCache.open())
         if isinstance(entity, User):
             return entity
     except Exception as e:
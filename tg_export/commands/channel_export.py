@@ -1,7 +1,6 @@
 """Полный экспорт Telegram канала: посты в JSON и TXT с информацией о подписчиках."""
 
 import os
-import json
 import asyncio
 from datetime import datetime
 
@@ -10,13 +9,16 @@ from telethon.tl.functions.channels import GetFullChannelRequest
 
 from tg_export import config
 from tg_export.client import create_client, ensure_authorized
-from tg_export.serializers import serialize_message
+from tg_export.serializers import serialize_record
+from tg_export.records import SenderTable
+from tg_export.writers import write_json_export
 from tg_export.utils import sanitize_filename
+from tg_export.entities import EntityCache, resolve_entity, peer_info
 
 
 async def _get_channel_info(client, channel_identifier):
     """Получить полную информацию о канале."""
-    entity = await client.get_entity(channel_identifier)
+    entity = await resolve_entity(client, channel_identifier, EntityCache.open())
 
     if not isinstance(entity, Channel):
         print(f"{channel_identifier} не является каналом")
@@ -31,6 +33,7 @@ async def _get_channel_info(client, channel_identifier):
         "about": full_channel.full_chat.about,
         "participants_count": full_channel.full_chat.participants_count,
         "created_date": entity.date.isoformat() if hasattr(entity, 'date') and entity.date else None,
+        "peer": peer_info(entity),
         "export_date": datetime.now().isoformat(),
     }
 
@@ -82,10 +85,11 @@ async def _channel_export(args):
         print(f"\nЗагрузка сообщений...")
         messages = []
         count = 0
+        senders = SenderTable()
 
         async for message in client.iter_messages(channel_entity, limit=None):
             count += 1
-            messages.append(serialize_message(message))
+            messages.append(serialize_record(message, senders=senders))
             if count % 100 == 0:
                 print(f"  Загружено {count} сообщений...")
 
@@ -95,13 +99,11 @@ async def _channel_export(args):
         # JSON
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         json_path = os.path.join(output_dir, f"messages_{timestamp}.json")
-        data = {
+        header = {
             "channel_info": channel_info,
             "total_messages": len(messages),
-            "messages": messages,
         }
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        write_json_export(json_path, header, (msg.to_dict() for msg in messages))
         print(f"\nJSON: {json_path}")
 
         # TXT
@@ -117,17 +119,17 @@ async def _channel_export(args):
             f.write("=" * 80 + "\n\n")
 
             for msg in messages:
-                if msg['text']:
-                    f.write(f"[#{msg['id']}]\n")
-                    f.write(f"Дата: {msg['date']}\n")
-                    if msg.get('views'):
-                        f.write(f"Просмотров: {msg['views']}\n")
-                    if msg.get('forwards'):
-                        f.write(f"Пересылок: {msg['forwards']}\n")
-                    if msg.get('reactions'):
-                        reactions_str = ", ".join([f"{r['emoticon']}: {r['count']}" for r in msg['reactions']])
+                if msg.text:
+                    f.write(f"[#{msg.id}]\n")
+                    f.write(f"Дата: {msg.date}\n")
+                    if msg.views:
+                        f.write(f"Просмотров: {msg.views}\n")
+                    if msg.forwards:
+                        f.write(f"Пересылок: {msg.forwards}\n")
+                    if msg.reactions:
+                        reactions_str = ", ".join([f"{emoticon}: {count}" for emoticon, count in msg.reactions])
                         f.write(f"Реакции: {reactions_str}\n")
-                    f.write(f"\n{msg['text']}\n")
+                    f.write(f"\n{msg.text}\n")
                     f.write("-" * 80 + "\n\n")
 
         print(f"TXT: {txt_path}")
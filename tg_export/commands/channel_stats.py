@@ -1,7 +1,6 @@
 """Аналитический отчет по Telegram каналу: просмотры, реакции, пересылки."""
 
 import os
-import json
 import asyncio
 from datetime import datetime
 from collections import Counter, defaultdict
@@ -9,14 +8,15 @@ from collections import Counter, defaultdict
 from telethon.tl.types import Channel
 from telethon.tl.functions.channels import GetFullChannelRequest
 
-from tg_export import config
+from tg_export import config, jsonio
 from tg_export.client import create_client, ensure_authorized
 from tg_export.utils import sanitize_filename
+from tg_export.entities import EntityCache, resolve_entity
 
 
 async def _get_channel_info(client, channel_identifier):
     """Получить полную информацию о канале."""
-    entity = await client.get_entity(channel_identifier)
+    entity = await resolve_entity(client, channel_identifier, EntityCache.open())
     if not isinstance(entity, Channel):
         print(f"{channel_identifier} не является каналом")
         return None
@@ -245,7 +245,7 @@ async def _channel_stats(args):
             "all_messages": all_messages,
         }
         with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, ensure_ascii=False, indent=2)
+            jsonio.dump(json_data, f, indent=True)
         print(f"Статистика JSON: {json_path}")
 
         # Итого
@@ -1,41 +1,46 @@
 """Докачка недостающих медиа-файлов для существующего экспорта."""
 
 import os
-import json
 import asyncio
 
 from tg_export import config
 from tg_export.client import create_client, ensure_authorized
-from tg_export.schemas import get_info_key
+from tg_export.storage import open_export
+from tg_export.entities import EntityCache, peer_from_info
+from tg_export.media import MediaDownloader, MediaFilter, is_downloadable, iter_messages_by_ids
+from tg_export.manifest import MediaManifest
+from tg_export.media_store import open_media_store
 
 
 async def _download_media(args):
     """Основная логика докачки медиа."""
     json_path = args.json_path
 
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    info_key = get_info_key(data)
+    store = open_export(json_path)
+    header = store.header
+    info_key = store.info_key
     if not info_key:
         print("Ошибка: файл не содержит метаданных экспорта")
         return
 
-    chat_id = data[info_key]['id']
-
     export_dir = os.path.dirname(json_path)
     media_dir = os.path.join(export_dir, "media")
     os.makedirs(media_dir, exist_ok=True)
 
-    # Найти сообщения с media_file, но без файла на диске
+    # Найти сообщения с media_file, но без файла на диске: разность множеств
+    # по манифесту папки, без stat на каждый файл
+    manifest = MediaManifest(media_dir)
+    if args.verify:
+        print("Сверка манифеста с папкой медиа...")
+        manifest.rebuild()
+    present = manifest.files()
     missing = []
-    for msg in data['messages']:
-        if msg.get('media_file'):
-            file_path = os.path.join(media_dir, msg['media_file'])
-            if not os.path.exists(file_path):
-                missing.append(msg)
+    total_with_media = 0
+    for msg_id, media_file in store.iter_media():
+        total_with_media += 1
+        if media_file not in present:
+            missing.append({'id': msg_id, 'media_file': media_file})
 
-    total_with_media = sum(1 for m in data['messages'] if m.get('media_file'))
     print(f"Сообщений с медиа: {total_with_media}")
     print(f"Недостающих файлов: {len(missing)}")
 
@@ -48,38 +53,53 @@ async def _download_media(args):
     try:
         me = await ensure_authorized(client)
 
-        chat_identifier = int(f"-100{chat_id}")
-        chat = await client.get_entity(chat_identifier)
-        chat_name = data[info_key].get('title') or data[info_key].get('name')
+        # Пир из заголовка экспорта, без разрешения по сети
+        chat = await peer_from_info(client, header[info_key], EntityCache.open())
+        chat_name = header[info_key].get('title') or header[info_key].get('name')
         print(f"Докачка медиа для: {chat_name}")
-
-        downloaded = 0
-        failed = 0
-
-        for i, msg_data in enumerate(missing):
-            msg_id = msg_data['id']
-            try:
-                message = await client.get_messages(chat_identifier, ids=msg_id)
-                if message and message.media:
-                    file_path = await client.download_media(message, file=media_dir)
-                    if file_path and os.path.exists(file_path):
-                        downloaded += 1
-                        print(f"  [{i+1}/{len(missing)}] Скачано: {os.path.basename(file_path)}")
+        media_filter = MediaFilter.from_args(args)
+        if media_filter.describe():
+            print(f"Фильтр медиа: {media_filter.describe()}")
+
+        # id разрешаются пачками по 100 за запрос; найденные сообщения сразу
+        # уходят в пул загрузки, который подстраивает темп под FLOOD_WAIT
+        rate = int(args.media_rate * 1024 * 1024) if args.media_rate else None
+        downloader = MediaDownloader(client, media_dir, workers=args.media_workers, rate_limit=rate,
+                                     manifest=manifest, store=open_media_store(args.media_store),
+                                     thumbnails=media_filter.thumbnails)
+        downloader.start()
+        skipped = 0
+        filtered = 0
+        try:
+            names = {msg_data['id']: msg_data['media_file'] for msg_data in missing}
+            async for msg_id, message in iter_messages_by_ids(client, chat, names):
+                if message and media_filter.accepts(message):
+                    if media_filter.thumbnails:
+                        # Миниатюра — отдельный файл *_thumb.jpg: под именем из экспорта
+                        # она выдала бы себя за сам файл (в манифесте и хранилище)
+                        thumb_name = media_filter.filename(message)
+                        if thumb_name not in present:
+                            await downloader.submit(message, thumb_name)
                     else:
-                        failed += 1
-                        print(f"  [{i+1}/{len(missing)}] Не удалось: сообщение {msg_id}")
+                        # Имя файла — то, что записано в экспорте
+                        await downloader.submit(message, names[msg_id])
+                elif message and is_downloadable(message):
+                    filtered += 1
                 else:
-                    failed += 1
-                    print(f"  [{i+1}/{len(missing)}] Пропущено (нет медиа): сообщение {msg_id}")
-            except Exception as e:
-                failed += 1
-                print(f"  [{i+1}/{len(missing)}] Ошибка сообщение {msg_id}: {e}")
-
-            # Пауза для избежания rate limit
-            if i % 10 == 9:
-                await asyncio.sleep(1)
-
-        print(f"\nГотово! Скачано: {downloaded}, Не удалось: {failed}")
+                    skipped += 1
+                    print(f"  Пропущено (нет медиа): сообщение {msg_id}")
+            await downloader.join()
+        finally:
+            await downloader.cancel()
+
+        for msg_id in sorted(downloader.failed):
+            print(f"  Не удалось: сообщение {msg_id}")
+        failed = len(downloader.failed) + skipped
+        print(f"\nГотово! Скачано: {downloader.downloaded}, Не удалось: {failed}")
+        if filtered:
+            print(f"Пропущено фильтром: {filtered}")
+        if downloader.store is not None:
+            print(f"Из общего хранилища (без скачивания): {downloader.reused}")
 
     finally:
         await client.disconnect()
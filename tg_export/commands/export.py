@@ -1,150 +1,409 @@
 """Универсальный экспорт сообщений из любого источника Telegram."""
 
 import os
-import json
 import asyncio
 from datetime import datetime, timedelta, timezone
 
-from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument
-
 from tg_export import config
 from tg_export.client import create_client, ensure_authorized
-from tg_export.utils import parse_source, sanitize_filename, get_entity_name
+from tg_export.utils import parse_source, sanitize_filename, get_entity_name, parse_day
 from tg_export.serializers import (
-    serialize_message, format_message_text, format_message_markdown, get_media_filename,
+    serialize_record, format_message_text, format_message_markdown,
 )
-from tg_export.schemas import make_entity_info
+from tg_export.records import MessageRecord, SenderTable
+from tg_export.schemas import make_entity_info, compact_message, JSON_FORMAT_VERSION
+from tg_export.media import MediaDownloader, MediaFilter, iter_messages_by_ids
+from tg_export.writers import MessageSpool, write_json_export
+from tg_export.checkpoint import ExportJournal
+from tg_export.manifest import MediaManifest
+from tg_export.media_store import open_media_store
+from tg_export.ratelimit import TokenBucket
+from tg_export.entities import EntityCache, resolve_entity
+from tg_export.storage import JsonlExport
+from tg_export.sqlite_storage import SqliteExport
+
+# Запросов истории в секунду на все шарды вместе (--shards без --rate)
+DEFAULT_SHARD_RATE = 5.0
+
+
+def _resolve_media(records, output_format, failed):
+    """
+    Подставить итог скачивания медиа в записи спула.
+
+    Имя файла известно заранее (get_media_filename), поэтому записи попадают
+    в спул до окончания скачивания; для неудачных загрузок ссылка убирается.
+    Для json/jsonl/sqlite записи спула — MessageRecord.to_row(), на выходе
+    словари serialize_message. Markdown-записи с медиа хранятся как
+    [id, с медиа, без медиа].
+    """
+    senders = SenderTable()
+    for record in records:
+        if output_format in ("json", "jsonl", "sqlite"):
+            record = MessageRecord.from_row(record, senders)
+            if record.media_file and record.id in failed:
+                record.media_file = None
+            record = record.to_dict()
+        elif isinstance(record, list):
+            msg_id, with_media, without_media = record
+            record = without_media if msg_id in failed else with_media
+        yield record
+
+
+def _collect_senders(spool):
+    """
+    Таблица отправителей для JSON версии 2: отдельный проход по спулу до
+    записи файла, чтобы таблица стояла в заголовке перед messages.
+    Записи идут по возрастанию id, поэтому для каждого отправителя
+    остается самый свежий профиль.
+    """
+    senders = {}
+    for row in spool:
+        sender = row[7]
+        if sender is not None:
+            senders[sender[0]] = {
+                "id": sender[0],
+                "first_name": sender[1],
+                "last_name": sender[2],
+                "username": sender[3],
+                "phone": sender[4],
+            }
+    return list(senders.values())
 
 
-async def _download_media_file(client, message, media_dir):
-    """Скачать медиа из сообщения, вернуть имя файла."""
-    if not message.media:
-        return None
-    if not isinstance(message.media, (MessageMediaPhoto, MessageMediaDocument)):
-        return None
+def split_shards(first, last, count):
+    """Разбить диапазон ID [first, last] на count частей: [[первый, последний, None], ...]."""
+    if last < first:
+        return []
+    count = max(1, min(count, last - first + 1))
+    step = (last - first + 1) / count
+    bounds = [first + round(step * i) for i in range(count)] + [last + 1]
+    return [[bounds[i], bounds[i + 1] - 1, None] for i in range(count)]
 
-    filename = get_media_filename(message)
-    filepath = os.path.join(media_dir, filename)
 
-    try:
-        await client.download_media(message, filepath)
-        return filename
-    except Exception as e:
-        print(f"  Не удалось скачать медиа из сообщения {message.id}: {e}")
-        return None
+async def _top_message_id(client, entity):
+    """ID самого нового сообщения (0, если история пуста)."""
+    messages = await client.get_messages(entity, limit=1)
+    return messages[0].id if messages else 0
 
 
-async def _export(args):
-    """Основная логика экспорта."""
+def entity_export_dir(entity):
+    """Папка экспорта источника: exports/<имя сущности>."""
+    return os.path.join(config.EXPORT_DIR, sanitize_filename(get_entity_name(entity)))
+
+
+async def export_source(client, args, limiter=None, media_limiter=None, media_store=None,
+                        entity_cache=None, media_flood=None, entity=None, log=print):
+    """
+    Экспорт одного источника через уже подключенный клиент.
+
+    Используется командой export и параллельно для многих источников
+    командой export-batch: limiter — общий TokenBucket запросов истории
+    (один токен на пачку из 100 сообщений), media_limiter — общий
+    TokenBucket трафика медиа, media_store — общий MediaStore (по умолчанию
+    из --media-store / MEDIA_STORE), entity_cache — общий EntityCache,
+    media_flood — общий FloodGate загрузчиков медиа, entity — уже
+    разрешенный источник, log — вывод с префиксом источника.
+
+    С --shards K диапазон ID [1, последнее сообщение] (или --min-id/--max-id)
+    делится на K частей, которые загружаются параллельно; порядок
+    восстанавливает слияние прогонов спула, как и при обычной загрузке.
+
+    Returns:
+        (путь к файлу экспорта, число сообщений).
+    """
     source = args.source
     output_format = args.format
     output_file = args.output
     topic_id = args.topic
     download_media = args.media
     days = args.days
-
-    identifier, source_type, parsed_topic = parse_source(source)
+    since, until = args.since, args.until
+    min_id, max_id = args.min_id, args.max_id
+    media_workers = args.media_workers
+    media_rate = args.media_rate
+    inline_senders = args.inline_senders
+    compact_json = getattr(args, "compact", False)
+    media_filter = MediaFilter.from_args(args)
+    shard_count = args.shards
+    request_rate = args.rate
+
+    identifier, _, parsed_topic = parse_source(source)
     topic_id = topic_id or parsed_topic
 
-    print(f"\n{'='*60}")
-    print(f"Экспорт сообщений Telegram")
-    print(f"{'='*60}")
-    print(f"Источник: {source}")
-    print(f"Тип: {source_type}")
-    print(f"Формат: {output_format}")
-    if topic_id:
-        print(f"Топик: #{topic_id}")
-    if days:
-        print(f"Период: последние {days} дней")
-
-    client = create_client()
-
-    try:
-        me = await ensure_authorized(client)
-
-        # Получить сущность
+    # Получить сущность
+    if entity is None:
         try:
-            entity = await client.get_entity(identifier)
+            entity = await resolve_entity(client, identifier, entity_cache or EntityCache.open())
         except Exception as e:
-            print(f"Ошибка получения источника: {e}")
+            log(f"Ошибка получения источника: {e}")
             raise
 
-        entity_name = get_entity_name(entity)
-        print(f"\nИсточник: {entity_name}")
-        print(f"ID: {entity.id}")
-        print(f"Тип: {type(entity).__name__}")
-
-        # Фильтр по дате
-        cutoff_date = None
-        if days:
-            cutoff_date = datetime.now(timezone.utc) - timedelta(days=days)
-            print(f"Сообщения после: {cutoff_date.strftime('%Y-%m-%d %H:%M')}")
-
-        # Загрузка сообщений
-        print(f"\nЗагрузка сообщений...")
-        messages = []
-        count = 0
-
-        iter_kwargs = {"limit": None}
-        if topic_id:
-            iter_kwargs["reply_to"] = topic_id
-
-        async for message in client.iter_messages(entity, **iter_kwargs):
-            # Стоп при выходе за период
-            if cutoff_date and message.date and message.date < cutoff_date:
-                break
-
-            count += 1
-            messages.append(message)
-            if count % 500 == 0:
-                print(f"  Загружено {count} сообщений...")
-
-        print(f"Всего сообщений: {count}")
-
-        # Хронологический порядок
-        messages.reverse()
-
-        # Подготовка директорий
-        os.makedirs(config.EXPORT_DIR, exist_ok=True)
-        safe_name = sanitize_filename(entity_name)
-        entity_dir = os.path.join(config.EXPORT_DIR, safe_name)
-        os.makedirs(entity_dir, exist_ok=True)
-
-        # Скачивание медиа
-        media_files = {}
-        if download_media:
-            media_dir = os.path.join(entity_dir, "media")
-            os.makedirs(media_dir, exist_ok=True)
-            print(f"\nСкачивание медиа в: {media_dir}")
-            media_count = 0
-            for msg in messages:
-                if msg.media and isinstance(msg.media, (MessageMediaPhoto, MessageMediaDocument)):
-                    filename = await _download_media_file(client, msg, media_dir)
-                    if filename:
-                        media_files[msg.id] = filename
-                        media_count += 1
-                        if media_count % 10 == 0:
-                            print(f"  Скачано {media_count} файлов...")
-            print(f"Медиа скачано: {media_count}")
+    entity_name = get_entity_name(entity)
+    log(f"\nИсточник: {entity_name}")
+    log(f"ID: {entity.id}")
+    log(f"Тип: {type(entity).__name__}")
+
+    # Подготовка директорий
+    os.makedirs(config.EXPORT_DIR, exist_ok=True)
+    entity_dir = entity_export_dir(entity)
+    os.makedirs(entity_dir, exist_ok=True)
+
+    # Журнал незавершенного экспорта
+    journal = ExportJournal.load(entity_dir)
+    if journal and args.resume:
+        params = journal.params
+        output_format = params['format']
+        output_file = params['output_file']
+        topic_id = params['topic_id']
+        download_media = params['media']
+        days = params['days']
+        since, until = params.get('since'), params.get('until')
+        min_id, max_id = params.get('min_id'), params.get('max_id')
+        inline_senders = params.get('inline_senders', False)
+        media_filter = MediaFilter.from_params(params.get('media_filter'))
+        shard_count = params.get('shards', 1)
+        request_rate = params.get('rate')
+        log(f"\nПродолжение экспорта: сохранено {journal.count} сообщений, "
+            f"последний ID {journal.last_id}")
+    else:
+        if journal:
+            log("\nНайден незавершенный экспорт (продолжить: --resume), начинаю заново")
+            journal.discard()
+        elif args.resume:
+            log("\nНезавершенный экспорт не найден, начинаю заново")
 
         # Имя файла
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         if not output_file:
-            ext = {"json": "json", "txt": "txt", "md": "md"}[output_format]
+            ext = {"json": "json", "jsonl": "jsonl", "sqlite": "sqlite", "txt": "txt", "md": "md"}[output_format]
             output_file = os.path.join(entity_dir, f"export_{timestamp}.{ext}")
 
+        cutoff_iso = None
+        if days:
+            cutoff_iso = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+
+        journal = ExportJournal(entity_dir, {
+            'source': source,
+            'format': output_format,
+            'output_file': output_file,
+            'topic_id': topic_id,
+            'media': download_media,
+            'days': days,
+            'cutoff_date': cutoff_iso,
+            'since': since,
+            'until': until,
+            'min_id': min_id,
+            'max_id': max_id,
+            'inline_senders': inline_senders,
+            'media_filter': media_filter.to_params(),
+            'shards': shard_count,
+            'rate': request_rate,
+        })
+
+    # Фильтр по дате
+    cutoff_date = None
+    if journal.params['cutoff_date']:
+        cutoff_date = datetime.fromisoformat(journal.params['cutoff_date'])
+        log(f"Сообщения после: {cutoff_date.strftime('%Y-%m-%d %H:%M')}")
+    since_date, until_date = parse_day(since), parse_day(until)
+    if since_date or until_date or min_id or max_id:
+        log(f"Окно: даты [{since or '...'}, {until or '...'}), ID [{min_id or '...'}, {max_id or '...'}]")
+
+    media_dir = None
+    if download_media:
+        media_dir = os.path.join(entity_dir, "media")
+        os.makedirs(media_dir, exist_ok=True)
+        log(f"\nМедиа будут сохранены в: {media_dir}")
+        if media_filter.describe():
+            log(f"Фильтр медиа: {media_filter.describe()}")
+
+    # Загрузка сообщений: каждое сразу сериализуется и уходит в дисковый спул,
+    # хронологический порядок восстанавливается слиянием прогонов.
+    # После каждого сброса спула фиксируется журнал для --resume.
+    log(f"\nЗагрузка сообщений...")
+    spool = MessageSpool(journal.directory, runs=journal.runs, count=journal.count)
+    downloader = None
+    if media_dir:
+        rate = int(media_rate * 1024 * 1024) if media_rate else None
+        if media_store is None:
+            media_store = open_media_store(args.media_store)
+        downloader = MediaDownloader(client, media_dir, workers=media_workers, rate_limit=rate,
+                                     limiter=media_limiter, log=log,
+                                     manifest=MediaManifest(media_dir), store=media_store,
+                                     thumbnails=media_filter.thumbnails, flood=media_flood)
+        downloader.failed.update(journal.media_failed)
+        downloader.start()
+
+        # Медиа, которое не успело скачаться до прерывания (кроме уже попавшего в манифест)
+        async for _, message in iter_messages_by_ids(client, entity, sorted(journal.media_pending), log=log):
+            if message and media_filter.accepts(message):
+                media_file = media_filter.filename(message)
+                if media_file not in downloader.manifest:
+                    await downloader.submit(message, media_file)
+
+    def commit(last_id):
+        if downloader:
+            journal.commit(spool, last_id, downloader.failed, downloader.pending, shards=shards)
+        else:
+            journal.commit(spool, last_id, shards=shards)
+
+    senders = SenderTable()
+    last_id = journal.last_id
+
+    async def add_message(message, shard=None):
+        """Сериализовать сообщение в спул; при сбросе спула зафиксировать журнал."""
+        nonlocal last_id
+
+        # Медиа скачивается пулом воркеров параллельно с загрузкой истории
+        media_file = None
+        if downloader and media_filter.accepts(message):
+            media_file = media_filter.filename(message)
+            # Скачанные файлы (в том числе до прерывания) записаны в манифесте папки
+            if media_file not in downloader.manifest:
+                await downloader.submit(message, media_file)
+
+        if output_format in ("json", "jsonl", "sqlite"):
+            record = serialize_record(message, media_file, senders)
+        elif output_format == "txt":
+            record = format_message_text(message)
+        elif media_file:
+            record = [
+                message.id,
+                format_message_markdown(message, media_file),
+                format_message_markdown(message),
+            ]
+        else:
+            record = format_message_markdown(message)
+        spool.add(message.id, record)
+        if shard is None:
+            last_id = message.id
+        else:
+            shard[2] = message.id
+            last_id = max(last_id or 0, message.id)
+
+        if spool.buffered == 0:
+            commit(last_id)
+
+        if len(spool) % 500 == 0:
+            log(f"  Загружено {len(spool)} сообщений...")
+
+    # Шардированная загрузка: диапазон ID делится на части, которые читаются
+    # параллельно независимыми курсорами под общим лимитером запросов
+    shards = journal.shards
+    if shards is None and shard_count > 1:
+        top_id = await _top_message_id(client, entity)
+        first = max(min_id or 1, 1)
+        last = min(max_id or top_id, top_id)
+        shards = split_shards(first, last, shard_count)
+        log(f"Шарды: {len(shards)} по ~{(last - first) // max(len(shards), 1) + 1} ID, "
+            f"до ID {last}")
+    if shards and limiter is None:
+        # И при продолжении (--resume): курсоры шардов всегда идут под общим лимитером
+        limiter = TokenBucket(request_rate or DEFAULT_SHARD_RATE)
+
+    async def fetch_shard(shard):
+        first, last, cursor = shard
+        kwargs = {"limit": None, "reverse": True, "min_id": first - 1, "max_id": last + 1}
+        if cursor:
+            kwargs["offset_id"] = cursor
+        fetched = 0
+        async for message in client.iter_messages(entity, **kwargs):
+            if limiter and fetched % 100 == 0:
+                await limiter.acquire()
+            fetched += 1
+            await add_message(message, shard)
+
+    # Окно истории задается на сервере. С нижней границей (--since, --min-id)
+    # история идет от старых к новым (reverse) начиная с нее и обрывается на
+    # верхней; иначе — от новых к старым начиная с --until / --max-id.
+    # Запросов столько, сколько сообщений в окне, а не во всей истории новее.
+    reverse = bool(since_date or min_id)
+    lower_date = max((d for d in (since_date, cutoff_date) if d), default=None) if reverse else None
+    iter_kwargs = {"limit": None, "reverse": reverse}
+    if topic_id:
+        iter_kwargs["reply_to"] = topic_id
+    if min_id:
+        iter_kwargs["min_id"] = min_id - 1
+    if max_id:
+        iter_kwargs["max_id"] = max_id + 1
+    if lower_date:
+        iter_kwargs["offset_date"] = lower_date
+    elif not reverse and until_date:
+        iter_kwargs["offset_date"] = until_date
+    if journal.last_id:
+        # offset_id важнее offset_date: продолжение с последнего сохраненного
+        # сообщения в том же направлении
+        iter_kwargs["offset_id"] = journal.last_id
+        if not reverse:
+            # От новых к старым Telethon берет offset_id = max(offset_id, max_id),
+            # и курсор потерялся бы; сверху окно уже ограничено самим offset_id
+            iter_kwargs.pop("max_id", None)
+
+    fetched = 0
+    try:
+        if shards:
+            tasks = [asyncio.create_task(fetch_shard(shard)) for shard in shards]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        else:
+            async for message in client.iter_messages(entity, **iter_kwargs):
+                # Один токен на пачку: iter_messages запрашивает историю по 100 сообщений
+                if limiter and fetched % 100 == 0:
+                    await limiter.acquire()
+                fetched += 1
+
+                # Стоп при выходе за период
+                if not reverse and cutoff_date and message.date and message.date < cutoff_date:
+                    break
+                if reverse and until_date and message.date and message.date >= until_date:
+                    break
+                # offset_id (--min-id, продолжение) важнее offset_date: более ранние
+                # сообщения до нижней границы дат отбрасываются здесь
+                if lower_date and message.date and message.date < lower_date:
+                    continue
+
+                await add_message(message)
+
+        total = len(spool)
+        log(f"Всего сообщений: {total}")
+
+        failed = set()
+        media_count = 0
+        if downloader:
+            log("Ожидание завершения скачивания медиа...")
+            await downloader.join()
+            failed = downloader.failed
+            media_count = downloader.downloaded
+            log(f"Медиа скачано: {media_count}")
+            if media_store is not None:
+                log(f"Из общего хранилища (без скачивания): {downloader.reused}")
+        records = _resolve_media(spool, output_format, failed)
+
         # Экспорт
-        if output_format == "json":
+        if output_format in ("json", "jsonl", "sqlite"):
             entity_info = make_entity_info(entity)
             if days:
                 entity_info["period_days"] = days
-            data = {
+            header = {
                 "entity_info": entity_info,
-                "total_messages": len(messages),
-                "messages": [serialize_message(m, media_files.get(m.id)) for m in messages],
+                "total_messages": total,
             }
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            if output_format == "json" and not inline_senders:
+                header["format"] = "json"
+                header["format_version"] = JSON_FORMAT_VERSION
+                header["senders"] = _collect_senders(spool)
+                write_json_export(output_file, header, (compact_message(msg) for msg in records),
+                                  compact=compact_json)
+            elif output_format == "json":
+                write_json_export(output_file, header, records, compact=compact_json)
+            elif output_format == "jsonl":
+                JsonlExport.create(output_file, header, records)
+            else:
+                SqliteExport.create(output_file, header, records).close()
 
         elif output_format == "txt":
             with open(output_file, 'w', encoding='utf-8') as f:
@@ -152,31 +411,79 @@ async def _export(args):
                 f.write(f"Экспорт: {entity_name}\n")
                 f.write(f"ID: {entity.id}\n")
                 f.write(f"Дата: {datetime.now().strftime('%Y-%m-%d %H:%M')}\n")
-                f.write(f"Сообщений: {len(messages)}\n")
+                f.write(f"Сообщений: {total}\n")
                 f.write(f"{'='*60}\n\n")
-                for msg in messages:
-                    f.write(format_message_text(msg) + "\n")
+                for line in records:
+                    f.write(line + "\n")
 
         elif output_format == "md":
             with open(output_file, 'w', encoding='utf-8') as f:
                 f.write(f"# {entity_name}\n\n")
                 f.write(f"Дата экспорта: {datetime.now().strftime('%d.%m.%Y %H:%M')}\n\n")
-                f.write(f"Сообщений: {len(messages)}")
+                f.write(f"Сообщений: {total}")
                 if download_media:
-                    f.write(f" | Медиа: {len(media_files)}")
+                    f.write(f" | Медиа: {media_count}")
                 f.write("\n\n---\n\n")
-                for msg in messages:
-                    f.write(format_message_markdown(msg, media_files.get(msg.id)))
+                for block in records:
+                    f.write(block)
                     f.write("\n\n---\n\n")
 
-        print(f"\nСохранено: {output_file}")
-        print(f"Экспортировано сообщений: {len(messages)}")
-        return output_file
+    except BaseException:
+        # Сохранить все, что успели получить, и выйти с журналом для --resume
+        if downloader:
+            await downloader.cancel()
+        spool.flush()
+        if last_id is not None:
+            commit(last_id)
+            log(f"\nЭкспорт прерван. Сохранено {len(spool)} сообщений, "
+                f"продолжить: tg-export export {source} --resume")
+        raise
+    else:
+        journal.discard()
+    finally:
+        if downloader:
+            await downloader.cancel()
 
+    log(f"\nСохранено: {output_file}")
+    log(f"Экспортировано сообщений: {total}")
+    return output_file, total
+
+
+async def _export(args):
+    """Основная логика экспорта."""
+    source = args.source
+    _, source_type, parsed_topic = parse_source(source)
+    topic_id = args.topic or parsed_topic
+
+    print(f"\n{'='*60}")
+    print(f"Экспорт сообщений Telegram")
+    print(f"{'='*60}")
+    print(f"Источник: {source}")
+    print(f"Тип: {source_type}")
+    print(f"Формат: {args.format}")
+    if topic_id:
+        print(f"Топик: #{topic_id}")
+    if args.days:
+        print(f"Период: последние {args.days} дней")
+    if args.since or args.until:
+        print(f"Период: {args.since or '...'} — {args.until or '...'} (до, не включая)")
+    if args.min_id or args.max_id:
+        print(f"ID сообщений: {args.min_id or '...'} — {args.max_id or '...'}")
+    if args.shards > 1:
+        if topic_id or args.days or args.since or args.until:
+            print("Ошибка: --shards делит историю по ID и не сочетается с --topic, --days, --since, --until")
+            return None
+        print(f"Шардов: {args.shards}")
+
+    client = create_client()
+
+    try:
+        me = await ensure_authorized(client)
+        output_file, _ = await export_source(client, args)
+        return output_file
     finally:
         await client.disconnect()
 
-
 def run(args):
     """Точка входа для CLI."""
     asyncio.run(_export(args))
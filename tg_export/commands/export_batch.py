@@ -0,0 +1,201 @@
+"""Параллельный экспорт многих источников через один клиент Telegram."""
+
+import sys
+import time
+import asyncio
+import argparse
+
+from telethon import utils as tg_utils
+from telethon.errors import FloodWaitError
+
+from tg_export.client import create_client, ensure_authorized
+from tg_export.ratelimit import TokenBucket, FloodGate
+from tg_export.media import FLOOD_RETRIES
+from tg_export.media_store import open_media_store
+from tg_export.entities import EntityCache, resolve_entity
+from tg_export.utils import parse_source
+from tg_export.commands.export import export_source, entity_export_dir
+
+DEFAULT_CONCURRENCY = 4
+# Запросов истории в секунду на все источники вместе
+DEFAULT_REQUEST_RATE = 3.0
+
+
+def read_sources(path):
+    """Источники из файла: по одному на строку, пустые строки и # комментарии пропускаются."""
+    sources = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line and line not in sources:
+                sources.append(line)
+    return sources
+
+
+async def _resolve(client, identifier, entity_cache, limiter):
+    """resolve_entity с повтором после FLOOD_WAIT (ожидание общее для всех источников)."""
+    for attempt in range(FLOOD_RETRIES + 1):
+        try:
+            return await resolve_entity(client, identifier, entity_cache)
+        except FloodWaitError as e:
+            limiter.pause(e.seconds + 1)
+            if attempt == FLOOD_RETRIES:
+                raise
+            await asyncio.sleep(e.seconds + 1)
+
+
+async def _export_one(client, source, args, limiter, media_limiter, media_store, entity_cache,
+                      media_flood, claimed, dir_locks, semaphore, results):
+    """
+    Экспорт одного источника с повтором после FLOOD_WAIT.
+
+    Источник сначала разрешается в сущность: разные записи одного чата
+    (@name и https://t.me/name) экспортируются один раз — claimed хранит,
+    какой записью занят (peer id, топик). Разные топики одного чата и чаты
+    с одинаковым именем пишут в одну папку exports/<имя>, поэтому экспорты
+    в одну папку идут по очереди под замком из dir_locks.
+    """
+    def log(*parts, **kwargs):
+        text = " ".join(str(p) for p in parts).lstrip("\n")
+        print(f"[{source}] {text}", **kwargs)
+
+    source_args = argparse.Namespace(
+        source=source,
+        format=args.format,
+        output=None,
+        topic=None,
+        media=args.media,
+        days=args.days,
+        since=args.since,
+        until=args.until,
+        min_id=args.min_id,
+        max_id=args.max_id,
+        shards=1,
+        rate=args.rate,
+        media_workers=args.media_workers,
+        media_rate=None,
+        resume=args.resume,
+        inline_senders=args.inline_senders,
+        compact=args.compact,
+        media_store=args.media_store,
+        media_kind=args.media_kind,
+        media_mime=args.media_mime,
+        max_media_size=args.max_media_size,
+        media_since=args.media_since,
+        media_until=args.media_until,
+        thumbnails=args.thumbnails,
+    )
+
+    async with semaphore:
+        identifier, _, topic_id = parse_source(source)
+        try:
+            entity = await _resolve(client, identifier, entity_cache, limiter)
+        except Exception as e:
+            log(f"Ошибка получения источника: {e}")
+            results[source] = ("error", str(e), 0)
+            return
+        key = (tg_utils.get_peer_id(entity), topic_id)
+        if key in claimed:
+            log(f"Тот же источник, что и {claimed[key]}, пропуск")
+            results[source] = ("duplicate", claimed[key], 0)
+            return
+        claimed[key] = source
+
+        entity_dir = entity_export_dir(entity)
+        lock = dir_locks.setdefault(entity_dir, asyncio.Lock())
+        if lock.locked():
+            log(f"Папка {entity_dir} занята другим источником, ожидание")
+        async with lock:
+            started = time.monotonic()
+            for attempt in range(FLOOD_RETRIES + 1):
+                try:
+                    output_file, total = await export_source(
+                        client, source_args, limiter=limiter, media_limiter=media_limiter,
+                        media_store=media_store, entity_cache=entity_cache, media_flood=media_flood,
+                        entity=entity, log=log,
+                    )
+                except FloodWaitError as e:
+                    # Ожидание общее: остальные источники тоже не шлют запросы
+                    limiter.pause(e.seconds + 1)
+                    if attempt == FLOOD_RETRIES:
+                        results[source] = ("error", f"FLOOD_WAIT {e.seconds} с", 0)
+                        return
+                    log(f"FLOOD_WAIT {e.seconds} с, продолжение с места остановки")
+                    source_args.resume = True
+                except Exception as e:
+                    log(f"Ошибка: {e}")
+                    results[source] = ("error", str(e), 0)
+                    return
+                else:
+                    elapsed = time.monotonic() - started
+                    log(f"Готово за {elapsed:.0f} с")
+                    results[source] = ("ok", output_file, total)
+                    return
+
+
+async def _export_batch(args):
+    sources = read_sources(args.sources_file)
+    if not sources:
+        print(f"В файле {args.sources_file} нет источников")
+        return {}
+
+    print(f"\n{'='*60}")
+    print(f"Пакетный экспорт сообщений Telegram")
+    print(f"{'='*60}")
+    print(f"Источников: {len(sources)}")
+    print(f"Формат: {args.format}")
+    print(f"Параллельно: {args.concurrency}")
+    print(f"Запросов в секунду: {args.rate}")
+    if args.days:
+        print(f"Период: последние {args.days} дней")
+
+    client = create_client()
+
+    try:
+        await ensure_authorized(client)
+
+        limiter = TokenBucket(args.rate)
+        media_limiter = None
+        if args.media and args.media_rate:
+            media_limiter = TokenBucket(int(args.media_rate * 1024 * 1024))
+        # Одно хранилище на все источники: общие файлы скачиваются один раз
+        media_store = open_media_store(args.media_store) if args.media else None
+        # FLOOD_WAIT при скачивании медиа останавливает загрузки всех источников
+        media_flood = FloodGate()
+        # Источники, разрешенные в прошлых запусках, не требуют ResolveUsername
+        entity_cache = EntityCache.open()
+        semaphore = asyncio.Semaphore(max(1, args.concurrency))
+        claimed, dir_locks, results = {}, {}, {}
+
+        await asyncio.gather(*(
+            _export_one(client, source, args, limiter, media_limiter, media_store, entity_cache,
+                        media_flood, claimed, dir_locks, semaphore, results)
+            for source in sources
+        ))
+    finally:
+        await client.disconnect()
+
+    # Итоги
+    print(f"\n{'='*60}")
+    print("Итоги пакетного экспорта")
+    print(f"{'='*60}")
+    ok = 0
+    for source in sources:
+        status, detail, total = results.get(source, ("error", "не выполнен", 0))
+        if status == "ok":
+            ok += 1
+            print(f"  OK     {source}: {total} сообщений -> {detail}")
+        elif status == "duplicate":
+            ok += 1
+            print(f"  ПОВТОР {source}: тот же источник, что и {detail}")
+        else:
+            print(f"  ОШИБКА {source}: {detail}")
+    print(f"\nУспешно: {ok} из {len(sources)}")
+    return results
+
+
+def run(args):
+    """Точка входа для CLI."""
+    results = asyncio.run(_export_batch(args))
+    if any(status == "error" for status, _, _ in results.values()):
+        sys.exit(1)
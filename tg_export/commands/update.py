@@ -1,36 +1,38 @@
-"""Инкрементальное обновление существующего JSON-экспорта."""
+"""Инкрементальное обновление существующего экспорта (JSON или JSONL)."""
 
 import os
-import json
 import asyncio
-from datetime import datetime
 
 from tg_export import config
 from tg_export.client import create_client, ensure_authorized
-from tg_export.serializers import serialize_message
-from tg_export.schemas import get_info_key
+from tg_export.serializers import serialize_record
+from tg_export.records import SenderTable
+from tg_export.storage import open_export
+from tg_export.entities import EntityCache, peer_from_info
+from tg_export.manifest import MediaManifest
+from tg_export.media import MediaDownloader, MediaFilter
+from tg_export.media_store import open_media_store
 
 
 async def _update(args):
     """Основная логика обновления экспорта."""
     json_path = args.json_path
     download_media = not args.no_media
+    media_filter = MediaFilter.from_args(args)
 
-    # Загрузить существующий экспорт
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    info_key = get_info_key(data)
+    # Открыть существующий экспорт
+    store = open_export(json_path)
+    header = store.header
+    info_key = store.info_key
     if not info_key:
         print("Ошибка: файл не содержит метаданных экспорта (entity_info / chat_info)")
         return
 
-    chat_id = data[info_key]['id']
-    existing_messages = data['messages']
-    last_message_id = max(msg['id'] for msg in existing_messages)
+    existing_count = store.count()
+    last_message_id = store.last_id()
 
     print(f"Загружен экспорт: {json_path}")
-    print(f"Существующих сообщений: {len(existing_messages)}")
+    print(f"Существующих сообщений: {existing_count}")
     print(f"Последний ID сообщения: {last_message_id}")
 
     client = create_client()
@@ -39,14 +41,14 @@ async def _update(args):
         me = await ensure_authorized(client)
 
         # Получить сущность
-        chat_identifier = int(f"-100{chat_id}")
-        chat = await client.get_entity(chat_identifier)
-        chat_name = data[info_key].get('title') or data[info_key].get('name')
+        # Пир из заголовка экспорта, без разрешения по сети
+        chat = await peer_from_info(client, header[info_key], EntityCache.open())
+        chat_name = header[info_key].get('title') or header[info_key].get('name')
         print(f"Загрузка новых сообщений из: {chat_name}")
 
         # Получить только новые сообщения
         raw_messages = []
-        async for message in client.iter_messages(chat_identifier, min_id=last_message_id):
+        async for message in client.iter_messages(chat, min_id=last_message_id):
             raw_messages.append(message)
 
         if not raw_messages:
@@ -60,54 +62,68 @@ async def _update(args):
         export_dir = os.path.dirname(json_path)
         media_dir = os.path.join(export_dir, "media")
 
+        # Медиа скачиваются тем же пулом и под теми же именами, что и в export;
+        # файлы, уже известные манифесту, повторно не скачиваются
+        downloader = None
         if download_media:
             os.makedirs(media_dir, exist_ok=True)
+            manifest = MediaManifest(media_dir)
+            if media_filter.describe():
+                print(f"Фильтр медиа: {media_filter.describe()}")
+            rate = int(args.media_rate * 1024 * 1024) if args.media_rate else None
+            downloader = MediaDownloader(client, media_dir, workers=args.media_workers, rate_limit=rate,
+                                         manifest=manifest, store=open_media_store(args.media_store),
+                                         thumbnails=media_filter.thumbnails)
+            downloader.start()
 
         # Обработка сообщений
         new_messages = []
-        media_count = 0
-
-        for msg in raw_messages:
-            media_file = None
-
-            if download_media and msg.media:
-                try:
-                    file_path = await client.download_media(msg, file=media_dir)
-                    if file_path:
-                        media_file = os.path.basename(file_path)
-                        media_count += 1
-                        print(f"  Скачано: {media_file}")
-                except Exception as e:
-                    print(f"  Не удалось скачать медиа для сообщения {msg.id}: {e}")
-
-            new_messages.append(serialize_message(msg, media_file))
-
-        if media_count > 0:
-            print(f"Скачано медиа: {media_count}")
-
-        # Объединить сообщения
-        all_messages = existing_messages + new_messages
-
-        data['messages'] = all_messages
-        data['total_messages'] = len(all_messages)
-        data[info_key]['export_date'] = datetime.now().isoformat()
-        data[info_key]['last_update'] = datetime.now().isoformat()
-
-        # Сохранить
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        present = 0
+        senders = SenderTable()
+
+        try:
+            for msg in raw_messages:
+                media_file = None
+
+                if downloader and media_filter.accepts(msg):
+                    media_file = media_filter.filename(msg)
+                    if media_file in manifest:
+                        present += 1
+                    else:
+                        await downloader.submit(msg, media_file)
+
+                new_messages.append(serialize_record(msg, media_file, senders))
+
+            if downloader:
+                await downloader.join()
+        finally:
+            if downloader:
+                await downloader.cancel()
+
+        if downloader:
+            for record in new_messages:
+                if record.id in downloader.failed:
+                    print(f"  Не удалось скачать медиа для сообщения {record.id}")
+                    record.media_file = None
+            print(f"Скачано медиа: {downloader.downloaded}, уже были: {present}, "
+                  f"не удалось: {len(downloader.failed)}")
+            if downloader.store is not None:
+                print(f"Из общего хранилища (без скачивания): {downloader.reused}")
+
+        # Сохранить: JSONL дописывается, JSON перезаписывается целиком
+        store.append(record.to_dict() for record in new_messages)
 
         print(f"\nФайл обновлен: {json_path}")
-        print(f"Всего сообщений: {len(all_messages)}")
+        print(f"Всего сообщений: {existing_count + len(new_messages)}")
         print(f"Добавлено новых: {len(new_messages)}")
 
         # Превью новых сообщений
         print("\nНовые сообщения:")
         for msg in new_messages[:10]:
-            text_preview = msg['text'][:50] + "..." if len(msg['text']) > 50 else msg['text']
-            sender = msg['sender']['first_name'] if msg['sender'] else "Unknown"
-            media_indicator = f" [медиа: {msg['media_file']}]" if msg['media_file'] else ""
-            print(f"  [{msg['id']}] {sender}: {text_preview or '[медиа]'}{media_indicator}")
+            text_preview = msg.text[:50] + "..." if len(msg.text) > 50 else msg.text
+            sender = msg.sender['first_name'] if msg.sender else "Unknown"
+            media_indicator = f" [медиа: {msg.media_file}]" if msg.media_file else ""
+            print(f"  [{msg.id}] {sender}: {text_preview or '[медиа]'}{media_indicator}")
 
         if len(new_messages) > 10:
             print(f"  ... и ещё {len(new_messages) - 10} сообщений")
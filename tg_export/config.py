@@ -30,6 +30,9 @@ API_ID = os.getenv("TELEGRAM_API_ID", "")
 API_HASH = os.getenv("TELEGRAM_API_HASH", "")
 SESSION_NAME = os.getenv("SESSION_NAME", "tg_export_session")
 EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+MEDIA_STORE = os.getenv("MEDIA_STORE", "")
+ENTITY_CACHE = os.getenv("ENTITY_CACHE", "")
+JSON_BACKEND = os.getenv("JSON_BACKEND", "")
 
 
 def validate():
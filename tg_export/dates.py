@@ -0,0 +1,42 @@
+"""
+Даты сообщений для анализа: ISO-строка разбирается один раз, сравнения и
+ключи агрегатов — числа, строки формируются только при выводе.
+"""
+
+from datetime import date, datetime, timezone
+
+# Названия дней недели как у strftime('%A'), по datetime.weekday()
+WEEKDAYS = [datetime(2024, 1, 1 + i).strftime('%A') for i in range(7)]
+
+
+def parse_date(date_str):
+    """Разобрать ISO-дату сообщения; None, если даты нет или она некорректна."""
+    if not date_str:
+        return None
+    try:
+        return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def epoch(dt):
+    """Секунды от эпохи для сравнения дат; дата без пояса считается UTC."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def month_key(dt):
+    """Числовой ключ месяца (год * 12 + месяц - 1)."""
+    return dt.year * 12 + dt.month - 1
+
+
+def month_string(key):
+    """'YYYY-MM' по month_key."""
+    year, month = divmod(key, 12)
+    return f"{year:04d}-{month + 1:02d}"
+
+
+def day_string(ordinal):
+    """'YYYY-MM-DD' по порядковому номеру дня (date.toordinal)."""
+    return date.fromordinal(ordinal).isoformat()
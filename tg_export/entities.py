@@ -0,0 +1,167 @@
+"""Кэш разрешенных сущностей Telegram и восстановление InputPeer без сети."""
+
+import os
+import time
+
+from telethon import utils as tg_utils
+from telethon.errors import RPCError
+from telethon.tl.types import (
+    User, Chat, Channel, PeerUser, PeerChat, PeerChannel,
+    InputPeerUser, InputPeerChat, InputPeerChannel,
+)
+
+from tg_export import config, jsonio
+from tg_export.utils import get_entity_name
+
+# Через сколько секунд запись кэша считается устаревшей
+ENTITY_CACHE_TTL = 7 * 24 * 3600
+
+_PEER_TYPES = {User: "user", Chat: "chat", Channel: "channel"}
+_PEERS = {"user": PeerUser, "chat": PeerChat, "channel": PeerChannel}
+# Старые заголовки без peer: type(entity).__name__ -> тип пира
+_LEGACY_TYPES = {"User": "user", "Chat": "chat", "Channel": "channel"}
+
+
+def peer_info(entity):
+    """Данные для InputPeer без обращения к сети: {"type", "id", "access_hash"}."""
+    peer_type = next((name for cls, name in _PEER_TYPES.items() if isinstance(entity, cls)), None)
+    if peer_type is None:
+        return None
+    return {
+        "type": peer_type,
+        "id": entity.id,
+        "access_hash": getattr(entity, 'access_hash', None),
+    }
+
+
+def input_peer(info):
+    """InputPeer из peer_info (или записи кэша); None, если данных не хватает."""
+    peer_type, peer_id, access_hash = info.get("type"), info.get("id"), info.get("access_hash")
+    if peer_type == "chat":
+        return InputPeerChat(peer_id)
+    if access_hash is None:
+        return None
+    if peer_type == "user":
+        return InputPeerUser(peer_id, access_hash)
+    if peer_type == "channel":
+        return InputPeerChannel(peer_id, access_hash)
+    return None
+
+
+def marked_id(peer_type, peer_id):
+    """ID с пометкой типа, как его понимает get_entity (-100... для каналов)."""
+    return tg_utils.get_peer_id(_PEERS[peer_type](peer_id))
+
+
+def cache_key(identifier):
+    """Ключ кэша для идентификатора источника: id:<marked id> или name:<username/телефон>."""
+    if isinstance(identifier, int):
+        return f"id:{identifier}"
+    return "name:" + str(identifier).strip().lstrip('@').lower()
+
+
+class EntityCache:
+    """
+    Кэш разрешенных сущностей: JSON-файл рядом с сессией
+    (<SESSION_NAME>.entities.json, см. ENTITY_CACHE в .env).
+
+    Запись — {"type", "id", "access_hash", "username", "title", "resolved"}
+    под ключами идентификатора, по которому сущность искали, и ее
+    marked id. По записи строится InputPeer, поэтому повторные запуски не
+    вызывают ResolveUsername и перебор диалогов. access_hash действителен
+    только для аккаунта сессии. Записи старше ttl секунд игнорируются.
+    """
+
+    def __init__(self, path, ttl=ENTITY_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = jsonio.load(f)
+            except ValueError:
+                self.entries = {}
+
+    @classmethod
+    def open(cls):
+        """Кэш по пути из ENTITY_CACHE (по умолчанию рядом с файлом сессии)."""
+        return cls(config.ENTITY_CACHE or f"{config.SESSION_NAME}.entities.json")
+
+    def get(self, key):
+        """Запись по ключу; None, если ее нет или она устарела."""
+        entry = self.entries.get(key)
+        if entry is None or time.time() - entry.get("resolved", 0) > self.ttl:
+            return None
+        return entry
+
+    def put(self, entity, *keys):
+        """Запомнить сущность под ключами keys и ее marked id."""
+        info = peer_info(entity)
+        if info is None:
+            return None
+        entry = dict(info, username=getattr(entity, 'username', None),
+                     title=get_entity_name(entity), resolved=time.time())
+        for key in (*keys, cache_key(tg_utils.get_peer_id(entity))):
+            self.entries[key] = entry
+        return entry
+
+    def forget(self, key):
+        self.entries.pop(key, None)
+
+    def save(self):
+        """Атомарно записать кэш."""
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            jsonio.dump(self.entries, f, indent=True)
+        os.replace(tmp_path, self.path)
+
+
+async def resolve_entity(client, identifier, cache=None):
+    """
+    get_entity с кэшем: известная сущность запрашивается по InputPeer
+    (GetUsers/GetChannels) вместо ResolveUsername или поиска по диалогам.
+    Если кэшированный access_hash больше не подходит, сущность
+    разрешается заново.
+    """
+    key = cache_key(identifier)
+    entry = cache.get(key) if cache else None
+    peer = input_peer(entry) if entry else None
+    entity = None
+    if peer is not None:
+        try:
+            entity = await client.get_entity(peer)
+        except (ValueError, RPCError):
+            cache.forget(key)
+    if entity is None:
+        entity = await client.get_entity(identifier)
+    if cache is not None:
+        cache.put(entity, key)
+        cache.save()
+    return entity
+
+
+async def peer_from_info(client, info, cache=None):
+    """
+    Пир для entity_info из заголовка экспорта.
+
+    Новые экспорты хранят peer ({"type", "id", "access_hash"}), из которого
+    InputPeer строится без обращения к сети. Для старых ID восстанавливается
+    по полю type (каналы, группы и пользователи) и разрешается через кэш
+    или get_entity.
+    """
+    peer = input_peer(info["peer"]) if info.get("peer") else None
+    if peer is not None:
+        return peer
+
+    peer_type = _LEGACY_TYPES.get(info.get("type"), "channel")
+    identifier = marked_id(peer_type, info["id"])
+    entry = cache.get(cache_key(identifier)) if cache else None
+    peer = input_peer(entry) if entry else None
+    if peer is not None:
+        return peer
+    return await resolve_entity(client, identifier, cache)
@@ -0,0 +1,115 @@
+"""
+Сериализация JSON для всех хранилищ и команд.
+
+Бэкенд выбирается при импорте: orjson, затем msgspec, если они установлены,
+иначе стандартный json. JSON_BACKEND в .env (orjson, msgspec, json)
+закрепляет конкретный бэкенд. Вывод всех бэкендов один и тот же по смыслу:
+не-ASCII символы пишутся как есть, нестроковые ключи словарей становятся
+строками, отступ — 2 пробела, компактная запись — без пробелов после
+',' и ':'. Значение, которое быстрый бэкенд закодировать не может (число
+больше 64 бит, одиночный суррогат), кодируется стандартным json.
+"""
+
+import json
+
+from tg_export import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+BACKENDS = ("orjson", "msgspec", "json")
+
+
+def _json_loads(data):
+    return json.loads(data)
+
+
+def _json_dumps(obj, indent=False, default=None):
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2, default=default)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=default)
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def _orjson_dumpb(obj, indent=False, default=None):
+        option = _ORJSON_OPTIONS | orjson.OPT_INDENT_2 if indent else _ORJSON_OPTIONS
+        return orjson.dumps(obj, default=default, option=option)
+
+
+if msgspec is not None:
+    _msgspec_decoder = msgspec.json.Decoder()
+
+    def _msgspec_loads(data):
+        try:
+            return _msgspec_decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+
+    def _msgspec_dumpb(obj, indent=False, default=None):
+        data = msgspec.json.encode(obj, enc_hook=default)
+        return msgspec.json.format(data, indent=2) if indent else data
+
+
+def _select(name):
+    """(имя, loads, dumpb) бэкенда name; пустое имя — лучший доступный."""
+    if name not in ("", *BACKENDS):
+        raise ValueError(f"Неизвестный JSON_BACKEND: {name!r} (варианты: {', '.join(BACKENDS)})")
+    if name in ("", "orjson") and orjson is not None:
+        return "orjson", orjson.loads, _orjson_dumpb
+    if name in ("", "msgspec") and msgspec is not None:
+        return "msgspec", _msgspec_loads, _msgspec_dumpb
+    return "json", _json_loads, None
+
+
+BACKEND, _loads, _dumpb = _select(config.JSON_BACKEND.strip().lower())
+
+
+def use(name):
+    """Переключить бэкенд (для замеров и отладки); возвращает имя выбранного."""
+    global BACKEND, _loads, _dumpb
+    BACKEND, _loads, _dumpb = _select(name)
+    return BACKEND
+
+
+def loads(data):
+    """Разобрать JSON из str или bytes. Ошибка разбора — ValueError."""
+    return _loads(data)
+
+
+def load(f):
+    """Разобрать JSON-файл, открытый в текстовом или двоичном режиме."""
+    return _loads(f.read())
+
+
+def dumpb(obj, indent=False, default=None):
+    """Закодировать obj в JSON (UTF-8 bytes); indent — отступ в 2 пробела."""
+    if _dumpb is not None:
+        try:
+            return _dumpb(obj, indent, default)
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return _json_dumps(obj, indent, default).encode('utf-8')
+
+
+def dumps(obj, indent=False, default=None):
+    """Закодировать obj в строку JSON; indent — отступ в 2 пробела."""
+    if _dumpb is not None:
+        try:
+            return _dumpb(obj, indent, default).decode('utf-8')
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return _json_dumps(obj, indent, default)
+
+
+def dump(obj, f, indent=False, default=None):
+    """Записать obj в файл, открытый в текстовом режиме."""
+    f.write(dumps(obj, indent, default))
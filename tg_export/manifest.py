@@ -0,0 +1,145 @@
+"""Манифест медиа-файлов: какие файлы уже лежат в папке media/ экспорта."""
+
+import os
+import asyncio
+import hashlib
+
+from tg_export import jsonio
+
+MANIFEST_FILE = ".manifest.jsonl"
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """SHA-256 файла (hex)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class JsonlLog:
+    """
+    Дописываемый журнал JSON-строк с фиксацией каждой записи.
+
+    Каждая строка пишется одной записью с fsync, поэтому она либо есть
+    целиком, либо отсутствует; оборванный хвост (сбой посреди записи)
+    игнорируется при чтении и обрезается при следующей дозаписи.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._committed = 0
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """Все зафиксированные записи по порядку."""
+        entries = []
+        self._committed = 0
+        if not self.exists():
+            return entries
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entries.append(jsonio.loads(line))
+                except ValueError:
+                    break
+                self._committed += len(line)
+        return entries
+
+    def append(self, entry):
+        with open(self.path, 'r+b' if self.exists() else 'wb') as f:
+            f.truncate(self._committed)
+            f.seek(self._committed)
+            f.write(jsonio.dumpb(entry) + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+            self._committed = f.tell()
+
+    def rewrite(self, entries):
+        """Атомарно заменить журнал указанными записями."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            for entry in entries:
+                f.write(jsonio.dumpb(entry) + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+            self._committed = f.tell()
+        os.replace(tmp_path, self.path)
+
+
+class MediaManifest:
+    """
+    Журнал файлов папки media/: media/.manifest.jsonl, по строке на файл
+    ({"file", "size", "sha256", "message_id"}; более поздняя строка для того
+    же файла заменяет раннюю).
+
+    Каждая загрузка фиксируется отдельной строкой (JsonlLog). Проверка
+    «какие файлы отсутствуют» сводится к разности множеств без обращения
+    к файловой системе.
+
+    Если манифеста еще нет (папка от старой версии), он строится одним
+    проходом os.scandir; для таких файлов size и sha256 неизвестны (null).
+    """
+
+    def __init__(self, media_dir):
+        self.media_dir = media_dir
+        self.path = os.path.join(media_dir, MANIFEST_FILE)
+        self.log = JsonlLog(self.path)
+        self.entries = {}
+        if self.log.exists():
+            for entry in self.log.load():
+                self.entries[entry["file"]] = entry
+        else:
+            self.rebuild()
+
+    def _scan(self):
+        """Имена файлов в папке (один os.scandir, без stat на файл)."""
+        with os.scandir(self.media_dir) as it:
+            return {
+                entry.name for entry in it
+                if not entry.name.startswith(".") and entry.is_file(follow_symlinks=False)
+            }
+
+    def rebuild(self):
+        """
+        Сверить манифест с содержимым папки: убрать исчезнувшие файлы,
+        добавить неизвестные, переписать файл манифеста атомарно.
+        """
+        on_disk = self._scan() if os.path.isdir(self.media_dir) else set()
+        entries = {name: entry for name, entry in self.entries.items() if name in on_disk}
+        for name in on_disk - entries.keys():
+            entries[name] = {"file": name, "size": None, "sha256": None, "message_id": None}
+        self.entries = entries
+
+        os.makedirs(self.media_dir, exist_ok=True)
+        self.log.rewrite(entries.values())
+
+    def __contains__(self, filename):
+        return filename in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def files(self):
+        """Множество имен файлов, известных манифесту."""
+        return set(self.entries)
+
+    def add(self, filename, message_id=None, size=None, sha256=None):
+        """Зафиксировать скачанный файл."""
+        entry = {"file": filename, "size": size, "sha256": sha256, "message_id": message_id}
+        self.log.append(entry)
+        self.entries[filename] = entry
+        return entry
+
+    async def record(self, filename, message_id=None, sha256=None):
+        """Зафиксировать только что скачанный файл; SHA-256, если не передан, считается в потоке."""
+        path = os.path.join(self.media_dir, filename)
+        size = os.path.getsize(path)
+        if sha256 is None:
+            sha256 = await asyncio.get_running_loop().run_in_executor(None, file_sha256, path)
+        return self.add(filename, message_id, size, sha256)
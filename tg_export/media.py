@@ -0,0 +1,383 @@
+"""Конвейер скачивания медиа: очередь и пул воркеров с учетом FLOOD_WAIT."""
+
+import os
+import asyncio
+import fnmatch
+
+from telethon.errors import FloodWaitError
+from telethon.tl.types import (
+    MessageMediaPhoto, MessageMediaDocument, PhotoSize, PhotoCachedSize, PhotoSizeProgressive,
+    DocumentAttributeVideo, DocumentAttributeAudio, DocumentAttributeSticker,
+)
+
+from tg_export.ratelimit import TokenBucket, FloodGate
+from tg_export.chunked import CHUNKED_THRESHOLD, download_document
+from tg_export.serializers import get_media_filename
+from tg_export.utils import parse_day
+
+DEFAULT_WORKERS = 4
+# Сколько раз повторять скачивание после FLOOD_WAIT
+FLOOD_RETRIES = 5
+# Максимум id в одном запросе get_messages
+GET_MESSAGES_BATCH = 100
+# Виды медиа для фильтра --media-kind
+MEDIA_KINDS = ("photo", "video", "voice", "audio", "sticker", "document")
+
+
+def is_downloadable(message):
+    """Есть ли в сообщении медиа, которое экспортируется (фото или документ)."""
+    return bool(message.media) and isinstance(message.media, (MessageMediaPhoto, MessageMediaDocument))
+
+
+def get_media_size(message):
+    """Размер медиа в байтах (0, если неизвестен)."""
+    file = getattr(message, 'file', None)
+    return getattr(file, 'size', None) or 0
+
+
+def get_media_kind(message):
+    """Вид медиа: photo, video, voice, audio, sticker или document; None, если медиа нет."""
+    media = message.media
+    if isinstance(media, MessageMediaPhoto):
+        return "photo"
+    if not isinstance(media, MessageMediaDocument) or not media.document:
+        return None
+    for attr in media.document.attributes:
+        if isinstance(attr, DocumentAttributeSticker):
+            return "sticker"
+        if isinstance(attr, DocumentAttributeAudio):
+            return "voice" if attr.voice else "audio"
+        if isinstance(attr, DocumentAttributeVideo):
+            return "video"
+    return "document"
+
+
+def get_media_mime(message):
+    """MIME-тип медиа (для фото — image/jpeg)."""
+    media = message.media
+    if isinstance(media, MessageMediaPhoto):
+        return "image/jpeg"
+    if isinstance(media, MessageMediaDocument) and media.document:
+        return media.document.mime_type or ""
+    return ""
+
+
+def _thumb_size(size):
+    if isinstance(size, PhotoSize):
+        return size.size
+    if isinstance(size, PhotoCachedSize):
+        return len(size.bytes)
+    return max(size.sizes)
+
+
+def smallest_thumb(message):
+    """
+    Тип (PhotoSize.type) самой маленькой полноценной миниатюры фото или
+    документа; None, если миниатюр нет. Встроенные PhotoStrippedSize и
+    контуры PhotoPathSize не считаются.
+    """
+    media = message.media
+    if isinstance(media, MessageMediaPhoto) and media.photo:
+        sizes = media.photo.sizes
+    elif isinstance(media, MessageMediaDocument) and media.document:
+        sizes = media.document.thumbs or []
+    else:
+        return None
+    sizes = [s for s in sizes if isinstance(s, (PhotoSize, PhotoCachedSize, PhotoSizeProgressive))]
+    if not sizes:
+        return None
+    return min(sizes, key=_thumb_size).type
+
+
+class MediaFilter:
+    """
+    Какие медиа скачивать.
+
+    kinds — виды из MEDIA_KINDS, mime — шаблоны fnmatch (image/*, video/mp4),
+    max_size — предел в байтах (размер документа известен до скачивания),
+    since/until — окно дат сообщения [since, until), thumbnails — вместо
+    файла скачивать самую маленькую миниатюру (фото и документы с превью).
+    Пустой фильтр пропускает все, что скачивалось раньше (фото и документы).
+    """
+
+    def __init__(self, kinds=None, mime=None, max_size=None, since=None, until=None, thumbnails=False):
+        self.kinds = set(kinds) if kinds else None
+        self.mime = list(mime) if mime else None
+        self.max_size = max_size
+        self.since = since
+        self.until = until
+        self.thumbnails = thumbnails
+
+    @classmethod
+    def from_args(cls, args):
+        """Фильтр из аргументов CLI (--media-kind, --media-mime, --max-media-size, ...)."""
+        return cls.from_params({
+            "kinds": args.media_kind,
+            "mime": args.media_mime,
+            "max_size": args.max_media_size,
+            "since": args.media_since,
+            "until": args.media_until,
+            "thumbnails": args.thumbnails,
+        })
+
+    @classmethod
+    def from_params(cls, params):
+        """Фильтр из словаря to_params() (журнал экспорта)."""
+        params = params or {}
+        return cls(
+            kinds=params.get("kinds"),
+            mime=params.get("mime"),
+            max_size=params.get("max_size"),
+            since=parse_day(params.get("since")),
+            until=parse_day(params.get("until")),
+            thumbnails=params.get("thumbnails", False),
+        )
+
+    def to_params(self):
+        """Параметры фильтра для JSON (журнал экспорта, --resume)."""
+        return {
+            "kinds": sorted(self.kinds) if self.kinds else None,
+            "mime": self.mime,
+            "max_size": self.max_size,
+            "since": self.since.strftime("%Y-%m-%d") if self.since else None,
+            "until": self.until.strftime("%Y-%m-%d") if self.until else None,
+            "thumbnails": self.thumbnails,
+        }
+
+    def accepts(self, message):
+        """Скачивать ли медиа этого сообщения."""
+        if not is_downloadable(message):
+            return False
+        if self.kinds and get_media_kind(message) not in self.kinds:
+            return False
+        if self.mime:
+            mime = get_media_mime(message)
+            if not any(fnmatch.fnmatch(mime, pattern) for pattern in self.mime):
+                return False
+        if self.since or self.until:
+            date = message.date
+            if date is None:
+                return False
+            if self.since and date < self.since:
+                return False
+            if self.until and date >= self.until:
+                return False
+        if self.thumbnails:
+            return smallest_thumb(message) is not None
+        if self.max_size and get_media_size(message) > self.max_size:
+            return False
+        return True
+
+    def filename(self, message):
+        """Имя файла медиа с учетом режима миниатюр."""
+        return get_media_filename(message, thumbnail=self.thumbnails)
+
+    def describe(self):
+        """Описание фильтра для вывода; пустая строка, если фильтр пустой."""
+        parts = []
+        if self.kinds:
+            parts.append("виды: " + ", ".join(sorted(self.kinds)))
+        if self.mime:
+            parts.append("MIME: " + ", ".join(self.mime))
+        if self.max_size:
+            parts.append(f"до {self.max_size / (1024 * 1024):.1f} МБ")
+        if self.since:
+            parts.append(f"с {self.since:%Y-%m-%d}")
+        if self.until:
+            parts.append(f"до {self.until:%Y-%m-%d}")
+        if self.thumbnails:
+            parts.append("только миниатюры")
+        return "; ".join(parts)
+
+
+async def iter_messages_by_ids(client, entity, ids, batch_size=GET_MESSAGES_BATCH, log=print):
+    """
+    Получить сообщения по списку id пачками по batch_size за запрос.
+
+    Отдает пары (id, сообщение или None для удаленных). При FLOOD_WAIT
+    пачка запрашивается повторно после указанной сервером паузы; log —
+    куда писать о паузе (в export-batch — с префиксом источника).
+    """
+    ids = list(ids)
+    for i in range(0, len(ids), batch_size):
+        batch = ids[i:i + batch_size]
+        for attempt in range(FLOOD_RETRIES + 1):
+            try:
+                messages = await client.get_messages(entity, ids=batch)
+                break
+            except FloodWaitError as e:
+                if attempt == FLOOD_RETRIES:
+                    raise
+                log(f"  FLOOD_WAIT {e.seconds} с при получении сообщений, ожидание...")
+                await asyncio.sleep(e.seconds + 1)
+        for msg_id, message in zip(batch, messages):
+            yield msg_id, message
+
+
+async def download_media_file(client, message, media_dir, filename=None, thumbnail=False, log=print):
+    """
+    Скачать медиа из сообщения, вернуть имя файла (по умолчанию get_media_filename).
+    thumbnail — скачать самую маленькую миниатюру вместо файла. Документы
+    от CHUNKED_THRESHOLD скачиваются параллельно по частям с докачкой.
+    log — куда писать об ошибке (в export-batch — с префиксом источника).
+    """
+    if not is_downloadable(message):
+        return None
+
+    filename = filename or get_media_filename(message, thumbnail=thumbnail)
+    filepath = os.path.join(media_dir, filename)
+
+    try:
+        if thumbnail:
+            thumb = smallest_thumb(message)
+            if thumb is None:
+                return None
+            result = await client.download_media(message, filepath, thumb=thumb)
+        elif isinstance(message.media, MessageMediaDocument) and get_media_size(message) >= CHUNKED_THRESHOLD:
+            result = await download_document(client, message, filepath)
+        else:
+            result = await client.download_media(message, filepath)
+        # download_media возвращает None, если скачивать нечего: файла нет
+        return filename if result or os.path.exists(filepath) else None
+    except FloodWaitError:
+        raise
+    except Exception as e:
+        log(f"  Не удалось скачать медиа из сообщения {message.id}: {e}")
+        return None
+
+
+class MediaDownloader:
+    """
+    Пул воркеров поверх asyncio.Queue.
+
+    Производитель (итерация сообщений) кладет сообщения через submit(),
+    воркеры скачивают их параллельно с загрузкой истории. Очередь ограничена,
+    поэтому при медленной сети производитель притормаживает, а не копит
+    сообщения в памяти. Темп задает сервер: FLOOD_WAIT в любом воркере
+    приостанавливает все воркеры на указанное время, затем попытка
+    повторяется — без фиксированных пауз между файлами.
+
+    Результаты: downloaded — сколько файлов сохранено, failed — множество id,
+    reused — сколько файлов взято из общего хранилища без скачивания;
+    pending — id сообщений, поставленных в очередь и еще не обработанных.
+    Какие файлы уже лежат в папке, знает манифест, а не загрузчик: память
+    не растет с числом скачанных файлов.
+
+    rate_limit — собственное ограничение трафика (байт/с); вместо него можно
+    передать limiter — TokenBucket, общий для нескольких загрузчиков.
+    manifest — MediaManifest папки: каждый скачанный файл фиксируется в нем.
+    store — общий MediaStore: файлы, уже известные хранилищу, не скачиваются,
+    а связываются жесткой ссылкой. thumbnails — скачивать миниатюры.
+    flood — FloodGate, общий для нескольких загрузчиков: FLOOD_WAIT в одном
+    из них приостанавливает все.
+    """
+
+    def __init__(self, client, media_dir, workers=DEFAULT_WORKERS, rate_limit=None,
+                 limiter=None, log=print, manifest=None, store=None, thumbnails=False, flood=None):
+        self.client = client
+        self.media_dir = media_dir
+        self.workers = max(1, workers or DEFAULT_WORKERS)
+        if limiter is None and rate_limit:
+            limiter = TokenBucket(rate_limit)
+        self.limiter = limiter
+        self.log = log
+        self.manifest = manifest
+        self.store = store
+        self.thumbnails = thumbnails
+        self.flood = flood or FloodGate()
+        self.downloaded = 0
+        self.failed = set()
+        self.pending = set()
+        self.reused = 0
+        self._queue = None
+        self._tasks = []
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.join()
+        else:
+            await self.cancel()
+
+    def start(self):
+        """Запустить воркеры."""
+        self._queue = asyncio.Queue(maxsize=self.workers * 4)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, message, filename=None):
+        """Поставить сообщение в очередь; filename — имя файла вместо get_media_filename."""
+        self.pending.add(message.id)
+        await self._queue.put((message, filename))
+
+    async def join(self):
+        """Дождаться опустошения очереди и остановить воркеры."""
+        await self._queue.join()
+        await self.cancel()
+
+    async def cancel(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            message, filename = await self._queue.get()
+            try:
+                filename = await self._download(message, filename)
+                if filename:
+                    if self.manifest is not None:
+                        sha256 = self.store.sha256_for(message, self.thumbnails) if self.store else None
+                        await self.manifest.record(filename, message.id, sha256)
+                    self.downloaded += 1
+                    if self.downloaded % 10 == 0:
+                        self.log(f"  Скачано {self.downloaded} файлов...")
+                else:
+                    self.failed.add(message.id)
+                # Загрузка, прерванная отменой, остается в pending: --resume повторит ее
+                self.pending.discard(message.id)
+            except Exception as e:
+                # Ошибка одного файла (манифест, хранилище) не должна останавливать воркер:
+                # иначе после гибели всех воркеров submit() ждет на полной очереди вечно
+                self.log(f"  Не удалось сохранить медиа из сообщения {message.id}: {e}")
+                self.failed.add(message.id)
+                self.pending.discard(message.id)
+            finally:
+                self._queue.task_done()
+
+    async def _download(self, message, filename=None):
+        filename = filename or get_media_filename(message, thumbnail=self.thumbnails)
+        fetched = False
+
+        async def fetch():
+            nonlocal fetched
+            fetched = True
+            if self.limiter and not self.thumbnails:
+                await self.limiter.acquire(get_media_size(message))
+
+            for attempt in range(FLOOD_RETRIES + 1):
+                await self.flood.wait()
+                try:
+                    return bool(await download_media_file(
+                        self.client, message, self.media_dir, filename, self.thumbnails, self.log,
+                    ))
+                except FloodWaitError as e:
+                    if attempt == FLOOD_RETRIES:
+                        self.log(f"  FLOOD_WAIT не закончился, пропуск сообщения {message.id}")
+                        return False
+                    self.log(f"  FLOOD_WAIT {e.seconds} с, все загрузки приостановлены")
+                    self.flood.pause(e.seconds + 1)
+            return False
+
+        if self.store is not None:
+            ok = await self.store.materialize(
+                message, os.path.join(self.media_dir, filename), fetch, self.thumbnails,
+            )
+            if ok and not fetched:
+                self.reused += 1
+        else:
+            ok = await fetch()
+        return filename if ok else None
@@ -0,0 +1,130 @@
+"""Общее контентно-адресуемое хранилище медиа для всех экспортов."""
+
+import os
+import shutil
+import asyncio
+import threading
+
+from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument
+
+from tg_export import config
+from tg_export.manifest import JsonlLog, file_sha256
+
+INDEX_FILE = "index.jsonl"
+OBJECTS_DIR = "objects"
+
+
+def media_key(message, thumbnail=False):
+    """
+    Ключ медиа в хранилище: photo:<id> или document:<id> (с суффиксом
+    :thumb для миниатюры); None, если медиа нет.
+    """
+    media = message.media
+    if isinstance(media, MessageMediaPhoto) and media.photo:
+        key = f"photo:{media.photo.id}"
+    elif isinstance(media, MessageMediaDocument) and media.document:
+        key = f"document:{media.document.id}"
+    else:
+        return None
+    return key + ":thumb" if thumbnail else key
+
+
+def link_or_copy(src, dst):
+    """Жесткая ссылка src -> dst; копия, если ссылку создать нельзя (другой диск, FAT)."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class MediaStore:
+    """
+    Хранилище файлов по содержимому: objects/<sha256[:2]>/<sha256>.
+
+    index.jsonl (JsonlLog) сопоставляет ключ Telegram (photo:<id>,
+    document:<id>) с SHA-256 содержимого. Папки media/ экспортов получают
+    жесткие ссылки на объекты, поэтому фото, стикеры и видео, встречающиеся
+    в разных чатах, хранятся на диске один раз и скачиваются один раз:
+    известный ключ материализуется ссылкой без обращения к сети. Разные
+    ключи с одинаковым содержимым тоже сводятся к одному объекту.
+
+    Для жестких ссылок хранилище должно быть на том же диске, что и
+    экспорты; иначе файлы копируются (трафик все равно не тратится).
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(os.path.join(root, OBJECTS_DIR), exist_ok=True)
+        self.log = JsonlLog(os.path.join(root, INDEX_FILE))
+        self.keys = {}
+        for entry in self.log.load():
+            self.keys[entry["key"]] = entry["sha256"]
+        self._locks = {}
+        self._index_lock = threading.Lock()
+
+    def sha256_for(self, message, thumbnail=False):
+        """SHA-256 содержимого медиа сообщения, если оно есть в хранилище."""
+        return self.keys.get(media_key(message, thumbnail))
+
+    def object_path(self, sha256):
+        return os.path.join(self.root, OBJECTS_DIR, sha256[:2], sha256)
+
+    def lookup(self, key):
+        """Путь к объекту для ключа или None, если его нет в хранилище."""
+        sha256 = self.keys.get(key)
+        if sha256 is None:
+            return None
+        path = self.object_path(sha256)
+        return path if os.path.exists(path) else None
+
+    def add(self, key, path, sha256=None):
+        """
+        Занести скачанный файл в хранилище. Если объект с таким содержимым
+        уже есть, файл заменяется ссылкой на него. Возвращает SHA-256.
+        """
+        if sha256 is None:
+            sha256 = file_sha256(path)
+        obj = self.object_path(sha256)
+        # add вызывается из потоков: объекты и индекс меняются под блокировкой
+        with self._index_lock:
+            if os.path.exists(obj):
+                link_or_copy(obj, path)
+            else:
+                os.makedirs(os.path.dirname(obj), exist_ok=True)
+                link_or_copy(path, obj)
+            if self.keys.get(key) != sha256:
+                self.log.append({"key": key, "sha256": sha256, "size": os.path.getsize(obj)})
+                self.keys[key] = sha256
+        return sha256
+
+    async def materialize(self, message, dest, download, thumbnail=False):
+        """
+        Получить файл медиа сообщения в dest.
+
+        Если ключ есть в хранилище, создается ссылка на объект; иначе
+        вызывается download() (корутина, True при успехе) и скачанный файл
+        заносится в хранилище. Одновременные запросы одного ключа ждут
+        друг друга, так что файл скачивается один раз. True при успехе.
+        """
+        key = media_key(message, thumbnail)
+        if key is None:
+            return await download()
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            obj = self.lookup(key)
+            if obj:
+                link_or_copy(obj, dest)
+                return True
+            if not await download():
+                return False
+            await asyncio.get_running_loop().run_in_executor(None, self.add, key, dest)
+            return True
+
+
+def open_media_store(path=None):
+    """Хранилище по пути из аргумента или MEDIA_STORE в .env; None, если не задано."""
+    path = path or config.MEDIA_STORE
+    return MediaStore(path) if path else None
@@ -0,0 +1,72 @@
+"""Ограничители скорости для запросов и трафика."""
+
+import time
+import asyncio
+
+
+class TokenBucket:
+    """
+    Асинхронный token bucket.
+
+    rate — сколько единиц (байт, запросов) восполняется в секунду,
+    capacity — максимальный «запас» для всплеска (по умолчанию равен rate).
+    Запросы больше capacity пропускаются, но уводят баланс в минус, и
+    следующие ожидающие компенсируют превышение.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount=1):
+        """Дождаться, пока в корзине хватит токенов, и списать amount."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self._refill()
+            need = min(amount, self.capacity)
+            if self._tokens < need:
+                await asyncio.sleep((need - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= amount
+
+    def pause(self, seconds):
+        """
+        Остановить всех потребителей на seconds секунд (например, при FLOOD_WAIT):
+        баланс уводится в минус, и acquire ждет, пока он восстановится.
+        """
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class FloodGate:
+    """
+    Общая пауза после FLOOD_WAIT для загрузчиков медиа.
+
+    Один экземпляр разделяют все MediaDownloader (в export-batch — все
+    источники): FLOOD_WAIT, полученный одним из них, останавливает загрузки
+    во всех, а не только в том, кому ответил сервер.
+    """
+
+    def __init__(self):
+        self._until = 0.0
+
+    def pause(self, seconds):
+        """Не начинать загрузки ближайшие seconds секунд."""
+        self._until = max(self._until, time.monotonic() + seconds)
+
+    async def wait(self):
+        """Дождаться конца паузы."""
+        while True:
+            delay = self._until - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
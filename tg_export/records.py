@@ -0,0 +1,106 @@
+"""Компактные записи сообщений для внутреннего конвейера экспорта."""
+
+
+class SenderTable:
+    """
+    Таблица интернированных профилей отправителей.
+
+    Один и тот же профиль (id, имя, фамилия, username, телефон) хранится
+    одним словарем, на который ссылаются все записи этого отправителя,
+    вместо копии в каждом сообщении. Если профиль менялся по ходу истории,
+    каждый вариант интернируется отдельно — вывод не меняется.
+    """
+
+    def __init__(self):
+        self._profiles = {}
+
+    def intern(self, sender_id, first_name, last_name, username, phone):
+        """Вернуть общий словарь профиля в формате serialize_message."""
+        key = (sender_id, first_name, last_name, username, phone)
+        profile = self._profiles.get(key)
+        if profile is None:
+            profile = {
+                "id": sender_id,
+                "first_name": first_name,
+                "last_name": last_name,
+                "username": username,
+                "phone": phone,
+            }
+            self._profiles[key] = profile
+        return profile
+
+    def __len__(self):
+        return len(self._profiles)
+
+
+class MessageRecord:
+    """
+    Сообщение в компактном виде: __slots__ вместо словаря, общий профиль
+    отправителя из SenderTable, реакции — пары (emoticon, count).
+
+    to_dict() восстанавливает словарь serialize_message с тем же порядком
+    ключей, to_row()/from_row() — позиционный список для дискового спула.
+    Профиль отправителя разделяется между записями и не должен изменяться.
+    """
+
+    __slots__ = (
+        "id", "date", "edit_date", "text", "message_type", "media_file", "topic_id",
+        "sender", "reply_to", "forward_from", "reactions", "views", "forwards", "post_author",
+    )
+
+    def __init__(self, id, date, edit_date, text, message_type, media_file, topic_id,
+                 sender, reply_to, forward_from, reactions, views, forwards, post_author):
+        self.id = id
+        self.date = date
+        self.edit_date = edit_date
+        self.text = text
+        self.message_type = message_type
+        self.media_file = media_file
+        self.topic_id = topic_id
+        self.sender = sender
+        self.reply_to = reply_to
+        self.forward_from = forward_from
+        self.reactions = reactions
+        self.views = views
+        self.forwards = forwards
+        self.post_author = post_author
+
+    def to_dict(self):
+        """Словарь в формате serialize_message."""
+        return {
+            "id": self.id,
+            "date": self.date,
+            "edit_date": self.edit_date,
+            "text": self.text,
+            "message_type": self.message_type,
+            "media_file": self.media_file,
+            "topic_id": self.topic_id,
+            "sender": self.sender,
+            "reply_to": self.reply_to,
+            "forward_from": self.forward_from,
+            "reactions": [{"emoticon": emoticon, "count": count} for emoticon, count in self.reactions],
+            "views": self.views,
+            "forwards": self.forwards,
+            "post_author": self.post_author,
+        }
+
+    def to_row(self):
+        """Позиционный JSON-совместимый список (профиль отправителя — тоже списком)."""
+        sender = self.sender
+        if sender is not None:
+            sender = [sender["id"], sender["first_name"], sender["last_name"],
+                      sender["username"], sender["phone"]]
+        return [
+            self.id, self.date, self.edit_date, self.text, self.message_type,
+            self.media_file, self.topic_id, sender, self.reply_to, self.forward_from,
+            self.reactions, self.views, self.forwards, self.post_author,
+        ]
+
+    @classmethod
+    def from_row(cls, row, senders):
+        """Восстановить запись из to_row(), интернируя отправителя в senders."""
+        row = list(row)
+        if row[7] is not None:
+            row[7] = senders.intern(*row[7])
+        row[10] = [tuple(reaction) for reaction in row[10]]
+        return cls(*row)
@@ -2,14 +2,20 @@
 
 from datetime import datetime
 
+# Версия JSON-экспорта: 1 — профиль отправителя в каждом сообщении,
+# 2 — общая таблица senders и sender_id в сообщениях
+JSON_FORMAT_VERSION = 2
+
 
 def get_export_info(data):
     """
     Извлечь метаданные из экспорта, независимо от формата.
 
     Поддерживает ключи: entity_info, chat_info, channel_info.
-    Возвращает словарь с полями: id, name, type, username, export_date.
+    Возвращает словарь с полями: id, name, type, username, export_date,
+    format_version (1 для экспортов без поля format_version).
     """
+    format_version = data.get("format_version", 1)
     for key in ("entity_info", "chat_info", "channel_info"):
         if key in data:
             info = data[key]
@@ -19,6 +25,7 @@ def get_export_info(data):
                 "type": info.get("type"),
                 "username": info.get("username"),
                 "export_date": info.get("export_date"),
+                "format_version": format_version,
                 "_original_key": key,
             }
 
@@ -28,6 +35,7 @@ def get_export_info(data):
         "type": None,
         "username": None,
         "export_date": None,
+        "format_version": format_version,
         "_original_key": None,
     }
 
@@ -43,14 +51,56 @@ def get_info_key(data):
 def make_entity_info(entity, extra=None):
     """Создать стандартный блок entity_info для нового экспорта."""
     from tg_export.utils import get_entity_name
+    from tg_export.entities import peer_info
 
     info = {
         "id": entity.id,
         "name": get_entity_name(entity),
         "type": type(entity).__name__,
         "username": getattr(entity, 'username', None),
+        "peer": peer_info(entity),
         "export_date": datetime.now().isoformat(),
     }
     if extra:
         info.update(extra)
     return info
+
+
+def get_senders(data):
+    """Таблица отправителей экспорта версии 2: {id: профиль}; пустая для версии 1."""
+    return {sender["id"]: sender for sender in data.get("senders") or []}
+
+
+def expand_message(msg, senders):
+    """
+    Сообщение в полном виде (версия 1): sender_id заменяется профилем
+    из таблицы senders на том же месте среди ключей. Сообщения версии 1
+    возвращаются как есть.
+    """
+    if "sender_id" not in msg or "sender" in msg:
+        return msg
+    expanded = {}
+    for key, value in msg.items():
+        if key == "sender_id":
+            expanded["sender"] = senders.get(value) if value is not None else None
+        else:
+            expanded[key] = value
+    return expanded
+
+
+def compact_message(msg, senders=None):
+    """
+    Сообщение в компактном виде (версия 2): профиль отправителя заменяется
+    на sender_id. Если передан словарь senders, профиль заносится в него.
+    """
+    if "sender" not in msg:
+        return msg
+    compacted = {}
+    for key, value in msg.items():
+        if key == "sender":
+            compacted["sender_id"] = value["id"] if value else None
+            if value and senders is not None:
+                senders[value["id"]] = value
+        else:
+            compacted[key] = value
+    return compacted
@@ -8,41 +8,36 @@ from telethon.tl.types import (
 )
 
 from tg_export.utils import sanitize_filename
+from tg_export.records import MessageRecord, SenderTable
 
 
-def serialize_message(message, media_file=None):
+def serialize_record(message, media_file=None, senders=None):
     """
-    Конвертировать сообщение Telethon в JSON-совместимый словарь.
+    Конвертировать сообщение Telethon в компактную запись MessageRecord.
 
-    Полный набор полей: id, date, edit_date, text, message_type, media_file,
-    topic_id, sender, reply_to, forward_from, reactions, views, forwards, post_author.
+    senders — общая SenderTable: профиль отправителя интернируется один раз
+    на все сообщения; без нее создается таблица на одну запись.
     """
-    msg_data = {
-        "id": message.id,
-        "date": message.date.isoformat() if message.date else None,
-        "edit_date": message.edit_date.isoformat() if message.edit_date else None,
-        "text": message.text or "",
-        "message_type": type(message.media).__name__ if message.media else "text",
-        "media_file": media_file,
-    }
+    if senders is None:
+        senders = SenderTable()
 
     # topic_id из reply_to (для форумов)
     if message.reply_to and hasattr(message.reply_to, 'forum_topic') and message.reply_to.forum_topic:
-        msg_data["topic_id"] = message.reply_to.reply_to_msg_id
+        topic_id = message.reply_to.reply_to_msg_id
     else:
-        msg_data["topic_id"] = None
+        topic_id = None
 
     # Отправитель
     if message.sender:
-        msg_data["sender"] = {
-            "id": message.sender_id,
-            "first_name": getattr(message.sender, 'first_name', None),
-            "last_name": getattr(message.sender, 'last_name', None),
-            "username": getattr(message.sender, 'username', None),
-            "phone": getattr(message.sender, 'phone', None),
-        }
+        sender = senders.intern(
+            message.sender_id,
+            getattr(message.sender, 'first_name', None),
+            getattr(message.sender, 'last_name', None),
+            getattr(message.sender, 'username', None),
+            getattr(message.sender, 'phone', None),
+        )
     else:
-        msg_data["sender"] = None
+        sender = None
 
     # Ответ на сообщение
     if message.reply_to:
@@ -51,9 +46,8 @@ def serialize_message(message, media_file=None):
             reply_data["top_id"] = message.reply_to.reply_to_top_id
         if hasattr(message.reply_to, 'forum_topic'):
             reply_data["forum_topic"] = message.reply_to.forum_topic
-        msg_data["reply_to"] = reply_data
     else:
-        msg_data["reply_to"] = None
+        reply_data = None
 
     # Пересылка
     if message.forward:
@@ -70,28 +64,44 @@ def serialize_message(message, media_file=None):
                 forward_data["from_id"] = None
         else:
             forward_data["from_id"] = None
-        msg_data["forward_from"] = forward_data
     else:
-        msg_data["forward_from"] = None
+        forward_data = None
 
     # Реакции
     if hasattr(message, 'reactions') and message.reactions:
-        msg_data["reactions"] = [
-            {
-                "emoticon": getattr(r.reaction, 'emoticon', None),
-                "count": r.count,
-            }
+        reactions = [
+            (getattr(r.reaction, 'emoticon', None), r.count)
             for r in message.reactions.results
         ]
     else:
-        msg_data["reactions"] = []
+        reactions = []
+
+    return MessageRecord(
+        id=message.id,
+        date=message.date.isoformat() if message.date else None,
+        edit_date=message.edit_date.isoformat() if message.edit_date else None,
+        text=message.text or "",
+        message_type=type(message.media).__name__ if message.media else "text",
+        media_file=media_file,
+        topic_id=topic_id,
+        sender=sender,
+        reply_to=reply_data,
+        forward_from=forward_data,
+        reactions=reactions,
+        views=message.views,
+        forwards=message.forwards,
+        post_author=message.post_author,
+    )
 
-    # Статистика
-    msg_data["views"] = message.views
-    msg_data["forwards"] = message.forwards
-    msg_data["post_author"] = message.post_author
 
-    return msg_data
+def serialize_message(message, media_file=None):
+    """
+    Конвертировать сообщение Telethon в JSON-совместимый словарь.
+
+    Полный набор полей: id, date, edit_date, text, message_type, media_file,
+    topic_id, sender, reply_to, forward_from, reactions, views, forwards, post_author.
+    """
+    return serialize_record(message, media_file).to_dict()
 
 
 def format_message_text(message):
@@ -132,10 +142,13 @@ def format_message_markdown(message, media_path=None):
     return "\n".join(lines)
 
 
-def get_media_filename(message):
-    """Сгенерировать имя файла для медиа."""
+def get_media_filename(message, thumbnail=False):
+    """Сгенерировать имя файла для медиа (thumbnail — для миниатюры, всегда JPEG)."""
     date_str = message.date.strftime("%Y%m%d_%H%M%S") if message.date else "unknown"
 
+    if thumbnail:
+        return f"{date_str}_{message.id}_thumb.jpg"
+
     if isinstance(message.media, MessageMediaPhoto):
         return f"{date_str}_{message.id}.jpg"
 
@@ -0,0 +1,324 @@
+"""Экспорт в SQLite: нормализованные таблицы и индексы для офлайн-запросов."""
+
+import sqlite3
+from datetime import datetime
+
+from tg_export import jsonio
+from tg_export.schemas import get_info_key
+
+SQLITE_FORMAT_VERSION = 1
+# Сколько сообщений вставлять в одной транзакции
+BATCH_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS senders (
+    id INTEGER PRIMARY KEY,
+    first_name TEXT,
+    last_name TEXT,
+    username TEXT,
+    phone TEXT
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    date TEXT,
+    edit_date TEXT,
+    text TEXT NOT NULL DEFAULT '',
+    message_type TEXT,
+    topic_id INTEGER,
+    sender_id INTEGER REFERENCES senders(id),
+    reply_to_message_id INTEGER,
+    reply_to TEXT,
+    forward_from TEXT,
+    views INTEGER,
+    forwards INTEGER,
+    post_author TEXT
+);
+CREATE TABLE IF NOT EXISTS reactions (
+    message_id INTEGER NOT NULL REFERENCES messages(id),
+    position INTEGER NOT NULL,
+    emoticon TEXT,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (message_id, position)
+);
+CREATE TABLE IF NOT EXISTS media (
+    message_id INTEGER PRIMARY KEY REFERENCES messages(id),
+    filename TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_date ON messages(date);
+CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages(sender_id);
+CREATE INDEX IF NOT EXISTS idx_messages_reply_to ON messages(reply_to_message_id);
+CREATE INDEX IF NOT EXISTS idx_messages_topic ON messages(topic_id);
+"""
+
+_SELECT_MESSAGES = """
+SELECT m.id, m.date, m.edit_date, m.text, m.message_type, md.filename, m.topic_id,
+       m.sender_id, s.first_name, s.last_name, s.username, s.phone,
+       m.reply_to, m.forward_from, m.views, m.forwards, m.post_author
+FROM messages m
+LEFT JOIN senders s ON s.id = m.sender_id
+LEFT JOIN media md ON md.message_id = m.id
+"""
+
+
+class SqliteExport:
+    """
+    Экспорт в SQLite-базе.
+
+    Сообщения, отправители, реакции и медиа лежат в отдельных таблицах с
+    индексами по id, date, sender_id, reply_to.message_id и topic_id, так что
+    выборки вида «сообщения пользователя X за март» или «сообщения с медиа»
+    не требуют разбора всего экспорта. Обновление идет через INSERT OR IGNORE
+    пачками по BATCH_SIZE сообщений в транзакции. Сообщения делятся на
+    диапазоны id (split/iter_range) для чтения в разных процессах.
+    """
+
+    format = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._header = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    @classmethod
+    def create(cls, path, header, messages):
+        """Записать новый экспорт в базу (существующие данные сохраняются)."""
+        store = cls(path)
+        store._insert(messages)
+        header = dict(header)
+        header['format'] = cls.format
+        header['format_version'] = SQLITE_FORMAT_VERSION
+        store._save_header(header)
+        return store
+
+    # --- заголовок ---
+
+    @property
+    def header(self):
+        if self._header is None:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'header'").fetchone()
+            self._header = jsonio.loads(row[0]) if row else {}
+            self._header['total_messages'] = self.count()
+        return self._header
+
+    @property
+    def info_key(self):
+        return get_info_key(self.header)
+
+    def _save_header(self, header):
+        header['total_messages'] = self.count()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('header', ?)",
+                (jsonio.dumps(header),),
+            )
+        self._header = header
+
+    # --- чтение ---
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def last_id(self):
+        return self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+
+    def position(self):
+        """Позиция для продолжения чтения; у SQLite ее заменяет индекс по id."""
+        return None
+
+    def split(self, parts, min_id=0, position=None):
+        """
+        Разбить сообщения с id > min_id на не больше parts диапазонов id
+        (min_id, max_id] примерно поровну — для iter_range в разных процессах.
+        """
+        total = self.conn.execute("SELECT COUNT(*) FROM messages WHERE id > ?", (min_id,)).fetchone()[0]
+        bounds = [min_id]
+        for k in range(1, parts):
+            row = self.conn.execute(
+                "SELECT id FROM messages WHERE id > ? ORDER BY id LIMIT 1 OFFSET ?",
+                (min_id, total * k // parts - 1),
+            ).fetchone()
+            if row is not None and row[0] > bounds[-1]:
+                bounds.append(row[0])
+        bounds.append(None)
+        return list(zip(bounds, bounds[1:]))
+
+    def iter_range(self, bounds, min_id=0):
+        """Сообщения диапазона id (low, high], полученного от split."""
+        low, high = bounds
+        return self.iter_messages(min_id=max(low, min_id), max_id=high)
+
+    def iter_messages(self, sender_id=None, since=None, until=None, min_id=None, max_id=None,
+                      position=None):
+        """
+        Сообщения в порядке id в формате serialize_message.
+
+        Необязательные фильтры используют индексы: sender_id, диапазон дат
+        [since, until) в ISO 8601, диапазон id (min_id, max_id]. position
+        принимается для совместимости с другими хранилищами: продолжение
+        идет по min_id.
+        """
+        where, params = [], []
+        if sender_id is not None:
+            where.append("m.sender_id = ?")
+            params.append(sender_id)
+        if since:
+            where.append("m.date >= ?")
+            params.append(since)
+        if until:
+            where.append("m.date < ?")
+            params.append(until)
+        if min_id is not None:
+            where.append("m.id > ?")
+            params.append(min_id)
+        if max_id is not None:
+            where.append("m.id <= ?")
+            params.append(max_id)
+        sql = _SELECT_MESSAGES
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY m.id"
+
+        # Реакции читаются вторым курсором в том же порядке id и сливаются
+        # с сообщениями, без отдельного запроса на каждое сообщение
+        reactions_where, reactions_params = [], []
+        if min_id is not None:
+            reactions_where.append("message_id > ?")
+            reactions_params.append(min_id)
+        if max_id is not None:
+            reactions_where.append("message_id <= ?")
+            reactions_params.append(max_id)
+        reactions_sql = "SELECT message_id, emoticon, count FROM reactions"
+        if reactions_where:
+            reactions_sql += " WHERE " + " AND ".join(reactions_where)
+        reactions_sql += " ORDER BY message_id, position"
+        reactions = self.conn.cursor().execute(reactions_sql, reactions_params)
+        pending = reactions.fetchone()
+
+        for row in self.conn.cursor().execute(sql, params):
+            msg_id = row[0]
+            msg_reactions = []
+            while pending is not None and pending[0] <= msg_id:
+                if pending[0] == msg_id:
+                    msg_reactions.append({"emoticon": pending[1], "count": pending[2]})
+                pending = reactions.fetchone()
+            yield self._row_to_message(row, msg_reactions)
+
+    def iter_media(self):
+        """Пары (message_id, filename) для сообщений с медиа-файлом."""
+        return iter(self.conn.execute("SELECT message_id, filename FROM media ORDER BY message_id"))
+
+    @staticmethod
+    def _row_to_message(row, reactions):
+        (msg_id, date, edit_date, text, message_type, media_file, topic_id,
+         sender_id, first_name, last_name, username, phone,
+         reply_to, forward_from, views, forwards, post_author) = row
+        sender = None
+        if sender_id is not None:
+            sender = {
+                "id": sender_id,
+                "first_name": first_name,
+                "last_name": last_name,
+                "username": username,
+                "phone": phone,
+            }
+        return {
+            "id": msg_id,
+            "date": date,
+            "edit_date": edit_date,
+            "text": text,
+            "message_type": message_type,
+            "media_file": media_file,
+            "topic_id": topic_id,
+            "sender": sender,
+            "reply_to": jsonio.loads(reply_to) if reply_to else None,
+            "forward_from": jsonio.loads(forward_from) if forward_from else None,
+            "reactions": reactions,
+            "views": views,
+            "forwards": forwards,
+            "post_author": post_author,
+        }
+
+    # --- запись ---
+
+    def _insert(self, messages):
+        """Вставить сообщения пачками; уже существующие id пропускаются."""
+        batch = []
+        for msg in messages:
+            batch.append(msg)
+            if len(batch) >= BATCH_SIZE:
+                self._insert_batch(batch)
+                batch = []
+        if batch:
+            self._insert_batch(batch)
+
+    def _insert_batch(self, batch):
+        senders, rows, reactions, media = {}, [], [], []
+        for msg in batch:
+            sender = msg.get('sender')
+            if sender:
+                senders[sender['id']] = (
+                    sender['id'], sender.get('first_name'), sender.get('last_name'),
+                    sender.get('username'), sender.get('phone'),
+                )
+            reply_to = msg.get('reply_to')
+            forward_from = msg.get('forward_from')
+            rows.append((
+                msg['id'], msg.get('date'), msg.get('edit_date'), msg.get('text') or "",
+                msg.get('message_type'), msg.get('topic_id'),
+                sender['id'] if sender else None,
+                reply_to.get('message_id') if reply_to else None,
+                jsonio.dumps(reply_to) if reply_to else None,
+                jsonio.dumps(forward_from) if forward_from else None,
+                msg.get('views'), msg.get('forwards'), msg.get('post_author'),
+            ))
+            for position, r in enumerate(msg.get('reactions') or []):
+                reactions.append((msg['id'], position, r.get('emoticon'), r.get('count', 1)))
+            if msg.get('media_file'):
+                media.append((msg['id'], msg['media_file']))
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO senders (id, first_name, last_name, username, phone) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET first_name = excluded.first_name, "
+                "last_name = excluded.last_name, username = excluded.username, phone = excluded.phone",
+                list(senders.values()),
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO messages (id, date, edit_date, text, message_type, topic_id, "
+                "sender_id, reply_to_message_id, reply_to, forward_from, views, forwards, post_author) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO reactions (message_id, position, emoticon, count) VALUES (?, ?, ?, ?)",
+                reactions,
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO media (message_id, filename) VALUES (?, ?)",
+                media,
+            )
+
+    def append(self, messages):
+        """Добавить новые сообщения и обновить метаданные."""
+        self._insert(messages)
+        header = dict(self.header)
+        info_key = get_info_key(header)
+        header[info_key]['export_date'] = datetime.now().isoformat()
+        header[info_key]['last_update'] = datetime.now().isoformat()
+        self._save_header(header)
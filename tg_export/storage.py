@@ -0,0 +1,535 @@
+"""Хранилища экспорта: единый JSON-файл, дописываемый JSONL с заголовком, SQLite."""
+
+import os
+import re
+import json
+import itertools
+from datetime import datetime
+
+from tg_export import jsonio
+from tg_export.schemas import get_info_key, get_senders, expand_message, compact_message
+from tg_export.writers import write_json_export
+
+JSONL_FORMAT_VERSION = 1
+
+
+def header_path_for(jsonl_path):
+    """Путь к заголовку для JSONL-экспорта: export_X.jsonl -> export_X.meta.json."""
+    return os.path.splitext(jsonl_path)[0] + ".meta.json"
+
+
+def _write_json_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        jsonio.dump(data, f, indent=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class _JsonStream:
+    """
+    Инкрементальный разбор JSON-документа вида {"key": value, ..., "messages": [...]}.
+
+    Файл читается блоками; значения верхнего уровня и элементы массива
+    messages декодируются по одному через JSONDecoder.raw_decode, поэтому
+    в памяти находится только текущий блок и текущее сообщение.
+
+    В компактных файлах (write_json_export(..., compact=True)) сообщение
+    занимает одну строку; с orjson/msgspec такая строка вырезается целиком
+    и разбирается jsonio.loads, что быстрее raw_decode. Первое сообщение,
+    которое не начинается с новой строки или не разбирается так, выключает
+    этот путь до конца массива: остальное идет через raw_decode.
+    """
+
+    _WS = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, f, chunk_size=1 << 20):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Символ перед текущей позицией сохраняется: по нему _line_object
+        # узнает начало строки
+        start = max(self.pos - 1, 0)
+        self.buf = self.buf[start:] + chunk
+        self.pos -= start
+        return True
+
+    def peek(self):
+        """Следующий значимый символ (без продвижения), None в конце файла."""
+        while True:
+            self.pos = self._WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return None
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Ожидался символ {char!r} в позиции {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Декодировать одно JSON-значение."""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # Число на границе блока может быть обрезано — дочитать и повторить
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+    def items(self):
+        """Пары (ключ, значение) корневого объекта; для messages значение — генератор."""
+        self.expect("{")
+        if self.peek() == "}":
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            if key == "messages" and self.peek() == "[":
+                yield key, self._array()
+            else:
+                yield key, self.value()
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("}")
+            return
+
+    def _line_object(self):
+        """Объект, занимающий строку целиком; None, если это не так."""
+        if not self.pos or self.buf[self.pos - 1] != "\n":
+            return None
+        newline = self.buf.find("\n", self.pos)
+        # Дочитать блок, только если строка оборвана концом небольшого
+        # остатка: однострочный файл не должен целиком попасть в буфер
+        if newline < 0 and len(self.buf) - self.pos < self.chunk_size and self._fill():
+            newline = self.buf.find("\n", self.pos)
+        if newline < 0:
+            return None
+        end = self.buf.rfind("}", self.pos, newline) + 1
+        if not end:
+            return None
+        try:
+            obj = jsonio.loads(self.buf[self.pos:end])
+        except ValueError:
+            return None
+        self.pos = end
+        return obj
+
+    def _array(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        fast = jsonio.BACKEND != "json"
+        while True:
+            obj = None
+            if fast and self.peek() == "{":
+                obj = self._line_object()
+                # Раскладка не построчная: не искать границы строк у каждого сообщения
+                fast = obj is not None
+            yield obj if obj is not None else self.value()
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+
+# Раскладки write_json_export (с отступами и --compact): строка, с которой
+# начинается массив messages, начало сообщения и конец массива. Строки JSON
+# не содержат переводов строк, поэтому сообщение — единственное, что
+# начинается с новой строки с таким отступом
+_JSON_LAYOUTS = (
+    (b'\n  "messages": [', b'\n    {', b'\n  ]'),
+    (b'\n"messages":[', b'\n{', b'\n]'),
+)
+# Блок чтения при поиске границ сообщений и разборе диапазона
+_RANGE_BLOCK = 4 << 20
+
+
+def _find(f, marker, start, end=None):
+    """Смещение первого marker в файле не раньше start (и не дальше end), иначе None."""
+    f.seek(start)
+    buf = b""
+    base = start
+    while True:
+        block = f.read(_RANGE_BLOCK)
+        if not block:
+            return None
+        buf += block
+        index = buf.find(marker)
+        if index >= 0:
+            found = base + index
+            return found if end is None or found < end else None
+        # Хвост блока может быть началом marker
+        keep = len(marker) - 1
+        base += len(buf) - keep
+        buf = buf[-keep:]
+        if end is not None and base >= end:
+            return None
+
+
+class JsonExport:
+    """
+    Классический экспорт: один JSON-документ с массивом messages.
+
+    Чтение потоковое (_JsonStream): заголовок — поля до messages, сообщения
+    отдаются по одному. Любое изменение требует полной перезаписи файла.
+
+    Файлы в раскладке write_json_export делятся на диапазоны байт по
+    границам сообщений (split/iter_range): analyze --workers читает и
+    разбирает каждый диапазон в своем процессе.
+
+    Версия 2 хранит профили отправителей один раз в таблице senders
+    заголовка, а в сообщениях — только sender_id; iter_messages
+    разворачивает их обратно, так что читатели видят формат версии 1.
+    """
+
+    format = "json"
+
+    def __init__(self, path):
+        self.path = path
+        self._header = None
+
+    def _scan(self, want_messages):
+        """Пройти по корневому объекту; отдать сообщения, если want_messages."""
+        header = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for key, value in _JsonStream(f).items():
+                if key != "messages":
+                    header[key] = value
+                    continue
+                if self._header is None:
+                    self._header = header
+                if not want_messages:
+                    return
+                for msg in value:
+                    yield msg
+                # Поля после messages тоже часть заголовка
+                header = self._header
+        if self._header is None:
+            self._header = header
+
+    @property
+    def header(self):
+        """Корневые поля экспорта без messages."""
+        if self._header is None:
+            for _ in self._scan(want_messages=False):
+                pass
+        return self._header
+
+    @property
+    def info_key(self):
+        return get_info_key(self.header)
+
+    def iter_messages(self, min_id=0, position=None):
+        """Сообщения с id > min_id (position не используется: файл читается целиком)."""
+        senders = get_senders(self.header)
+        for msg in self._scan(want_messages=True):
+            if msg['id'] > min_id:
+                yield expand_message(msg, senders)
+
+    def position(self):
+        """Позиция для продолжения чтения; у JSON ее нет."""
+        return None
+
+    def _messages_span(self):
+        """
+        (раскладка, начало, конец) массива messages в байтах для файлов в
+        раскладке write_json_export; None для других файлов.
+        """
+        layout = 1 if self.compact else 0
+        key, item, close = _JSON_LAYOUTS[layout]
+        with open(self.path, 'rb') as f:
+            start = _find(f, key, 0)
+            if start is None:
+                return None
+            start += len(key)
+            f.seek(start)
+            if f.read(len(item)) != item:
+                return None
+            # После массива — только закрывающая скобка корневого объекта
+            ending = close + b"\n}"
+            tail_start = max(start, f.seek(0, os.SEEK_END) - 64)
+            f.seek(tail_start)
+            tail = f.read().rstrip()
+            if not tail.endswith(ending):
+                return None
+            return layout, start, tail_start + len(tail) - len(ending)
+
+    def split(self, parts, min_id=0, position=None):
+        """
+        Разбить массив messages на не больше parts диапазонов байт по
+        границам сообщений (для iter_range); None, если файл не в раскладке
+        write_json_export.
+        """
+        span = self._messages_span()
+        if span is None:
+            return None
+        layout, start, end = span
+        item = _JSON_LAYOUTS[layout][1]
+        bounds = [start]
+        with open(self.path, 'rb') as f:
+            for k in range(1, parts):
+                offset = max(bounds[-1] + 1, start + (end - start) * k // parts)
+                found = _find(f, item, offset, end)
+                if found is None:
+                    break
+                bounds.append(found)
+        bounds.append(end)
+        return [(layout, a, b) for a, b in zip(bounds, bounds[1:])]
+
+    def iter_range(self, bounds, min_id=0):
+        """Сообщения с id > min_id из диапазона, полученного от split."""
+        layout, start, end = bounds
+        item = _JSON_LAYOUTS[layout][1]
+        senders = get_senders(self.header)
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start
+            buf = b""
+            while True:
+                block = f.read(min(_RANGE_BLOCK, remaining))
+                remaining -= len(block)
+                buf += block
+                # Разобрать целые сообщения одним вызовом, хвост — в следующий блок
+                cut = buf.rfind(item) if remaining > 0 else len(buf)
+                if cut > 0:
+                    for msg in jsonio.loads(b"[" + buf[:cut].rstrip(b", \t\r\n") + b"]"):
+                        if msg['id'] > min_id:
+                            yield expand_message(msg, senders)
+                    buf = buf[cut:]
+                if remaining <= 0:
+                    return
+
+    @property
+    def compact(self):
+        """Файл записан без отступов (write_json_export(..., compact=True))."""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return f.read(2) == '{\n' and f.read(1) == '"'
+
+    def count(self):
+        total = self.header.get('total_messages')
+        if total is None:
+            total = sum(1 for _ in self.iter_messages())
+        return total
+
+    def last_id(self):
+        return max((msg['id'] for msg in self.iter_messages()), default=0)
+
+    def iter_media(self):
+        """Пары (message_id, filename) для сообщений с медиа-файлом."""
+        for msg in self.iter_messages():
+            if msg.get('media_file'):
+                yield msg['id'], msg['media_file']
+
+    def append(self, messages):
+        """Дописать сообщения: файл потоково переписывается целиком в той же версии."""
+        messages = list(messages)
+        header = dict(self.header)
+        info_key = get_info_key(header)
+        header['total_messages'] = self.count() + len(messages)
+        header[info_key]['export_date'] = datetime.now().isoformat()
+        header[info_key]['last_update'] = datetime.now().isoformat()
+        if header.get('format_version', 1) >= 2:
+            # Новые отправители и свежие профили попадают в таблицу senders
+            senders = get_senders(header)
+            messages = [compact_message(msg, senders) for msg in messages]
+            header['senders'] = list(senders.values())
+            existing = self._scan(want_messages=True)
+        else:
+            existing = self.iter_messages()
+        write_json_export(self.path, header, itertools.chain(existing, messages), compact=self.compact)
+        self._header = header
+
+
+class JsonlExport:
+    """
+    Экспорт в JSONL: одно сообщение на строку плюс маленький заголовок
+    export_X.meta.json (entity_info, total_messages, last_id, размер данных).
+
+    Обновление дописывает новые строки в конец файла и атомарно заменяет
+    заголовок — стоимость пропорциональна числу новых сообщений. В заголовке
+    хранится размер зафиксированных данных: хвост, дописанный без
+    последующей фиксации заголовка (сбой посреди update), отбрасывается.
+    Данные делятся на диапазоны байт по границам строк (split/iter_range).
+    """
+
+    format = "jsonl"
+
+    def __init__(self, path):
+        self.path = path
+        self.header_path = header_path_for(path)
+        self._header = None
+
+    @classmethod
+    def create(cls, path, header, messages):
+        """Записать новый JSONL-экспорт из потока сообщений."""
+        store = cls(path)
+        tmp_path = path + ".tmp"
+        total = 0
+        last_id = 0
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for msg in messages:
+                f.write(jsonio.dumps(msg))
+                f.write("\n")
+                total += 1
+                last_id = max(last_id, msg['id'])
+        os.replace(tmp_path, path)
+
+        store._header = dict(header)
+        store._header.update({
+            'format': cls.format,
+            'format_version': JSONL_FORMAT_VERSION,
+            'total_messages': total,
+            'last_id': last_id,
+            'data_size': os.path.getsize(path),
+        })
+        _write_json_atomic(store.header_path, store._header)
+        return store
+
+    @property
+    def header(self):
+        if self._header is None:
+            with open(self.header_path, 'r', encoding='utf-8') as f:
+                self._header = jsonio.load(f)
+        return self._header
+
+    @property
+    def info_key(self):
+        return get_info_key(self.header)
+
+    def _committed_size(self):
+        return self.header.get('data_size', os.path.getsize(self.path))
+
+    def iter_messages(self, min_id=0, position=None):
+        """
+        Сообщения с id > min_id. position — смещение в байтах, полученное
+        от position() раньше: строки до него пропускаются без разбора.
+        """
+        committed = self._committed_size()
+        if position is None or position > committed:
+            position = 0
+        return self.iter_range((position, committed), min_id)
+
+    def split(self, parts, min_id=0, position=None):
+        """
+        Разбить зафиксированные данные (с position) на не больше parts
+        диапазонов байт по границам строк — для iter_range в разных процессах.
+        """
+        committed = self._committed_size()
+        if position is None or position > committed:
+            position = 0
+        bounds = [position]
+        with open(self.path, 'rb') as f:
+            for k in range(1, parts):
+                offset = position + (committed - position) * k // parts
+                if offset <= bounds[-1]:
+                    continue
+                # Граница — начало следующей строки после offset - 1
+                f.seek(offset - 1)
+                f.readline()
+                offset = f.tell()
+                if offset >= committed:
+                    break
+                if offset > bounds[-1]:
+                    bounds.append(offset)
+        bounds.append(committed)
+        return list(zip(bounds, bounds[1:]))
+
+    def iter_range(self, bounds, min_id=0):
+        """Сообщения с id > min_id из диапазона байт [start, end), полученного от split."""
+        start, end = bounds
+        remaining = end - start
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            for line in f:
+                remaining -= len(line)
+                if remaining < 0:
+                    break
+                if line.strip():
+                    msg = jsonio.loads(line)
+                    if msg['id'] > min_id:
+                        yield msg
+
+    def position(self):
+        """Размер зафиксированных данных: с него начинаются будущие дописывания."""
+        return self._committed_size()
+
+    def count(self):
+        return self.header.get('total_messages', 0)
+
+    def last_id(self):
+        return self.header.get('last_id', 0)
+
+    def iter_media(self):
+        """Пары (message_id, filename) для сообщений с медиа-файлом."""
+        for msg in self.iter_messages():
+            if msg.get('media_file'):
+                yield msg['id'], msg['media_file']
+
+    def append(self, messages):
+        """Дописать сообщения в конец файла и обновить заголовок."""
+        header = self.header
+        total = header.get('total_messages', 0)
+        last_id = header.get('last_id', 0)
+
+        with open(self.path, 'r+b') as f:
+            # Отбросить незафиксированный хвост прошлого сбоя
+            f.truncate(self._committed_size())
+            f.seek(0, os.SEEK_END)
+            for msg in messages:
+                f.write(jsonio.dumpb(msg))
+                f.write(b"\n")
+                total += 1
+                last_id = max(last_id, msg['id'])
+            f.flush()
+            os.fsync(f.fileno())
+            data_size = f.tell()
+
+        info_key = get_info_key(header)
+        header[info_key]['export_date'] = datetime.now().isoformat()
+        header[info_key]['last_update'] = datetime.now().isoformat()
+        header['total_messages'] = total
+        header['last_id'] = last_id
+        header['data_size'] = data_size
+        _write_json_atomic(self.header_path, header)
+
+
+def open_export(path):
+    """Открыть экспорт подходящим хранилищем по расширению файла."""
+    if path.endswith(".sqlite") or path.endswith(".db"):
+        from tg_export.sqlite_storage import SqliteExport
+        return SqliteExport(path)
+    if path.endswith(".jsonl") or path.endswith(".meta.json"):
+        if path.endswith(".meta.json"):
+            path = path[:-len(".meta.json")] + ".jsonl"
+        return JsonlExport(path)
+    return JsonExport(path)
+
+
+def derived_path(path, suffix):
+    """Путь к производному файлу: export_X.json -> export_X{suffix}."""
+    if path.endswith(".meta.json"):
+        path = path[:-len(".meta.json")]
+    return os.path.splitext(path)[0] + suffix
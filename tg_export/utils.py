@@ -1,6 +1,8 @@
 """Утилиты: парсинг источников, имена файлов, имена сущностей."""
 
 import re
+from datetime import datetime, timezone
+
 from telethon.tl.types import User, Chat, Channel
 
 
@@ -52,6 +54,22 @@ def parse_source(source):
     return source, "username", None
 
 
+def parse_day(value):
+    """Дата YYYY-MM-DD -> datetime полночь UTC; None для пустого значения."""
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+
+def parse_size(value):
+    """Размер из строки: 500, 200K, 50M, 1.5G (двоичные единицы) -> байты."""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*', str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Некорректный размер: {value!r}")
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** " KMGT".index(unit.upper() or " "))
+
+
 def sanitize_filename(name):
     """Привести имя к безопасному имени файла."""
     safe_name = re.sub(r'[<>:"/\\|?*]', '_', name)
@@ -0,0 +1,164 @@
+"""Потоковая запись экспорта: дисковый спул сообщений и JSON-писатель."""
+
+import os
+import heapq
+import shutil
+import tempfile
+
+from tg_export import jsonio
+
+# Сколько записей держать в памяти до сброса прогона на диск
+SPOOL_CHUNK_SIZE = 10000
+# Сколько прогонов сливать за раз (ограничение открытых файлов)
+SPOOL_MAX_RUNS = 64
+
+
+def _encode_record(obj):
+    """Кодирование компактных записей (MessageRecord) в прогоне спула."""
+    if hasattr(obj, "to_row"):
+        return obj.to_row()
+    raise TypeError(f"Объект {type(obj).__name__} не сериализуется в JSON")
+
+
+class MessageSpool:
+    """
+    Внешняя сортировка записей по id сообщения.
+
+    Записи копятся в буфере до chunk_size, затем сортируются и сбрасываются
+    на диск отдельным прогоном (JSONL). При чтении прогоны сливаются через
+    heapq.merge, поэтому в памяти одновременно находится не больше одного
+    буфера и по одной записи на прогон — независимо от размера чата.
+
+    Прогоны можно передать в конструктор (runs, count), чтобы продолжить
+    спул прерванного экспорта. Записи с методом to_row() (MessageRecord)
+    хранятся в буфере как есть и пишутся на диск позиционным списком;
+    при чтении возвращается этот список.
+    """
+
+    def __init__(self, directory=None, chunk_size=SPOOL_CHUNK_SIZE, runs=None, count=0):
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix="tg_export_spool_")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.runs = list(runs or [])
+        self.count = count
+        self._buffer = []
+        self._obsolete = []
+        self._run_seq = 0
+
+    def add(self, msg_id, record):
+        """Добавить запись (JSON-совместимое значение или MessageRecord)."""
+        self._buffer.append((msg_id, record))
+        self.count += 1
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    @property
+    def buffered(self):
+        """Сколько записей еще не сброшено на диск."""
+        return len(self._buffer)
+
+    def flush(self):
+        """Сбросить буфер на диск отсортированным прогоном."""
+        if not self._buffer:
+            return
+        # Слитые прогоны удаляются только к следующему сбросу: к этому моменту
+        # журнал (если он ведется) уже ссылается на новый прогон
+        for path in self._obsolete:
+            os.remove(path)
+        self._obsolete = []
+        self._buffer.sort(key=lambda item: item[0])
+        self.runs.append(self._write_run(self._buffer))
+        self._buffer = []
+        if len(self.runs) >= SPOOL_MAX_RUNS:
+            self._compact()
+
+    def _write_run(self, items):
+        path = os.path.join(self.directory, f"run_{self._run_seq:06d}.jsonl")
+        while os.path.exists(path):
+            self._run_seq += 1
+            path = os.path.join(self.directory, f"run_{self._run_seq:06d}.jsonl")
+        self._run_seq += 1
+        with open(path, 'w', encoding='utf-8') as f:
+            for msg_id, record in items:
+                f.write(jsonio.dumps([msg_id, record], default=_encode_record))
+                f.write("\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return path
+
+    def _compact(self):
+        """Слить все прогоны в один, чтобы не упереться в лимит файлов."""
+        merged = self._write_run(self._merge(self.runs))
+        self._obsolete.extend(self.runs)
+        self.runs = [merged]
+
+    @staticmethod
+    def _merge(paths):
+        files = [open(path, 'r', encoding='utf-8') for path in paths]
+        try:
+            streams = [(jsonio.loads(line) for line in f) for f in files]
+            last_id = None
+            for msg_id, record in heapq.merge(*streams, key=lambda item: item[0]):
+                # Дубликаты (повторная загрузка того же id) схлопываются
+                if msg_id == last_id:
+                    continue
+                last_id = msg_id
+                yield msg_id, record
+        finally:
+            for f in files:
+                f.close()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """Записи в порядке возрастания id."""
+        self.flush()
+        for _, record in self._merge(self.runs):
+            yield record
+
+    def cleanup(self):
+        """Удалить временные файлы спула."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _dumps_indented(obj, level):
+    """JSON с отступом 2, сдвинутый на level уровней вложенности."""
+    text = jsonio.dumps(obj, indent=True)
+    return text.replace("\n", "\n" + "  " * level)
+
+
+def write_json_export(path, header, messages, compact=False):
+    """
+    Потоково записать JSON-экспорт.
+
+    header — поля корневого объекта до "messages" (entity_info, total_messages, ...).
+    messages — итерируемый источник словарей сообщений.
+    Результат совпадает с json.dump(..., ensure_ascii=False, indent=2).
+    compact — без отступов: каждое поле заголовка и каждое сообщение на
+    своей строке (файл меньше, а потоковое чтение остается построчным).
+    """
+    if compact:
+        field = lambda key, value: f"{jsonio.dumps(key)}:{jsonio.dumps(value)}"
+        item, messages_key, item_sep, close = jsonio.dumps, '"messages":[', "\n", "\n]\n}"
+    else:
+        field = lambda key, value: f"  {jsonio.dumps(key)}: {_dumps_indented(value, 1)}"
+        item = lambda msg: _dumps_indented(msg, 2)
+        messages_key, item_sep, close = '  "messages": [', "\n    ", "\n  ]\n}"
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("{\n")
+        for key, value in header.items():
+            f.write(field(key, value) + ",\n")
+        f.write(messages_key)
+        empty = True
+        for msg in messages:
+            f.write(item_sep if empty else "," + item_sep)
+            f.write(item(msg))
+            empty = False
+        f.write("]\n}" if empty else close)
+    os.replace(tmp_path, path)
+    return path